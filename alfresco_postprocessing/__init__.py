@@ -7,13 +7,35 @@ from alfresco_postprocessing.dataset import *
 from alfresco_postprocessing.metrics import *
 from alfresco_postprocessing.postprocess import *
 from alfresco_postprocessing.plot import *
+from alfresco_postprocessing.plotjobs import *
+from alfresco_postprocessing.profiling import *
+from alfresco_postprocessing.cube import *
+from alfresco_postprocessing.export import *
+from alfresco_postprocessing.jsonstream import *
+from alfresco_postprocessing.executor import *
+from alfresco_postprocessing.workqueue import *
+from alfresco_postprocessing.slurm import *
+from alfresco_postprocessing.planner import *
+from alfresco_postprocessing.prefetch import *
+from alfresco_postprocessing.firetable import *
+from alfresco_postprocessing.firesizes import *
+from alfresco_postprocessing.rollup import *
+from alfresco_postprocessing.ensemble import *
+from alfresco_postprocessing.vegratios import *
+from alfresco_postprocessing.reducers import *
+from alfresco_postprocessing.reclass import *
 import alfresco_postprocessing as ap
 
-# other libs (external and stdlib)
-import os, glob, rasterio, ujson
+# other libs (external and stdlib) -- keep heavy optional libs (matplotlib, seaborn,
+# geopandas, scipy, pandas) out of here. they are imported where they are used so
+# that spawned pool workers importing the package start quickly.
+import os, glob, logging, rasterio
 import numpy as np
 from functools import partial
 
+# the plans of ncores='auto' runs are logged at INFO
+_log = logging.getLogger( __name__ )
+
 
 # # VEGETATION MAP DEFAULT:
 veg_name_dict = {1:'Black Spruce',
@@ -91,7 +113,7 @@ def _open_tinydb( out_json_fn ):
 		os.unlink( out_json_fn )
 	return TinyDB( out_json_fn )
 
-def _run_historical( fn, sub_domains=None, *args, **kwargs ):
+def _run_historical( fn, sub_domains=None, fire_table=False, *args, **kwargs ):
 	'''
 	a quick and dirty method of performing the historical observed
 	burned boolean raster GTiffs used as inputs to the ALFRESCO Fire
@@ -103,6 +125,8 @@ def _run_historical( fn, sub_domains=None, *args, **kwargs ):
 		to ALFRESCO.
 	sub_domains = an object of one of three types for different scenarios. 
 		typically this is created with read_subdomains
+	fire_table = [bool] if True return the per-fire rows under the `_fires` key.
+		default:False
 
 	Returns:
 	--------
@@ -120,88 +144,269 @@ def _run_historical( fn, sub_domains=None, *args, **kwargs ):
 					avg_fire_size=fire.avg_fire_size,
 					number_of_fires=fire.number_of_fires,
 					total_area_burned=fire.total_area_burned )
+	if fire_table:
+		out_dd.update( _fires=_fire_rows( ds_fs, fire ) )
 	return out_dd
 
-def _run_timestep( timestep, sub_domains, veg_name_dict, *args, **kwargs ):
-	'''
-	workhorse function that takes a dict of style {variable_name:path_to_file.tif}
-	for all files in a single timestep that are to be used in calculation.
-
-	This is where we would add new things to be added into the output JSON, like
-	new classes for working with Age, Burn Severity, or interactions to name a 
-	few.
+def _fire_rows( ds_fs, fire ):
+	''' per-fire columns of a timestep, labeled for FireTable.from_timesteps '''
+	return dict( fire.fires, replicate=ds_fs.replicate, year=int( ds_fs.year ) )
 
-	Arguments:
-	----------
-	timestep = [alfresco_postprocessing.TimeStep] timestep object with 
-	timestep_fn_dict = [dict] dictionary that stores the filenames for all variables
-		in a given timestep. In {variable_name:filename_string} pairs
-	sub_domains = [alfresco_postprocessing.SubDomains] subdomains object as read using
-		ap.read_subdomains( ) to return a common data type for all different flavors 
-		of inputs used as subdomains.
+def _collect_fire_table( out, fire_table_fn=None, store_fire_sizes=True ):
+	'''
+	pop the per-fire rows off of the output records, write them as a FireTable to
+	`fire_table_fn` and drop `all_fire_sizes` from the records if not wanted.
+	'''
+	fires = [ rec.pop( '_fires', None ) for rec in out ]
+	if fire_table_fn is not None:
+		FireTable.from_timesteps( fires ).save( fire_table_fn )
+	if not store_fire_sizes:
+		for rec in out:
+			rec.pop( 'all_fire_sizes', None )
+	return out
+
+def _open_timestep( timestep, sub_domains, prof=None, fire_table=False, veg_transitions=False ):
+	'''
+	read the rasters of a single timestep needed by `_compute_timestep`. This is the
+	I/O half of `_run_timestep` and is what gets prefetched in `_run_timesteps`.
+	add more reads here and then use them in `_compute_timestep`.
 
 	Returns:
 	--------
-	dict with keys for each metric, replicate, and year with values that are returned
-	for each.  Subdomains are contained nested within these key:value pairs.
+	dict of {variable_name:AlfrescoDataset}
 
 	'''
-	# open the data we need -- add more reads here and then add in the
-	# class instantiation with them below
-	ds_fs = ap.open( timestep.FireScar.fn, sub_domains=sub_domains )
-	ds_veg = ap.open( timestep.Veg.fn, sub_domains=sub_domains )
-	# ds_age = ap.open( timestep.Age.fn, sub_domains=sub_domains )
-	ds_burnseverity = ap.open( timestep.BurnSeverity.fn, sub_domains=sub_domains )
-	
+	if prof is None:
+		prof = NullProfile()
+	datasets = {}
+	with prof.stage( 'read_firescar', fn=timestep.FireScar.fn ):
+		datasets[ 'FireScar' ] = ap.open( timestep.FireScar.fn, sub_domains=sub_domains )
+	with prof.stage( 'read_veg', fn=timestep.Veg.fn ):
+		datasets[ 'Veg' ] = ap.open( timestep.Veg.fn, sub_domains=sub_domains )
+	# datasets[ 'Age' ] = ap.open( timestep.Age.fn, sub_domains=sub_domains )
+	with prof.stage( 'read_burnseverity', fn=timestep.BurnSeverity.fn ):
+		datasets[ 'BurnSeverity' ] = ap.open( timestep.BurnSeverity.fn, sub_domains=sub_domains )
+	if fire_table or veg_transitions:
+		# the vegetation the year before ( what burned / what it changed from ).
+		# missing for the first year.
+		lag_fn = datasets[ 'Veg' ].veglag
+		with prof.stage( 'read_veglag', fn=lag_fn ):
+			datasets[ 'VegLag' ] = None
+			if os.path.exists( lag_fn ):
+				with rasterio.open( lag_fn ) as rst:
+					datasets[ 'VegLag' ] = rst.read( 1 )
+	return datasets
+
+def _compute_timestep( datasets, veg_name_dict, prof=None, fire_table=False, veg_transitions=False ):
+	'''
+	compute the metrics for a single timestep from the datasets read with
+	`_open_timestep`. This is where we would add new things to be added into the
+	output JSON, like new classes for working with Age, Burn Severity, or
+	interactions to name a few.
+	'''
+	if prof is None:
+		prof = NullProfile()
+	ds_fs = datasets[ 'FireScar' ]
+	ds_veg = datasets[ 'Veg' ]
+	ds_burnseverity = datasets[ 'BurnSeverity' ]
+
 	out_dd = {}
 	# fire 
-	fire = Fire( ds_fs )
+	with prof.stage( 'fire' ):
+		if fire_table:
+			veg_arr = datasets.get( 'VegLag' )
+			if veg_arr is None:
+				veg_arr = np.full( ds_fs.raster_arr.shape, VEG_NODATA, dtype=np.uint8 )
+			fire = Fire( ds_fs, veg_arr=veg_arr, severity_arr=ds_burnseverity.raster_arr )
+		else:
+			fire = Fire( ds_fs )
 	out_dd.update( replicate=ds_fs.replicate,
 					fire_year=ds_fs.year,
 					all_fire_sizes=fire.all_fire_sizes,
 					avg_fire_size=fire.avg_fire_size,
 					number_of_fires=fire.number_of_fires,
 					total_area_burned=fire.total_area_burned )
+	if fire_table:
+		out_dd.update( _fires=_fire_rows( ds_fs, fire ) )
 	# veg
-	veg = Veg( ds_veg, veg_name_dict )
+	with prof.stage( 'veg' ):
+		veg = Veg( ds_veg, veg_name_dict )
 	out_dd.update( av_year=ds_veg.year, veg_counts=veg.veg_counts )
+	if veg_transitions:
+		with prof.stage( 'veg_transitions' ):
+			transition = VegTransition( ds_veg, lag_arr=datasets.get( 'VegLag' ) )
+		out_dd.update( veg_transitions=transition.transitions )
 
 	# age -- not yet implemented
 	# age = Age()
 
-	burnseverity = BurnSeverity( ds_burnseverity )
+	with prof.stage( 'burnseverity' ):
+		burnseverity = BurnSeverity( ds_burnseverity )
 	out_dd.update( severity_counts=burnseverity.severity_counts )
+
+	if not isinstance( prof, NullProfile ):
+		# cost of sending the record back to the parent process
+		import pickle
+		with prof.stage( 'pickle' ):
+			prof.result_bytes = len( pickle.dumps( out_dd, protocol=pickle.HIGHEST_PROTOCOL ) )
+		out_dd.update( _profile=prof.to_dict() )
 	return out_dd
 
-def _get_stats( timesteps, db, sub_domains, ncores, veg_name_dict ):
-	from tinydb import TinyDB
-	import multiprocessing
-	from functools import partial
-	
-	# instantiate a pool of workers
-	pool = multiprocessing.Pool( processes=ncores, maxtasksperchild=4 )
+def _timestep_profile( timestep, profile=False ):
+	if profile:
+		return TimestepProfile( replicate=timestep.replicate, year=timestep.FireScar.year )
+	return NullProfile()
+
+def _run_timestep( timestep, sub_domains, veg_name_dict, profile=False, fire_table=False, veg_transitions=False, *args, **kwargs ):
+	'''
+	workhorse function that takes a dict of style {variable_name:path_to_file.tif}
+	for all files in a single timestep that are to be used in calculation.
 
-	# run parallel map using multiprocessing 
-	f = partial( _run_timestep, sub_domains=sub_domains, veg_name_dict=veg_name_dict )
-	out = pool.map( f, timesteps )
-	pool.close()
+	Arguments:
+	----------
+	timestep = [alfresco_postprocessing.TimeStep] timestep object with 
+	timestep_fn_dict = [dict] dictionary that stores the filenames for all variables
+		in a given timestep. In {variable_name:filename_string} pairs
+	sub_domains = [alfresco_postprocessing.SubDomains] subdomains object as read using
+		ap.read_subdomains( ) to return a common data type for all different flavors 
+		of inputs used as subdomains.
+	profile = [bool] if True record per-stage wall time, bytes read and RSS change for
+		this timestep and return it in the output dict under the `_profile` key.
+		default:False
+	fire_table = [bool] if True also read the previous years Veg and return the
+		per-fire rows ( see FireTable ) under the `_fires` key. default:False
+	veg_transitions = [bool] if True add the veg t-1 -> veg t transition counts per
+		domain ( see VegTransition ) under the `veg_transitions` key. default:False
+
+	Returns:
+	--------
+	dict with keys for each metric, replicate, and year with values that are returned
+	for each.  Subdomains are contained nested within these key:value pairs.
+
+	'''
+	prof = _timestep_profile( timestep, profile )
+	datasets = _open_timestep( timestep, sub_domains, prof, fire_table=fire_table, veg_transitions=veg_transitions )
+	return _compute_timestep( datasets, veg_name_dict, prof, fire_table=fire_table, veg_transitions=veg_transitions )
+
+def _run_timesteps( timesteps, sub_domains, veg_name_dict, profile=False, prefetch=2, nthreads=2, fire_table=False, veg_transitions=False, \
+	on_timestep=None, *args, **kwargs ):
+	'''
+	run a chunk of timesteps in one worker, reading the rasters of the next
+	`prefetch` timesteps on `nthreads` threads while the current one is computed.
+	`on_timestep`, if given, is called with no arguments after each timestep.
+
+	Returns:
+	--------
+	tuple of ( list of output dicts as returned by `_run_timestep`, dict of
+	Prefetcher.stats for the chunk )
+
+	'''
+	def read( timestep ):
+		prof = _timestep_profile( timestep, profile )
+		return prof, _open_timestep( timestep, sub_domains, prof, fire_table=fire_table, veg_transitions=veg_transitions )
+
+	prefetcher = Prefetcher( timesteps, read, depth=prefetch, nthreads=nthreads )
+	out = []
+	for timestep, ( prof, datasets ) in prefetcher:
+		out.append( _compute_timestep( datasets, veg_name_dict, prof, fire_table=fire_table, veg_transitions=veg_transitions ) )
+		if on_timestep is not None:
+			on_timestep()
+	return out, prefetcher.stats()
+
+def _chunk( items, nchunks ):
+	''' split items into at most nchunks contiguous lists of near equal length '''
+	items = list( items )
+	nchunks = max( min( nchunks, len( items ) ), 1 )
+	size, extra = divmod( len( items ), nchunks )
+	chunks, start = [], 0
+	for i in range( nchunks ):
+		stop = start + size + ( 1 if i < extra else 0 )
+		chunks.append( items[ start:stop ] )
+		start = stop
+	return chunks
+
+def _get_stats( timesteps, db, sub_domains, ncores, veg_name_dict, profile_fn=None, trace_fn=None, executor=None, chunksize=None, \
+	prefetch=0, prefetch_threads=2, fire_table_fn=None, store_fire_sizes=True, veg_transitions=False ):
+	import time
+	
+	profile = profile_fn is not None
+	fire_table = fire_table_fn is not None
+	# use the callers persistent pool if given, otherwise a temporary one for this run
+	own_executor = executor is None
+	if own_executor:
+		executor = Executor( ncores=ncores, chunksize=chunksize )
+
+	# run parallel map -- sub_domains are sent to each worker once, not with every timestep
+	state = { 'sub_domains':sub_domains, 'veg_name_dict':veg_name_dict }
+	prefetch_stats = None
+	tic = time.time()
+	try:
+		if prefetch > 0:
+			# prefetching works within a task, so hand each worker runs of consecutive
+			# timesteps. a few tasks per worker keeps the load balanced.
+			nchunks = executor.ncores * 2
+			if chunksize is not None:
+				nchunks = -( -len( timesteps ) // chunksize )
+			f = partial( _run_timesteps, profile=profile, prefetch=prefetch, nthreads=prefetch_threads, fire_table=fire_table, \
+						veg_transitions=veg_transitions )
+			chunked = executor.map( f, _chunk( timesteps, nchunks ), state=state, chunksize=1 )
+			out = [ rec for recs, stats in chunked for rec in recs ]
+			prefetch_stats = merge_prefetch_stats([ stats for recs, stats in chunked ])
+			del chunked
+		else:
+			f = partial( _run_timestep, profile=profile, fire_table=fire_table, veg_transitions=veg_transitions )
+			out = executor.map( f, timesteps, state=state, chunksize=chunksize )
+	finally:
+		if own_executor:
+			executor.close()
+	map_time = time.time() - tic
+
+	out = _collect_fire_table( out, fire_table_fn, store_fire_sizes )
+	profiles = [ rec.pop( '_profile', None ) for rec in out ]
+	tic = time.time()
 	db.insert_multiple( out )
+	insert_time = time.time() - tic
 	del out
+
+	if profile:
+		extra = { 'ncores':executor.ncores, 'pool_map':map_time, 'db_insert':insert_time }
+		if prefetch_stats is not None:
+			extra.update( prefetch=prefetch_stats )
+		_ = write_profile_report( profiles, profile_fn, trace_fn=trace_fn, extra=extra )
 	return db
 
-def run_postprocessing_historical( maps_path, out_json_fn, ncores, veg_name_dict, subdomains_fn=None, id_field=None, name_field=None, background_value=0 ):
+def run_postprocessing_historical( maps_path, out_json_fn, ncores, veg_name_dict, subdomains_fn=None, id_field=None, name_field=None, background_value=0, \
+	executor=None, chunksize=None, fire_table_fn=None, store_fire_sizes=True ):
+	'''
+	run the post processing over the observed FireHistory rasters in `maps_path`
+	and store the results in a TinyDB at `out_json_fn`.
+
+	Pass an `executor` ( alfresco_postprocessing.Executor ) to reuse its worker
+	processes, otherwise a pool of `ncores` workers is started for this run.
+	`fire_table_fn` and `store_fire_sizes` are as in `run_postprocessing`, as is
+	`ncores='auto'`.
+	'''
 	import glob, os
-	import multiprocessing
 	file_list = glob.glob( os.path.join( maps_path, '*.tif' ) )
 	db = _open_tinydb( out_json_fn )
 	rst = rasterio.open( file_list[0] )
 	sub_domains = read_subdomains( subdomains_fn=subdomains_fn, rasterio_raster=rst, id_field=id_field, name_field=name_field, background_value=0 )
-
-	pool = multiprocessing.Pool( processes=ncores, maxtasksperchild=4 )
-	# run parallel map using multiprocessing 
-	f = partial( _run_historical, sub_domains=sub_domains, veg_name_dict=veg_name_dict )
-	out = pool.map( f, file_list )
-	pool.close()
+	if ncores == 'auto' and executor is None:
+		plan = plan_run( raster_fn=file_list[0], sub_domains=sub_domains, ntimesteps=len( file_list ), \
+						fire_table=fire_table_fn is not None, prefetch=0 )
+		_log.info( plan.report() )
+		ncores, chunksize = plan.ncores, chunksize or plan.chunksize
+
+	own_executor = executor is None
+	if own_executor:
+		executor = Executor( ncores=ncores, chunksize=chunksize )
+	try:
+		f = partial( _run_historical, fire_table=fire_table_fn is not None )
+		out = executor.map( f, file_list, state={ 'sub_domains':sub_domains }, chunksize=chunksize )
+	finally:
+		if own_executor:
+			executor.close()
+	out = _collect_fire_table( out, fire_table_fn, store_fire_sizes )
 	db.insert_multiple( out )
 	del out
 	return db
@@ -209,7 +414,49 @@ def run_postprocessing_historical( maps_path, out_json_fn, ncores, veg_name_dict
 # THIS FUNCTION NEEDS CHANGING SINCE WE NO LONGER USE THE NAME PostProcess, nor do we access the raster file in that same way.
 # IT IS BETTER SUITED TO BEING PULLED FROM THE FIRST OF THE TimeStep objects.
 def run_postprocessing( maps_path, out_json_fn, ncores, veg_name_dict, subdomains_fn=None, \
-	id_field=None, name_field=None, background_value=0, lagfire=False ): # background value is problematic
+	id_field=None, name_field=None, background_value=0, lagfire=False, profile=False, trace=False, \
+	executor=None, chunksize=None, prefetch=0, prefetch_threads=2, fire_table_fn=None, store_fire_sizes=True, \
+	veg_transitions=False, ensemble_fn=None, ensemble_quantiles=DEFAULT_QUANTILES ): # background value is problematic
+	'''
+	run the post processing over all timesteps in `maps_path` and store the
+	results in a TinyDB at `out_json_fn`.
+
+	Pass an `executor` ( alfresco_postprocessing.Executor ) to reuse its worker
+	processes across runs, otherwise a pool of `ncores` workers is started and
+	shut down for this run. `chunksize` sets how many timesteps are sent to a
+	worker at a time.
+
+	With `ncores='auto'` the number of workers is chosen by `plan_run` from the
+	raster size, the number of sub-domains and timesteps and the memory and cpus
+	available ( the slurm allocation when run as a job ). `chunksize` ( if None ) and
+	`prefetch` ( if 0 ) then come from the plan too. The plan and the estimates behind
+	it are logged at INFO on the 'alfresco_postprocessing' logger.
+
+	With `prefetch` > 0 each worker handles runs of consecutive timesteps and
+	reads the rasters of the next `prefetch` timesteps on `prefetch_threads`
+	threads while the current one is being computed, hiding read and
+	decompression time behind the counting. With `profile` the overlap achieved
+	is reported under `parent.prefetch` in the profile summary.
+
+	If `fire_table_fn` ( a .npz path ) is given, every fire x sub-domain with its
+	size, dominant pre-fire vegetation and mean burn severity is written there as
+	a columnar FireTable ( see `read_fire_table` ), from which the fire metrics can
+	be derived on demand. With `store_fire_sizes=False` the bulky `all_fire_sizes`
+	lists are then left out of the TinyDB.
+
+	With `veg_transitions=True` each record also gets the year-over-year veg
+	transition counts per domain, which `veg_transition_matrix` sums over any
+	period without reopening the rasters.
+
+	If `ensemble_fn` ( a .csv path ) is given, the mean, std, min, max and
+	`ensemble_quantiles` across replicates of every metric x domain x year are
+	written there once the run is done ( see `ensemble_summary` ), so plots of the
+	replicate spread can read that small table instead of the database.
+
+	If `profile` is True, per-timestep stage timings are aggregated across the
+	workers and written to `<out_json_fn base>_profile.json`. If `trace` is also True
+	the raw events are written as Chrome-trace JSON to `<out_json_fn base>_trace.json`.
+	'''
 	db = ap._open_tinydb( out_json_fn )
 	fl = FileLister( maps_path, lagfire=lagfire )
 	# open a template raster
@@ -217,8 +464,25 @@ def run_postprocessing( maps_path, out_json_fn, ncores, veg_name_dict, subdomain
 	sub_domains = read_subdomains( subdomains_fn=subdomains_fn, rasterio_raster=rst, \
 					id_field=id_field, name_field=name_field, background_value=0 )
 	ts_list = fl.timesteps
+	if ncores == 'auto' and executor is None:
+		plan = plan_run( timesteps=ts_list, sub_domains=sub_domains, fire_table=fire_table_fn is not None, \
+						veg_transitions=veg_transitions, prefetch=prefetch or None )
+		_log.info( plan.report() )
+		ncores, chunksize = plan.ncores, chunksize or plan.chunksize
+		if not prefetch:
+			prefetch, prefetch_threads = plan.prefetch, plan.prefetch_threads
 	# fn_list = [ dict(i) for i in fn_list ]
-	return _get_stats( ts_list, db, sub_domains, ncores, veg_name_dict ) # WATCH THIS!!!!!
+	profile_fn, trace_fn = None, None
+	if profile:
+		profile_fn, trace_fn = profile_filenames( out_json_fn )
+		if not trace:
+			trace_fn = None
+	db = _get_stats( ts_list, db, sub_domains, ncores, veg_name_dict, profile_fn=profile_fn, trace_fn=trace_fn, \
+					executor=executor, chunksize=chunksize, prefetch=prefetch, prefetch_threads=prefetch_threads, \
+					fire_table_fn=fire_table_fn, store_fire_sizes=store_fire_sizes, veg_transitions=veg_transitions ) # WATCH THIS!!!!!
+	if ensemble_fn is not None:
+		write_ensemble_summary( db, ensemble_fn, quantiles=ensemble_quantiles )
+	return db
 
 def _to_csv( db, metric_name, output_path ):
 		return metric_to_csvs( db, metric_name, output_path )
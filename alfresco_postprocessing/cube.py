@@ -0,0 +1,160 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING LAZY RASTER CUBES
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import numpy as np
+
+class RasterStack( object ):
+	'''
+	array-like view of a replicate x year grid of single-band GeoTiffs with
+	shape (replicates, years, y, x). Nothing is read until it is indexed, and
+	then only the window of each file that is asked for, which lets dask pull
+	one chunk at a time.
+	'''
+	def __init__( self, fn_grid, band, shape, dtype, nodata, *args, **kwargs ):
+		'''
+		Arguments:
+		----------
+		fn_grid = [list] of lists of filenames [replicate][year]. missing files are None
+			and read as nodata.
+		band = [int] band number to read from each file.
+		shape = [tuple] ( height, width ) of the rasters.
+		dtype = [numpy.dtype] dtype of the rasters.
+		nodata = [scalar] value used for missing files.
+
+		Returns:
+		--------
+		object of type alfresco_postprocessing.RasterStack
+
+		'''
+		self.fn_grid = fn_grid
+		self.band = band
+		self.dtype = np.dtype( dtype )
+		self.nodata = nodata
+		self.shape = ( len( fn_grid ), len( fn_grid[0] ) ) + tuple( shape )
+		self.ndim = 4
+
+	def __getitem__( self, key ):
+		import rasterio
+		from rasterio.windows import Window
+		key = _expand_key( key, self.ndim )
+		rep_idx = np.arange( self.shape[0] )[ key[0] ]
+		year_idx = np.arange( self.shape[1] )[ key[1] ]
+		rows = range( *key[2].indices( self.shape[2] ) )
+		cols = range( *key[3].indices( self.shape[3] ) )
+		window = Window( cols.start, rows.start, len( cols ), len( rows ) )
+
+		squeeze = tuple( i for i, k in enumerate( key[ :2 ] ) if not isinstance( k, slice ) and np.ndim( k ) == 0 )
+		rep_idx, year_idx = np.atleast_1d( rep_idx ), np.atleast_1d( year_idx )
+		out = np.empty( ( len( rep_idx ), len( year_idx ), len( rows ), len( cols ) ), dtype=self.dtype )
+		fill = self.nodata if self.nodata is not None else 0
+		for i, r in enumerate( rep_idx ):
+			for j, y in enumerate( year_idx ):
+				fn = self.fn_grid[ r ][ y ]
+				if fn is None:
+					out[ i, j ] = fill
+					continue
+				with rasterio.open( fn ) as rst:
+					out[ i, j ] = rst.read( self.band, window=window )
+		if len( squeeze ) > 0:
+			out = out.squeeze( axis=squeeze )
+		return out
+
+def _expand_key( key, ndim ):
+	''' normalize an indexing key to a tuple of length ndim '''
+	if not isinstance( key, tuple ):
+		key = ( key, )
+	key = tuple( key ) + ( slice( None ), ) * ( ndim - len( key ) )
+	for k in key[ 2: ]:
+		if not isinstance( k, slice ) or k.step not in ( None, 1 ):
+			raise IndexError( 'RasterStack only supports contiguous slices on the y and x axes' )
+	return key
+
+def _file_grid( maps_path, variable, replicates=None, years=None ):
+	'''
+	use FileLister to arrange the files for `variable` as a [replicate][year]
+	grid of filenames. Returns ( replicates, years, fn_grid ).
+	'''
+	from alfresco_postprocessing.postprocess import FileLister
+	fl = FileLister( maps_path )
+	df = fl.files_df[ fl.files_df[ 'variable' ] == variable ]
+	if len( df ) == 0:
+		raise ValueError( 'no %s files found in %s' % ( variable, maps_path ) )
+	df = df.assign( replicate=df[ 'replicate' ].astype( int ), year=df[ 'year' ].astype( int ) )
+	if replicates is not None:
+		df = df[ df[ 'replicate' ].isin( [ int( i ) for i in replicates ] ) ]
+	if years is not None:
+		begin, end = years
+		df = df[ ( df[ 'year' ] >= begin ) & ( df[ 'year' ] <= end ) ]
+
+	reps = np.unique( df[ 'replicate' ] )
+	yrs = np.unique( df[ 'year' ] )
+	lookup = { ( r, y ):obj.fn for r, y, obj in zip( df[ 'replicate' ], df[ 'year' ], df[ 'object' ] ) }
+	fn_grid = [ [ lookup.get( ( r, y ) ) for y in yrs ] for r in reps ]
+	return reps, yrs, fn_grid
+
+def open_cube( maps_path, variable='Veg', band=None, chunks=None, replicates=None, years=None ):
+	'''
+	open all of the rasters of a single variable in an ALFRESCO output Maps
+	directory as a lazily evaluated replicate x year x y x x cube.
+
+	The cube is backed by dask, so reductions like `cube.mean( 'replicate' )`
+	are scheduled chunk by chunk across the local cores (GDAL releases the GIL
+	while reading and decompressing) and only the chunks in flight are held in
+	memory. Call `.compute()` (or `.load()`) to get the result.
+
+	Arguments:
+	----------
+	maps_path = [str] path to an ALFRESCO output Maps directory. year sub-directories are ok.
+	variable = [str] one of the ALFRESCO output variables 'Veg', 'Age', 'FireScar',
+		'BurnSeverity', 'BasalArea'. default:'Veg'
+	band = [int] band to read. default:None which reads band 2 (fire patch ids) for
+		FireScar and band 1 for everything else, the same as AlfrescoDataset.
+	chunks = [dict] chunk sizes for any of the dims 'replicate', 'year', 'y', 'x'.
+		default:None which uses one full raster per chunk.
+	replicates = [list] of replicate numbers to include. default:None (all)
+	years = [tuple] of ( begin_year, end_year ) inclusive. default:None (all)
+
+	Returns:
+	--------
+	xarray.DataArray with dims ( replicate, year, y, x ), coordinates taken from the
+	filenames and the raster geotransform, and attrs holding the crs, transform and
+	nodata value.
+
+	'''
+	import rasterio
+	import dask.array as da
+	import xarray as xr
+
+	if band is None:
+		band = 2 if variable == 'FireScar' else 1
+	reps, yrs, fn_grid = _file_grid( maps_path, variable, replicates=replicates, years=years )
+	template_fn = [ fn for row in fn_grid for fn in row if fn is not None ][ 0 ]
+	with rasterio.open( template_fn ) as tmp:
+		height, width = tmp.height, tmp.width
+		dtype = tmp.dtypes[ band - 1 ]
+		nodata = tmp.nodata
+		transform = tmp.transform
+		crs = tmp.crs.to_string() if tmp.crs is not None else None
+
+	stack = RasterStack( fn_grid, band, ( height, width ), dtype, nodata )
+	dims = ( 'replicate', 'year', 'y', 'x' )
+	chunks = dict( chunks or {} )
+	chunk_tuple = tuple( chunks.get( dim, default ) for dim, default in zip( dims, ( 1, 1, height, width ) ) )
+	arr = da.from_array( stack, chunks=chunk_tuple, lock=False, asarray=False, name='%s-%s' % ( variable, _token( fn_grid, band ) ) )
+
+	# pixel center coordinates
+	xs = transform.c + transform.a * ( np.arange( width ) + 0.5 )
+	ys = transform.f + transform.e * ( np.arange( height ) + 0.5 )
+	coords = { 'replicate':reps, 'year':yrs, 'y':ys, 'x':xs }
+	attrs = { 'variable':variable, 'band':band, 'crs':crs, 'transform':tuple( transform )[ :6 ],
+			'nodata':nodata, 'maps_path':maps_path }
+	return xr.DataArray( arr, dims=dims, coords=coords, name=variable, attrs=attrs )
+
+def _token( fn_grid, band ):
+	''' deterministic dask key so re-opening the same files reuses the graph '''
+	import hashlib
+	h = hashlib.md5( str( band ).encode() )
+	for row in fn_grid:
+		for fn in row:
+			h.update( str( fn ).encode() )
+	return h.hexdigest()
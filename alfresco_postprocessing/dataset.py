@@ -72,7 +72,11 @@ class AlfrescoDataset( object ):
 		else:
 			split[-1] = str( int( year ) + 1 )
 		split[-3] = variable
-		return os.path.join( os.path.dirname( self.fn ) , '_'.join( split ) + '.tif' )
+		dirname = os.path.dirname( self.fn )
+		if os.path.basename( dirname ) == year:
+			# Maps with year sub-directories keep the lag file in the sibling year folder
+			dirname = os.path.join( os.path.dirname( dirname ), split[-1] )
+		return os.path.join( dirname, '_'.join( split ) + '.tif' )
 
 	# def _get_lag( self, variable, direction=-1 ):
 	# 	''' direction can be -1 for negative lag, or 1 for positive lag '''
@@ -132,7 +136,18 @@ class ObservedDataset( AlfrescoDataset ):
 		self.raster_arr = label_im
 
 
-class SubDomains( object ):
+class _DomainsBase( object ):
+	'''
+	common pickling for the sub_domains flavors. The open rasterio template raster is
+	only needed to build the domain arrays and cannot be pickled, so it is dropped
+	when the object is sent to the worker processes.
+	'''
+	def __getstate__( self ):
+		state = self.__dict__.copy()
+		state[ 'rasterio_raster' ] = None
+		return state
+
+class SubDomains( _DomainsBase ):
 	'''
 	rasterize subdomains shapefile to ALFRESCO AOI of output set
 	'''
@@ -195,7 +210,7 @@ class SubDomains( object ):
 		gdf = gpd.read_file( self.subdomains_fn )
 		self.names_dict = dict( zip( gdf[self.id_field], gdf[self.name_field] ) )
 
-class SubDomainsRaster( object ):
+class SubDomainsRaster( _DomainsBase ):
 	'''
 	rasterize subdomains shapefile to ALFRESCO AOI of output set
 	'''
@@ -245,11 +260,10 @@ class SubDomainsRaster( object ):
 			arr_list.append( arr )
 		return arr_list
 	def _get_subdomains_dict( self ):
-		import geopandas as gpd
 		if self.names_dict == None:
 			self.names_dict = { i:str(i) for i in self.unique_domains }
 
-class FullDomain( object ):
+class FullDomain( _DomainsBase ):
 	'''
 	make a subdomains object when there are no domains passed to the run function.
 	This allows all data to have the same output JSON structure.
@@ -0,0 +1,88 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING REPLICATE ENSEMBLE SUMMARIES
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import numpy as np
+
+DEFAULT_QUANTILES = ( 0.05, 0.25, 0.5, 0.75, 0.95 )
+
+def _quantile_name( q ):
+	''' 0.05 -> 'q05', 0.5 -> 'q50', 0.975 -> 'q97.5' '''
+	return 'q%s' % ( '%g' % ( q * 100 ) ).zfill( 2 )
+
+def ensemble_arrays( db, metrics=None, quantiles=DEFAULT_QUANTILES ):
+	'''
+	summarize each metric across the replicate axis: the count of replicates, mean,
+	std, min, max and quantiles for every year x domain ( x class ), with vectorized
+	reductions over the dense arrays of `get_metric_arrays`.
+
+	Arguments:
+	----------
+	db = [tinydb.TinyDB or list] open tinydb object from an ALFRESCO Post Processing run,
+		or the list of records as returned by `db.all()`.
+	metrics = [list] metric names. default:None (all of avg_fire_size, number_of_fires,
+		total_area_burned, veg_counts and severity_counts that are present)
+	quantiles = [tuple] quantiles in [0, 1]. default:( 0.05, 0.25, 0.5, 0.75, 0.95 )
+
+	Returns:
+	--------
+	dict of metric_name:( { stat:numpy.ndarray }, coords ) where coords are those of
+	`get_metric_arrays` without the replicate dimension. Missing replicates ( NaN )
+	are left out of the statistics.
+
+	'''
+	import warnings
+	from alfresco_postprocessing.postprocess import get_metric_arrays
+	from alfresco_postprocessing.export import DEFAULT_STORE_METRICS
+	records = db.all() if hasattr( db, 'all' ) else db
+	if metrics is None:
+		metrics = [ m for m in DEFAULT_STORE_METRICS if m in records[0] ]
+	out = {}
+	for metric_name, ( arr, coords ) in get_metric_arrays( records, metrics ).items():
+		stats = { 'n':np.sum( ~np.isnan( arr ), axis=0 ) }
+		with warnings.catch_warnings():
+			# all-NaN cells ( e.g. a class missing from a domain ) stay NaN
+			warnings.simplefilter( 'ignore', category=RuntimeWarning )
+			stats[ 'mean' ] = np.nanmean( arr, axis=0 )
+			stats[ 'std' ] = np.nanstd( arr, axis=0, ddof=1 ) if arr.shape[0] > 1 else np.full( arr.shape[ 1: ], np.nan )
+			stats[ 'min' ] = np.nanmin( arr, axis=0 )
+			stats[ 'max' ] = np.nanmax( arr, axis=0 )
+			if len( quantiles ) > 0:
+				qs = np.nanquantile( arr, list( quantiles ), axis=0 )
+				for q, values in zip( quantiles, qs ):
+					stats[ _quantile_name( q ) ] = values
+		out[ metric_name ] = ( stats, coords[ 1: ] )
+	return out
+
+def ensemble_summary( db, metrics=None, quantiles=DEFAULT_QUANTILES ):
+	'''
+	`ensemble_arrays` as one tidy pandas.DataFrame with the columns metric, year,
+	domain, class ( vegtype / severity, empty for the scalar metrics ), n, mean,
+	std, min, max and one column per quantile ( q05, q50, ... ).
+	'''
+	import pandas as pd
+	frames = []
+	for metric_name, ( stats, coords ) in ensemble_arrays( db, metrics=metrics, quantiles=quantiles ).items():
+		shape = tuple( len( labels ) for dim, labels in coords )
+		idx = np.indices( shape ).reshape( len( shape ), -1 )
+		cols = { 'metric':np.full( idx.shape[1], metric_name, dtype=object ) }
+		for ( dim, labels ), i in zip( coords, idx ):
+			cols[ dim if dim in ( 'year', 'domain' ) else 'class' ] = np.array( labels, dtype=object )[ i ]
+		if 'class' not in cols:
+			cols[ 'class' ] = np.full( idx.shape[1], '', dtype=object )
+		for stat, values in stats.items():
+			cols[ stat ] = values.ravel()
+		frames.append( pd.DataFrame( cols ) )
+	df = pd.concat( frames, ignore_index=True )
+	df[ 'year' ] = df[ 'year' ].astype( int )
+	# timesteps / classes with no replicates at all carry no information
+	return df[ df[ 'n' ] > 0 ].reset_index( drop=True )
+
+def write_ensemble_summary( db, output_fn, metrics=None, quantiles=DEFAULT_QUANTILES ):
+	''' write `ensemble_summary` to a CSV and return its path '''
+	ensemble_summary( db, metrics=metrics, quantiles=quantiles ).to_csv( output_fn, index=False )
+	return output_fn
+
+def read_ensemble_summary( fn ):
+	''' read a CSV written by `write_ensemble_summary` ( or run_postprocessing( ..., ensemble_fn=fn ) ) '''
+	import pandas as pd
+	return pd.read_csv( fn, dtype={ 'domain':str, 'class':str } ).fillna( { 'class':'' } )
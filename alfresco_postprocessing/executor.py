@@ -0,0 +1,158 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING PERSISTENT WORKER POOL
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import os, pickle, hashlib
+from functools import partial
+
+# per-worker cache of the shared state ( sub_domains, veg_name_dict, ... ) keyed
+# by the md5 of its pickle. filled once per worker, either by the pool initializer
+# or the first time a task with a new key lands on the worker.
+_WORKER_STATE = {}
+_MAX_WORKER_STATES = 4
+
+def _init_worker( key, state_fn ):
+	''' pool initializer -- load the state the pool was started with '''
+	_load_state( key, state_fn )
+
+def _load_state( key, state_fn ):
+	if key not in _WORKER_STATE:
+		if len( _WORKER_STATE ) >= _MAX_WORKER_STATES:
+			# drop the oldest so long batch runs don't hold every sub_domains ever seen
+			_WORKER_STATE.pop( next( iter( _WORKER_STATE ) ) )
+		with open( state_fn, 'rb' ) as f:
+			_WORKER_STATE[ key ] = pickle.load( f )
+	return _WORKER_STATE[ key ]
+
+def _call_with_state( item, func, key, state_fn ):
+	''' run func( item, **state ) in a worker using its cached copy of the state '''
+	state = _load_state( key, state_fn ) if key is not None else {}
+	return func( item, **state )
+
+class Executor( object ):
+	'''
+	a reusable pool of worker processes for running post processing timesteps.
+
+	Workers stay alive across calls to `map`, so a modeled run, a historical run and
+	any number of batch runs can share one pool instead of each spawning its own.
+	Large shared arguments ( e.g. sub_domains ) are passed as `state` -- they are
+	pickled once in the parent and loaded once per worker, rather than being sent
+	along with every task.
+
+	use as a context manager so the workers are shut down and joined:
+
+		with ap.Executor( ncores=32 ) as executor:
+			ap.run_postprocessing( maps_path, out_json_fn, 32, ap.veg_name_dict, subdomains_fn, executor=executor )
+			ap.run_postprocessing_historical( fh_path, obs_json_fn, 32, ap.veg_name_dict, subdomains_fn, executor=executor )
+
+	'''
+	def __init__( self, ncores=None, chunksize=None, maxtasksperchild=None, context=None, *args, **kwargs ):
+		'''
+		Arguments:
+		----------
+		ncores = [int] number of worker processes. default:None (os.cpu_count())
+		chunksize = [int] number of tasks sent to a worker at a time. default:None which
+			uses the multiprocessing.Pool.map heuristic. can be overridden per `map` call.
+		maxtasksperchild = [int] restart a worker after this many tasks. default:None
+			(workers live as long as the executor)
+		context = [str] multiprocessing start method ( 'fork', 'spawn', 'forkserver' ).
+			default:None (the platform default)
+
+		Returns:
+		--------
+		object of type alfresco_postprocessing.Executor
+
+		'''
+		import tempfile
+		self.ncores = ncores or os.cpu_count()
+		self.chunksize = chunksize
+		self.maxtasksperchild = maxtasksperchild
+		self.context = context
+		self._pool = None
+		self._state_files = {}
+		self._tmpdir = tempfile.mkdtemp( prefix='alfpp_executor_' )
+
+	def _register_state( self, state ):
+		''' pickle the state once to a file workers can load from, keyed by its content '''
+		if not state:
+			return None, None
+		data = pickle.dumps( state, protocol=pickle.HIGHEST_PROTOCOL )
+		key = hashlib.md5( data ).hexdigest()
+		if key not in self._state_files:
+			state_fn = os.path.join( self._tmpdir, key + '.pkl' )
+			with open( state_fn, 'wb' ) as f:
+				f.write( data )
+			self._state_files[ key ] = state_fn
+		return key, self._state_files[ key ]
+
+	def _get_pool( self, key=None, state_fn=None ):
+		''' start the workers lazily, warming them with the first state seen '''
+		if self._pool is None:
+			import multiprocessing
+			ctx = multiprocessing.get_context( self.context )
+			initializer, initargs = None, ()
+			if key is not None:
+				initializer, initargs = _init_worker, ( key, state_fn )
+			self._pool = ctx.Pool( processes=self.ncores, initializer=initializer,
+									initargs=initargs, maxtasksperchild=self.maxtasksperchild )
+		return self._pool
+
+	def map( self, func, items, state=None, chunksize=None ):
+		'''
+		apply `func( item, **state )` to each of `items` in the worker processes and
+		return the results in order.
+
+		Arguments:
+		----------
+		func = [callable] picklable function ( module level or a functools.partial of one ).
+		items = [list] the items to map over.
+		state = [dict] keyword arguments shared by every call. Sent to each worker once.
+			default:None
+		chunksize = [int] override the executor chunksize for this call. default:None
+
+		Returns:
+		--------
+		list of the results of func in the order of items.
+
+		'''
+		if self._tmpdir is None:
+			raise ValueError( 'Executor is closed' )
+		key, state_fn = self._register_state( state )
+		pool = self._get_pool( key, state_fn )
+		f = partial( _call_with_state, func=func, key=key, state_fn=state_fn )
+		chunksize = chunksize or self.chunksize
+		return pool.map( f, items, chunksize=chunksize )
+
+	def close( self ):
+		''' stop the workers, wait for them to exit and remove the pickled state '''
+		import shutil
+		if self._pool is not None:
+			self._pool.close()
+			self._pool.join()
+			self._pool = None
+		if self._tmpdir is not None:
+			shutil.rmtree( self._tmpdir, ignore_errors=True )
+			self._tmpdir = None
+
+	def terminate( self ):
+		''' stop the workers immediately ( e.g. after an error in the parent ) '''
+		if self._pool is not None:
+			self._pool.terminate()
+			self._pool.join()
+			self._pool = None
+		self.close()
+
+	def __enter__( self ):
+		return self
+
+	def __exit__( self, exc_type, exc_value, traceback ):
+		if exc_type is None:
+			self.close()
+		else:
+			self.terminate()
+		return False
+
+	def __del__( self ):
+		try:
+			self.terminate()
+		except Exception:
+			pass
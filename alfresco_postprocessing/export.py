@@ -0,0 +1,171 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING LABELED ARRAY STORES (NetCDF / Zarr)
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import os
+import numpy as np
+
+DEFAULT_STORE_METRICS = [ 'avg_fire_size', 'number_of_fires', 'total_area_burned', 'veg_counts', 'severity_counts' ]
+
+def _store_format( output_fn, format=None ):
+	''' infer the store format from the output filename extension '''
+	if format is not None:
+		return format
+	if output_fn.rstrip( os.path.sep ).endswith( '.zarr' ):
+		return 'zarr'
+	return 'netcdf'
+
+def metrics_to_dataset( db, metrics=None ):
+	'''
+	convert the metrics of an ALFRESCO Post Processing output TinyDB into a
+	labeled xarray.Dataset with one variable per metric and the shared dims
+	( replicate, year, domain ) plus vegtype / severity for the class counts.
+
+	Arguments:
+	----------
+	db = [tinydb.TinyDB or list] open tinydb object from an ALFRESCO Post Processing run,
+		or the list of records as returned by `db.all()`.
+	metrics = [list] metric names to include. default:None which uses all of the
+		metrics that are present among 'avg_fire_size', 'number_of_fires',
+		'total_area_burned', 'veg_counts', 'severity_counts'.
+
+	Returns:
+	--------
+	xarray.Dataset
+
+	'''
+	import xarray as xr
+	from alfresco_postprocessing.postprocess import get_metric_arrays
+	records = db.all() if hasattr( db, 'all' ) else db
+	if metrics is None:
+		metrics = [ m for m in DEFAULT_STORE_METRICS if m in records[0] ]
+
+	arrays = get_metric_arrays( records, metrics )
+	datasets = []
+	for metric_name in metrics:
+		arr, metric_coords = arrays[ metric_name ]
+		dims = tuple( dim for dim, labels in metric_coords )
+		coords = { dim:_coord_values( labels ) for dim, labels in metric_coords }
+		datasets.append( xr.Dataset( { metric_name:( dims, arr ) }, coords=coords ) )
+	# metrics share the replicate / year / domain coordinates
+	ds = xr.merge( datasets, join='outer' )
+	ds.attrs[ 'source' ] = 'alfresco_postprocessing'
+	return ds
+
+def _coord_values( labels ):
+	''' years stay integers, replicate / domain / class labels are kept as the TinyDB string keys '''
+	if all( isinstance( l, ( int, np.integer ) ) for l in labels ):
+		return np.array( labels, dtype=np.int64 )
+	return np.array( [ str( l ) for l in labels ], dtype=str )
+
+def _default_chunks( ds ):
+	'''
+	chunk so that a single replicate, a single domain or a single year can each be
+	sliced without reading the whole store.
+	'''
+	chunks = {}
+	for dim, size in ds.sizes.items():
+		if dim == 'replicate':
+			chunks[ dim ] = min( size, 10 )
+		elif dim == 'domain':
+			chunks[ dim ] = min( size, 50 )
+		else:
+			chunks[ dim ] = size
+	return chunks
+
+def to_cube_store( db, output_fn, metrics=None, format=None, append=False, chunks=None ):
+	'''
+	write the per-timestep metrics of an ALFRESCO Post Processing output TinyDB
+	to a chunked, labeled multi-dimensional store (NetCDF or Zarr) with the
+	dimensions replicate x year x domain ( x vegtype / severity ).
+
+	Compared to `to_csvs`, which writes one CSV per metric x domain x vegtype,
+	this is a single store that can be sliced by any dimension without reparsing.
+
+	Arguments:
+	----------
+	db = [tinydb.TinyDB or list] open tinydb object from an ALFRESCO Post Processing run,
+		or the list of records as returned by `db.all()`.
+	output_fn = [str] path to the output store. `.zarr` writes Zarr, anything else NetCDF.
+	metrics = [list] metric names to write. default:None (all supported metrics present)
+	format = [str] 'zarr' or 'netcdf' to override the extension-based choice. default:None
+	append = [bool] append the replicates in `db` to an existing store along the
+		replicate dimension. replicates already in the store, or years / domains /
+		classes that are not, raise a ValueError. default:False
+	chunks = [dict] chunk sizes per dimension. default:None (see `_default_chunks`)
+
+	Returns:
+	--------
+	[str] output_fn, with the side-effect of the store being written to disk.
+
+	'''
+	import xarray as xr
+	fmt = _store_format( output_fn, format )
+	ds = metrics_to_dataset( db, metrics=metrics )
+
+	if append and os.path.exists( output_fn ):
+		existing = open_cube_store( output_fn, format=fmt )
+		dupes = set( existing[ 'replicate' ].values.tolist() ) & set( ds[ 'replicate' ].values.tolist() )
+		if len( dupes ) > 0:
+			existing.close()
+			raise ValueError( 'replicates already in %s: %s' % ( output_fn, sorted( dupes, key=str ) ) )
+		# new replicates must line up with the stored years / domains / classes. any
+		# missing are filled with NaN, but new ones would be dropped, so they raise
+		other_dims = [ d for d in existing.dims if d != 'replicate' and d in ds.dims ]
+		for d in other_dims:
+			new = set( ds[ d ].values.tolist() ) - set( existing[ d ].values.tolist() )
+			if len( new ) > 0:
+				existing.close()
+				raise ValueError( '%s values not in %s: %s. write a new store instead of appending' \
+								% ( d, output_fn, sorted( new, key=str ) ) )
+		ds = _vlen_replicates( ds.reindex( { d:existing[ d ].values for d in other_dims } ) )
+		if fmt == 'zarr':
+			existing.close()
+			ds.to_zarr( output_fn, append_dim='replicate' )
+			return output_fn
+		# netcdf can't grow in place -- rewrite the combined store
+		combined = xr.concat( [ _vlen_replicates( existing.load() ), ds ], dim='replicate' )
+		existing.close()
+		tmp_fn = output_fn + '.tmp'
+		_write_store( combined, tmp_fn, fmt, chunks )
+		os.replace( tmp_fn, output_fn )
+		return output_fn
+
+	if os.path.exists( output_fn ):
+		import shutil
+		if os.path.isdir( output_fn ):
+			shutil.rmtree( output_fn )
+		else:
+			os.unlink( output_fn )
+	_write_store( ds, output_fn, fmt, chunks )
+	return output_fn
+
+def _vlen_replicates( ds ):
+	'''
+	replicate labels as variable-length strings, so a store written with replicate
+	'0' can take '12' later. fixed-width labels get their width from the first write.
+	'''
+	return ds.assign_coords( replicate=ds[ 'replicate' ].values.astype( str ).astype( object ) )
+
+def _write_store( ds, output_fn, fmt, chunks=None ):
+	ds = _vlen_replicates( ds )
+	if chunks is None:
+		chunks = _default_chunks( ds )
+	if fmt == 'zarr':
+		ds.chunk( { d:c for d, c in chunks.items() if d in ds.dims } ).to_zarr( output_fn, mode='w' )
+	else:
+		encoding = {}
+		for name, var in ds.data_vars.items():
+			encoding[ name ] = { 'zlib':True, 'complevel':4,
+								'chunksizes':tuple( min( chunks.get( d, ds.sizes[ d ] ), ds.sizes[ d ] ) for d in var.dims ) }
+		ds.to_netcdf( output_fn, encoding=encoding )
+	return output_fn
+
+def open_cube_store( output_fn, format=None ):
+	'''
+	open a store written with `to_cube_store` as a lazily loaded xarray.Dataset.
+	e.g. `ds[ 'total_area_burned' ].sel( domain='Boreal', year=slice( 1950, 2010 ) )`
+	'''
+	import xarray as xr
+	if _store_format( output_fn, format ) == 'zarr':
+		return xr.open_zarr( output_fn )
+	return xr.open_dataset( output_fn )
@@ -0,0 +1,253 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING FIRE SIZE DISTRIBUTIONS
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import numpy as np
+
+def _open_source( src ):
+	''' a FireTable, or the list of TinyDB records, from any of the accepted inputs '''
+	from alfresco_postprocessing.firetable import FireTable
+	if isinstance( src, FireTable ):
+		return src
+	if isinstance( src, str ):
+		if src.endswith( '.npz' ):
+			return FireTable.load( src )
+		from alfresco_postprocessing.jsonstream import read_records
+		return read_records( src, metrics=[ 'all_fire_sizes' ] )
+	return src.all() if hasattr( src, 'all' ) else src
+
+def ragged_fire_sizes( src ):
+	'''
+	every fire size of a post processing run, flattened into one array with offsets
+	over the full replicate x year x domain grid.
+
+	Arguments:
+	----------
+	src = [tinydb.TinyDB, list, FireTable or str] output database of an ALFRESCO Post
+		Processing run (or its list of records), a FireTable, or the path to either
+		( a .npz path is read as a FireTable ).
+
+	Returns:
+	--------
+	( values, offsets, coords, processed ) where the sizes of grid cell i ( in C order
+	over the replicate, year, domain dims of coords ) are values[ offsets[ i ]:offsets[ i + 1 ] ]
+	and processed is a boolean replicate x year array of the timesteps that were run.
+	coords is as in `get_metric_arrays`.
+
+	'''
+	from alfresco_postprocessing.firetable import FireTable
+	from alfresco_postprocessing.postprocess import _sorted_labels
+	src = _open_source( src )
+	if isinstance( src, FireTable ):
+		years, gid = src._grid()
+		coords = [ ( 'replicate', src.replicates ), ( 'year', years.tolist() ), ( 'domain', src.domains ) ]
+		shape = tuple( len( labels ) for dim, labels in coords )
+		order = np.lexsort( ( src[ 'fire_id' ], gid ) )
+		values = src[ 'pixels' ][ order ]
+		counts = np.bincount( gid, minlength=int( np.prod( shape ) ) )
+		processed = np.zeros( shape[ :2 ], dtype=bool )
+		processed[ src.timesteps[0], np.searchsorted( years, src.timesteps[1] ) ] = True
+	else:
+		records = src
+		if any( 'all_fire_sizes' not in rec for rec in records ):
+			raise ValueError( 'all_fire_sizes was not stored, use the fire table of the run ( fire_table_fn )' )
+		coords = [ ( 'replicate', _sorted_labels( [ rec[ 'replicate' ] for rec in records ] ) ),
+					( 'year', sorted( set( int( rec.get( 'fire_year', rec.get( 'year' ) ) ) for rec in records ) ) ),
+					( 'domain', _sorted_labels( [ d for rec in records for d in rec[ 'all_fire_sizes' ] ] ) ) ]
+		lookups = [ { label:i for i, label in enumerate( labels ) } for dim, labels in coords ]
+		shape = tuple( len( labels ) for dim, labels in coords )
+		# one pass over the records, extending a single flat list
+		flat, group_ids, group_sizes = [], [], []
+		processed = np.zeros( shape[ :2 ], dtype=bool )
+		for rec in records:
+			r = lookups[0][ rec[ 'replicate' ] ]
+			y = lookups[1][ int( rec.get( 'fire_year', rec.get( 'year' ) ) ) ]
+			processed[ r, y ] = True
+			for domain, sizes in rec[ 'all_fire_sizes' ].items():
+				flat.extend( sizes )
+				group_ids.append( ( r * shape[1] + y ) * shape[2] + lookups[2][ domain ] )
+				group_sizes.append( len( sizes ) )
+		group_ids = np.asarray( group_ids, dtype=np.int64 )
+		group_sizes = np.asarray( group_sizes, dtype=np.int64 )
+		gid = np.repeat( group_ids, group_sizes )
+		order = np.argsort( gid, kind='stable' )
+		values = np.asarray( flat, dtype=np.int64 )[ order ]
+		counts = np.bincount( gid, minlength=int( np.prod( shape ) ) )
+	offsets = np.zeros( len( counts ) + 1, dtype=np.int64 )
+	np.cumsum( counts, out=offsets[ 1: ] )
+	return values, offsets, coords, processed
+
+def _group_index( offsets ):
+	''' the grid cell of every value of a ragged array '''
+	return np.repeat( np.arange( len( offsets ) - 1 ), np.diff( offsets ) )
+
+def fire_size_count_arrays( src, thresholds=None, bins=None ):
+	'''
+	count the fires of every replicate x year x domain by size in one vectorized
+	pass, either above / below each of many thresholds or in histogram bins.
+
+	Arguments:
+	----------
+	src = [tinydb.TinyDB, list, FireTable or str] see `ragged_fire_sizes`.
+	thresholds = [list] fire sizes ( pixels ). fires strictly below and strictly above
+		each threshold are counted, as in bin/annual_fire_size_counts_by_threshold.py.
+	bins = [list] increasing bin edges ( pixels ). bins are half open [ lower, upper )
+		except the last, which includes its upper edge ( as numpy.histogram ). fires
+		outside the edges are not counted.
+
+	Returns:
+	--------
+	dict of name:( numpy.ndarray, coords ) as in `get_metric_arrays`, with a fourth
+	dimension 'threshold' ( names 'count_below' and 'count_above' ) or 'bin' ( name
+	'count', labeled by the lower edges ). Timesteps that were not run are NaN.
+
+	'''
+	if ( thresholds is None ) == ( bins is None ):
+		raise ValueError( 'give exactly one of thresholds or bins' )
+	values, offsets, coords, processed = ragged_fire_sizes( src )
+	shape = tuple( len( labels ) for dim, labels in coords )
+	ngroups = len( offsets ) - 1
+	gid = _group_index( offsets )
+
+	def grouped( idx, nbins ):
+		counts = np.bincount( gid * nbins + idx, minlength=ngroups * nbins )
+		return counts.reshape( ngroups, nbins )
+
+	out = {}
+	if thresholds is not None:
+		thresholds = np.unique( np.asarray( thresholds ) )
+		nt = len( thresholds )
+		# number of thresholds <= size: size < thresholds[ k ] where that is <= k
+		below = np.cumsum( grouped( np.searchsorted( thresholds, values, side='right' ), nt + 1 ), axis=1 )[ :, :nt ]
+		# number of thresholds < size: size > thresholds[ k ] where that is > k
+		left = np.cumsum( grouped( np.searchsorted( thresholds, values, side='left' ), nt + 1 ), axis=1 )
+		above = left[ :, -1: ] - left[ :, :nt ]
+		dim = ( 'threshold', thresholds.tolist() )
+		arrays = { 'count_below':below, 'count_above':above }
+	else:
+		edges = np.asarray( bins )
+		if edges.ndim != 1 or len( edges ) < 2 or np.any( np.diff( edges ) <= 0 ):
+			raise ValueError( 'bins must be at least two increasing edges' )
+		nbins = len( edges ) - 1
+		idx = np.searchsorted( edges, values, side='right' ) - 1
+		idx[ values == edges[ -1 ] ] = nbins - 1
+		inside = ( idx >= 0 ) & ( idx < nbins )
+		# out of range values go to an extra bin that is dropped
+		idx[ ~inside ] = nbins
+		dim = ( 'bin', edges[ :-1 ].tolist() )
+		arrays = { 'count':grouped( idx, nbins + 1 )[ :, :nbins ] }
+
+	for name, counts in arrays.items():
+		arr = counts.reshape( shape + ( len( dim[1] ), ) ).astype( np.float64 )
+		arr[ ~processed ] = np.nan
+		out[ name ] = ( arr, coords + [ dim ] )
+	return out
+
+def fire_size_counts( src, thresholds=None, bins=None ):
+	'''
+	`fire_size_count_arrays` as one tidy pandas.DataFrame with a row per replicate x
+	year x domain x threshold ( columns count_below, count_above ) or x bin ( columns
+	bin_lower, bin_upper, count ). Timesteps that were not run are left out.
+	'''
+	import pandas as pd
+	arrays = fire_size_count_arrays( src, thresholds=thresholds, bins=bins )
+	names = list( arrays.keys() )
+	arr, coords = arrays[ names[0] ]
+	keep = ~np.isnan( arr )
+	idx = np.nonzero( keep )
+	df = pd.DataFrame( { dim:np.array( labels, dtype=object )[ i ] for ( dim, labels ), i in zip( coords, idx ) } )
+	df[ 'year' ] = df[ 'year' ].astype( int )
+	df[ coords[ 3 ][0] ] = np.asarray( coords[ 3 ][1] )[ idx[ 3 ] ]
+	if bins is not None:
+		edges = np.asarray( bins )
+		df = df.rename( columns={ 'bin':'bin_lower' } )
+		df[ 'bin_upper' ] = edges[ 1: ][ idx[ 3 ] ]
+	for name in names:
+		df[ name ] = arrays[ name ][0][ keep ].astype( np.int64 )
+	return df
+
+def cumulative_area_curves( values, offsets, npoints=None ):
+	'''
+	fire size CDF and cumulative area burned vs. fire size curves of every group of
+	a ragged array, computed with one sort and one cumsum over all groups.
+
+	Arguments:
+	----------
+	values = [numpy.ndarray] fire sizes of all groups, concatenated.
+	offsets = [numpy.ndarray] the sizes of group i are values[ offsets[ i ]:offsets[ i + 1 ] ].
+	npoints = [int] keep at most this many evenly spaced points ( always including
+		the first and last ) of each curve, for plotting. default:None (all points)
+
+	Returns:
+	--------
+	( sizes, cumulative_area, cdf, offsets ) ragged in the same way as the input:
+	sizes ascending within each group, the cumulative sum of those sizes, and the
+	fraction of the group's fires at or below each size.
+
+	'''
+	values = np.asarray( values )
+	offsets = np.asarray( offsets, dtype=np.int64 )
+	counts = np.diff( offsets )
+	gid = _group_index( offsets )
+	sizes = values[ np.lexsort( ( values, gid ) ) ]
+	# one running sum, restarted at each group start
+	total = np.cumsum( sizes, dtype=np.float64 )
+	before = np.concatenate( [ [ 0.0 ], total ] )[ offsets[ :-1 ] ]
+	cumulative_area = total - np.repeat( before, counts )
+	rank = np.arange( 1, len( sizes ) + 1 ) - np.repeat( offsets[ :-1 ], counts )
+	cdf = rank / np.repeat( counts, counts ).astype( np.float64 )
+
+	if npoints is not None and len( sizes ) > 0:
+		npoints = max( int( npoints ), 2 )
+		keep = ( counts <= npoints )[ gid ]
+		large = np.nonzero( counts > npoints )[0]
+		if len( large ) > 0:
+			k = np.arange( npoints )
+			idx = offsets[ large, None ] + ( k[ None, : ] * ( counts[ large, None ] - 1 ) ) // ( npoints - 1 )
+			keep[ idx.ravel() ] = True
+		sizes, cumulative_area, cdf = sizes[ keep ], cumulative_area[ keep ], cdf[ keep ]
+		offsets = np.zeros( len( counts ) + 1, dtype=np.int64 )
+		np.cumsum( np.bincount( gid[ keep ], minlength=len( counts ) ), out=offsets[ 1: ] )
+	return sizes, cumulative_area, cdf, offsets
+
+def fire_size_curves( src, domain, years=None, npoints=None ):
+	'''
+	per replicate cumulative area burned vs. fire size ( and fire size CDF ) curves
+	of one domain, pooling the fires of all years in the range.
+
+	Arguments:
+	----------
+	src = [tinydb.TinyDB, list, FireTable, Plot or str] see `ragged_fire_sizes`, or its
+		already computed output, to draw curves for many domains from one pass.
+	domain = [str] domain name.
+	years = [tuple] ( begin, end ) inclusive year range. default:None (all years)
+	npoints = [int] downsample each curve to at most npoints. see `cumulative_area_curves`.
+
+	Returns:
+	--------
+	( replicates, sizes, cumulative_area, cdf, offsets ) where the curve of
+	replicates[ i ] is at [ offsets[ i ]:offsets[ i + 1 ] ] of the three arrays.
+
+	'''
+	if not isinstance( src, tuple ):
+		from alfresco_postprocessing.plot import _fire_size_records
+		src = ragged_fire_sizes( _fire_size_records( src ) )
+	values, offsets, coords, processed = src
+	replicates, all_years, domains = [ labels for dim, labels in coords ]
+	if str( domain ) not in [ str( d ) for d in domains ]:
+		raise ValueError( 'domain %s not found' % domain )
+	d = [ str( d ) for d in domains ].index( str( domain ) )
+	all_years = np.asarray( all_years )
+	in_range = np.ones( len( all_years ), dtype=bool )
+	if years is not None:
+		in_range = ( all_years >= int( years[0] ) ) & ( all_years <= int( years[1] ) )
+	# select the grid cells of the domain and year range, replicate-major, and
+	# merge the years of each replicate into one group
+	cells = ( np.arange( len( replicates ) )[ :, None ] * len( all_years ) + np.nonzero( in_range )[0][ None, : ] ) * len( domains ) + d
+	cells = cells.ravel()
+	counts = offsets[ cells + 1 ] - offsets[ cells ]
+	idx = np.repeat( offsets[ cells ] - np.concatenate( [ [ 0 ], np.cumsum( counts )[ :-1 ] ] ), counts ) + np.arange( counts.sum() )
+	rep_counts = counts.reshape( len( replicates ), -1 ).sum( axis=1 )
+	rep_offsets = np.zeros( len( replicates ) + 1, dtype=np.int64 )
+	np.cumsum( rep_counts, out=rep_offsets[ 1: ] )
+	sizes, cumulative_area, cdf, rep_offsets = cumulative_area_curves( values[ idx ], rep_offsets, npoints=npoints )
+	return list( replicates ), sizes, cumulative_area, cdf, rep_offsets
@@ -0,0 +1,263 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING PER-FIRE TABLE
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import numpy as np
+
+VEG_NODATA = 255
+
+def fire_table_columns( alf_ds, veg_arr=None, severity_arr=None ):
+	'''
+	one row per fire x sub-domain for a single FireScar (or FireHistory) timestep.
+	A fire that crosses sub-domain boundaries gets a row in each sub-domain it burns in.
+
+	Arguments:
+	----------
+	alf_ds = [AlfrescoDataset] opened FireScar or ObservedDataset, with sub_domains.
+	veg_arr = [numpy.ndarray] vegetation of the year before the fire, used for the
+		dominant pre-fire vegetation of each fire. default:None (not computed)
+	severity_arr = [numpy.ndarray] BurnSeverity of the same year, used for the mean
+		severity of each fire (0 and 255 are ignored). default:None (not computed)
+
+	Returns:
+	--------
+	dict with `domains` (the sub-domain names, in sub_domains order) and the numpy
+	columns `domain` (index into `domains`), `fire_id`, `pixels` and, if requested,
+	`veg` (uint8, 255 where unknown) and `severity` (float32, NaN where unknown).
+
+	'''
+	sub_domains = alf_ds.sub_domains
+	fire_arr = alf_ds.raster_arr
+	burned = fire_arr > 0 # changed (raster_arr > 0) from (raster_arr >= 0)  WATCH IT!
+	domain_names = []
+	cols = { 'domain':[], 'fire_id':[], 'pixels':[] }
+	if veg_arr is not None:
+		cols[ 'veg' ] = []
+	if severity_arr is not None:
+		cols[ 'severity' ] = []
+
+	for code, domain in enumerate( sub_domains.sub_domains ):
+		domain_num = np.unique( domain[ domain > 0 ] )[0]
+		domain_names.append( sub_domains.names_dict[ domain_num ] )
+		mask = burned & ( domain == domain_num )
+		fire_ids, inverse, pixels = np.unique( fire_arr[ mask ], return_inverse=True, return_counts=True )
+		inverse = inverse.ravel()
+		nfires = len( fire_ids )
+		cols[ 'domain' ].append( np.full( nfires, code, dtype=np.int16 ) )
+		cols[ 'fire_id' ].append( fire_ids.astype( np.int32 ) )
+		cols[ 'pixels' ].append( pixels.astype( np.int32 ) )
+		if veg_arr is not None:
+			cols[ 'veg' ].append( _dominant_class( inverse, veg_arr[ mask ], nfires ) )
+		if severity_arr is not None:
+			cols[ 'severity' ].append( _mean_by_group( inverse, severity_arr[ mask ], nfires ) )
+
+	out = { name:np.concatenate( arrs ) if len( arrs ) > 0 else np.array( [], dtype=np.int32 ) for name, arrs in cols.items() }
+	out[ 'domains' ] = domain_names
+	return out
+
+def _dominant_class( inverse, values, ngroups, nclasses=256 ):
+	''' most common valid (1-254) class in each group, 255 where there is none '''
+	values = values.astype( np.int64 )
+	valid = ( values > 0 ) & ( values < VEG_NODATA )
+	counts = np.bincount( inverse[ valid ] * nclasses + values[ valid ], minlength=ngroups * nclasses )
+	counts = counts.reshape( ngroups, nclasses )
+	dominant = counts.argmax( axis=1 ).astype( np.uint8 )
+	dominant[ counts.sum( axis=1 ) == 0 ] = VEG_NODATA
+	return dominant
+
+def _mean_by_group( inverse, values, ngroups ):
+	''' mean of the valid (not 0 / 255) values in each group, NaN where there are none '''
+	values = values.astype( np.float64 )
+	valid = ( values > 0 ) & ( values != 255 )
+	total = np.bincount( inverse[ valid ], weights=values[ valid ], minlength=ngroups )
+	count = np.bincount( inverse[ valid ], minlength=ngroups )
+	with np.errstate( invalid='ignore', divide='ignore' ):
+		return ( total / count ).astype( np.float32 )
+
+def fire_metrics( fires ):
+	'''
+	the per-domain fire metrics of a single timestep derived from its
+	`fire_table_columns`, in the nested {domain:value} form stored in the TinyDB.
+	'''
+	ndomains = len( fires[ 'domains' ] )
+	number = np.bincount( fires[ 'domain' ], minlength=ndomains )
+	total = np.bincount( fires[ 'domain' ], weights=fires[ 'pixels' ], minlength=ndomains ).astype( np.int64 )
+	order = np.argsort( fires[ 'domain' ], kind='stable' )
+	sizes = np.split( fires[ 'pixels' ][ order ], np.cumsum( number )[ :-1 ] )
+	out = { 'all_fire_sizes':{}, 'avg_fire_size':{}, 'number_of_fires':{}, 'total_area_burned':{} }
+	for code, name in enumerate( fires[ 'domains' ] ):
+		out[ 'all_fire_sizes' ][ name ] = sizes[ code ].tolist()
+		out[ 'avg_fire_size' ][ name ] = round( float( total[ code ] ) / number[ code ], 2 ) if number[ code ] > 0 else 0
+		out[ 'number_of_fires' ][ name ] = int( number[ code ] )
+		out[ 'total_area_burned' ][ name ] = int( total[ code ] )
+	return out
+
+
+class FireTable( object ):
+	'''
+	columnar table of every fire x sub-domain of a post processing run, with the
+	columns replicate, year, fire_id, domain, pixels and optionally veg (dominant
+	pre-fire vegetation) and severity (mean burn severity).
+
+	replicate and domain are stored as integer codes into the `replicates` and
+	`domains` label lists. Timesteps that had no fires are kept in `timesteps` so
+	that the derived metrics are 0 rather than missing for them.
+	'''
+	COLUMNS = [ 'replicate', 'year', 'fire_id', 'domain', 'pixels', 'veg', 'severity' ]
+	DTYPES = { 'replicate':np.int32, 'year':np.int32, 'fire_id':np.int32, 'domain':np.int16,
+				'pixels':np.int32, 'veg':np.uint8, 'severity':np.float32 }
+
+	def __init__( self, columns, replicates, domains, timesteps, *args, **kwargs ):
+		'''
+		Arguments:
+		----------
+		columns = [dict] column name:numpy.ndarray of equal length. see COLUMNS.
+		replicates = [list] replicate labels, the `replicate` column holds indices into it.
+		domains = [list] domain names, the `domain` column holds indices into it.
+		timesteps = [tuple] ( replicate codes, years ) of every timestep processed.
+
+		Returns:
+		--------
+		object of type alfresco_postprocessing.FireTable
+
+		'''
+		self.columns = { name:np.asarray( arr, dtype=self.DTYPES[ name ] ) for name, arr in columns.items() }
+		self.replicates = [ str( r ) for r in replicates ]
+		self.domains = [ str( d ) for d in domains ]
+		self.timesteps = ( np.asarray( timesteps[0], dtype=np.int32 ), np.asarray( timesteps[1], dtype=np.int32 ) )
+
+	def __len__( self ):
+		return len( self.columns[ 'fire_id' ] )
+
+	def __getitem__( self, name ):
+		return self.columns[ name ]
+
+	@classmethod
+	def from_timesteps( cls, timesteps ):
+		'''
+		build a FireTable from a list of per-timestep dicts holding `replicate`, `year`
+		and the output of `fire_table_columns`.
+		'''
+		from alfresco_postprocessing.postprocess import _sorted_labels
+		replicates = _sorted_labels( [ str( ts[ 'replicate' ] ) for ts in timesteps ] )
+		rep_codes = { r:i for i, r in enumerate( replicates ) }
+		domains = []
+		for ts in timesteps:
+			domains.extend( d for d in ts[ 'domains' ] if d not in domains )
+		dom_codes = { d:i for i, d in enumerate( domains ) }
+		names = [ name for name in cls.COLUMNS[ 2: ] if all( name in ts for ts in timesteps ) ] if len( timesteps ) > 0 else []
+
+		cols = { name:[] for name in [ 'replicate', 'year' ] + names }
+		ts_reps, ts_years = [], []
+		for ts in timesteps:
+			n = len( ts[ 'fire_id' ] )
+			rep, year = rep_codes[ str( ts[ 'replicate' ] ) ], int( ts[ 'year' ] )
+			ts_reps.append( rep ); ts_years.append( year )
+			cols[ 'replicate' ].append( np.full( n, rep, dtype=np.int32 ) )
+			cols[ 'year' ].append( np.full( n, year, dtype=np.int32 ) )
+			# local domain codes -> table wide codes
+			remap = np.array( [ dom_codes[ d ] for d in ts[ 'domains' ] ], dtype=np.int16 )
+			for name in names:
+				cols[ name ].append( remap[ ts[ name ] ] if name == 'domain' else ts[ name ] )
+		columns = { name:( np.concatenate( arrs ) if len( arrs ) > 0 else np.array( [] ) ) for name, arrs in cols.items() }
+		return cls( columns, replicates, domains, ( ts_reps, ts_years ) )
+
+	def save( self, fn ):
+		''' write the table to a compressed numpy .npz file '''
+		arrays = { 'col_' + name:arr for name, arr in self.columns.items() }
+		np.savez_compressed( fn, replicates=np.array( self.replicates, dtype=str ),
+							domains=np.array( self.domains, dtype=str ),
+							ts_replicate=self.timesteps[0], ts_year=self.timesteps[1], **arrays )
+		return fn
+
+	@classmethod
+	def load( cls, fn ):
+		''' read a table written with `save` '''
+		with np.load( fn ) as npz:
+			columns = { key[ 4: ]:npz[ key ] for key in npz.files if key.startswith( 'col_' ) }
+			return cls( columns, npz[ 'replicates' ].tolist(), npz[ 'domains' ].tolist(),
+						( npz[ 'ts_replicate' ], npz[ 'ts_year' ] ) )
+
+	def to_dataframe( self ):
+		''' the table as a pandas.DataFrame with replicate and domain labels '''
+		import pandas as pd
+		df = pd.DataFrame( self.columns )
+		df[ 'replicate' ] = np.array( self.replicates, dtype=object )[ self.columns[ 'replicate' ] ] if len( self ) > 0 else []
+		df[ 'domain' ] = np.array( self.domains, dtype=object )[ self.columns[ 'domain' ] ] if len( self ) > 0 else []
+		return df
+
+	def _grid( self ):
+		''' ( years, row index into the replicate x year x domain grid ) '''
+		years = np.unique( self.timesteps[1] )
+		year_idx = np.searchsorted( years, self.columns[ 'year' ] )
+		gid = ( self.columns[ 'replicate' ].astype( np.int64 ) * len( years ) + year_idx ) * len( self.domains ) + self.columns[ 'domain' ]
+		return years, gid
+
+	def metric_array( self, metric_name ):
+		'''
+		derive one of 'avg_fire_size', 'number_of_fires' or 'total_area_burned' as
+		a dense replicate x year x domain array with a vectorized groupby. Returns
+		( numpy.ndarray, coords ) in the same layout as `get_metric_array`, with NaN
+		for replicate / year combinations that were not processed.
+		'''
+		years, gid = self._grid()
+		shape = ( len( self.replicates ), len( years ), len( self.domains ) )
+		size = int( np.prod( shape ) )
+		number = np.bincount( gid, minlength=size ).reshape( shape ).astype( np.float64 )
+		total = np.bincount( gid, weights=self.columns[ 'pixels' ], minlength=size ).reshape( shape )
+		if metric_name == 'number_of_fires':
+			arr = number
+		elif metric_name == 'total_area_burned':
+			arr = total
+		elif metric_name == 'avg_fire_size':
+			with np.errstate( invalid='ignore', divide='ignore' ):
+				arr = np.where( number > 0, np.round( total / number, 2 ), 0.0 )
+		else:
+			raise ValueError( 'metric %s cannot be derived from the fire table' % metric_name )
+		# NaN where the timestep was never run
+		processed = np.zeros( shape[ :2 ], dtype=bool )
+		processed[ self.timesteps[0], np.searchsorted( years, self.timesteps[1] ) ] = True
+		arr[ ~processed ] = np.nan
+		coords = [ ( 'replicate', self.replicates ), ( 'year', years.tolist() ), ( 'domain', self.domains ) ]
+		return arr, coords
+
+	def all_fire_sizes( self ):
+		'''
+		ragged fire sizes as ( values, offsets, keys ): the sizes of group i are
+		values[ offsets[ i ]:offsets[ i + 1 ] ] and keys[ i ] is its
+		( replicate, year, domain ). Sizes within a group are ordered by fire_id.
+		'''
+		years, gid = self._grid()
+		order = np.lexsort( ( self.columns[ 'fire_id' ], gid ) )
+		groups, starts = np.unique( gid[ order ], return_index=True )
+		offsets = np.append( starts, len( order ) )
+		ndom, nyears = len( self.domains ), len( years )
+		keys = [ ( self.replicates[ g // ( nyears * ndom ) ], int( years[ ( g // ndom ) % nyears ] ), self.domains[ g % ndom ] ) for g in groups.tolist() ]
+		return self.columns[ 'pixels' ][ order ], offsets, keys
+
+	def to_records( self ):
+		'''
+		the fire metrics in the TinyDB record layout ( one dict per timestep with
+		`replicate`, `fire_year` and nested {domain:value} metrics ), so the table can
+		stand in for a database in `get_metric_arrays`, `to_cube_store` and friends.
+		'''
+		years = np.unique( self.timesteps[1] )
+		arrays = { name:self.metric_array( name )[0] for name in [ 'avg_fire_size', 'number_of_fires', 'total_area_burned' ] }
+		sizes = {}
+		values, offsets, keys = self.all_fire_sizes()
+		for i, key in enumerate( keys ):
+			sizes[ key ] = values[ offsets[ i ]:offsets[ i + 1 ] ].tolist()
+		records = []
+		for rep, year in zip( self.timesteps[0].tolist(), self.timesteps[1].tolist() ):
+			y = int( np.searchsorted( years, year ) )
+			replicate = self.replicates[ rep ]
+			rec = { 'replicate':replicate, 'fire_year':str( year ) }
+			rec[ 'all_fire_sizes' ] = { d:sizes.get( ( replicate, year, d ), [] ) for d in self.domains }
+			rec[ 'avg_fire_size' ] = { d:float( arrays[ 'avg_fire_size' ][ rep, y, i ] ) for i, d in enumerate( self.domains ) }
+			for name in [ 'number_of_fires', 'total_area_burned' ]:
+				rec[ name ] = { d:int( arrays[ name ][ rep, y, i ] ) for i, d in enumerate( self.domains ) }
+			records.append( rec )
+		return records
+
+def read_fire_table( fn ):
+	''' open a FireTable written by run_postprocessing( ..., fire_table_fn=fn ) '''
+	return FireTable.load( fn )
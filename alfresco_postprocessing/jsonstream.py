@@ -0,0 +1,170 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING STREAMING TinyDB JSON READER
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import json
+import numpy as np
+
+# keys identifying a record, kept whatever metrics are requested
+RECORD_KEYS = [ 'replicate', 'fire_year', 'av_year', 'year' ]
+
+class _JSONStream( object ):
+	'''
+	incremental tokenizer over a JSON file: only the unconsumed tail of the current
+	chunk is held in memory, plus whatever value is being decoded.
+	'''
+	def __init__( self, f, chunk_size ):
+		self.f = f
+		self.chunk_size = chunk_size
+		self.buf = ''
+		self.pos = 0
+		self.decoder = json.JSONDecoder()
+
+	def _fill( self, size=None ):
+		data = self.f.read( size or self.chunk_size )
+		if not data:
+			return False
+		self.buf = self.buf[ self.pos: ] + data
+		self.pos = 0
+		return True
+
+	def peek( self ):
+		''' next non-whitespace character, '' at the end of the file '''
+		while True:
+			while self.pos < len( self.buf ) and self.buf[ self.pos ] in ' \t\n\r':
+				self.pos += 1
+			if self.pos < len( self.buf ):
+				return self.buf[ self.pos ]
+			if not self._fill():
+				return ''
+
+	def expect( self, char ):
+		found = self.peek()
+		if found != char:
+			raise ValueError( 'malformed TinyDB JSON: expected %r, found %r' % ( char, found ) )
+		self.pos += 1
+
+	def decode( self ):
+		''' decode the next value, reading more of the file until it is complete '''
+		self.peek()
+		size = self.chunk_size
+		while True:
+			try:
+				value, end = self.decoder.raw_decode( self.buf, self.pos )
+				self.pos = end
+				return value
+			except json.JSONDecodeError:
+				# incomplete value -- read more, doubling so huge records stay linear
+				if not self._fill( size ):
+					raise
+				size *= 2
+
+def iter_records( json_fn, metrics=None, table='_default', chunk_size=2**22 ):
+	'''
+	stream the records of an ALFRESCO Post Processing output TinyDB JSON file one at
+	a time, without loading the whole document.
+
+	Arguments:
+	----------
+	json_fn = [str] path to the TinyDB JSON file.
+	metrics = [list] metric names to keep in each record ( replicate, fire_year and
+		av_year are always kept ). default:None (all)
+	table = [str] TinyDB table to read. default:'_default'
+	chunk_size = [int] number of characters read from the file at a time. default:2**22
+
+	Returns:
+	--------
+	generator of record dicts, in the same order as `TinyDB( json_fn ).all()`.
+
+	'''
+	keep = None if metrics is None else set( metrics ) | set( RECORD_KEYS )
+	with open( json_fn, 'r' ) as f:
+		stream = _JSONStream( f, chunk_size )
+		if stream.peek() == '':
+			return # empty file, as TinyDB leaves it before the first insert
+		stream.expect( '{' )
+		while stream.peek() not in ( '}', '' ):
+			name = stream.decode()
+			stream.expect( ':' )
+			if name != table:
+				stream.decode() # skip other tables
+			else:
+				stream.expect( '{' )
+				while stream.peek() != '}':
+					stream.decode() # the document id
+					stream.expect( ':' )
+					record = stream.decode()
+					if keep is not None:
+						record = { key:value for key, value in record.items() if key in keep }
+					yield record
+					if stream.peek() == ',':
+						stream.pos += 1
+				stream.pos += 1
+			if stream.peek() == ',':
+				stream.pos += 1
+
+def read_records( json_fn, metrics=None, table='_default', chunk_size=2**22 ):
+	''' list version of `iter_records` '''
+	return list( iter_records( json_fn, metrics=metrics, table=table, chunk_size=chunk_size ) )
+
+def _record_fire_sizes( record ):
+	''' the all_fire_sizes of a record as FireTable.from_timesteps columns, fire_id is the position in the list '''
+	domains = list( record[ 'all_fire_sizes' ].keys() )
+	sizes = [ record[ 'all_fire_sizes' ][ d ] for d in domains ]
+	counts = [ len( s ) for s in sizes ]
+	pixels = np.fromiter( ( v for s in sizes for v in s ), dtype=np.int32, count=sum( counts ) )
+	return { 'replicate':record[ 'replicate' ], 'year':int( record.get( 'fire_year', record.get( 'year' ) ) ),
+			'domains':domains, 'domain':np.repeat( np.arange( len( domains ), dtype=np.int16 ), counts ),
+			'fire_id':np.concatenate( [ np.arange( 1, n + 1, dtype=np.int32 ) for n in counts ] ) if len( counts ) > 0 else np.array( [], dtype=np.int32 ),
+			'pixels':pixels }
+
+def tinydb_to_store( json_fn, store_fn=None, fire_table_fn=None, metrics=None, format=None, chunk_size=2**22 ):
+	'''
+	convert an existing TinyDB JSON output in one streaming pass to a NetCDF / Zarr
+	metric store ( see `to_cube_store` ) and / or a FireTable .npz of its
+	all_fire_sizes ( see `read_fire_table` ). Only the dense metrics and the fire
+	sizes as compact integer arrays are held in memory, never the parsed document.
+
+	Arguments:
+	----------
+	json_fn = [str] path to the TinyDB JSON file.
+	store_fn = [str] output metric store, `.zarr` for Zarr else NetCDF. default:None (not written)
+	fire_table_fn = [str] output fire table .npz. The fire_id column is the position
+		of the fire in the stored list, as the TinyDB does not keep ids. veg and
+		severity are not available. default:None (not written)
+	metrics = [list] metrics for the store. default:None (all supported metrics present)
+	format = [str] 'zarr' or 'netcdf' to override the extension-based choice. default:None
+	chunk_size = [int] see `iter_records`.
+
+	Returns:
+	--------
+	dict with the paths written under 'store' and 'fire_table'.
+
+	'''
+	from alfresco_postprocessing.export import DEFAULT_STORE_METRICS, to_cube_store
+	from alfresco_postprocessing.firetable import FireTable
+	if store_fn is None and fire_table_fn is None:
+		raise ValueError( 'give store_fn and / or fire_table_fn' )
+	store_metrics = DEFAULT_STORE_METRICS if metrics is None else metrics
+	keep = list( store_metrics ) if store_fn is not None else []
+	if fire_table_fn is not None:
+		keep.append( 'all_fire_sizes' )
+
+	records, timesteps = [], []
+	for record in iter_records( json_fn, metrics=keep, chunk_size=chunk_size ):
+		if fire_table_fn is not None:
+			if 'all_fire_sizes' not in record:
+				raise ValueError( 'all_fire_sizes was not stored in %s' % json_fn )
+			timesteps.append( _record_fire_sizes( record ) )
+			del record[ 'all_fire_sizes' ]
+		if store_fn is not None:
+			if 'fire_year' not in record and 'year' in record:
+				record[ 'fire_year' ] = record[ 'year' ]
+			records.append( record )
+
+	out = {}
+	if store_fn is not None:
+		present = [ m for m in store_metrics if len( records ) > 0 and m in records[0] ]
+		out[ 'store' ] = to_cube_store( records, store_fn, metrics=present, format=format )
+	if fire_table_fn is not None:
+		out[ 'fire_table' ] = FireTable.from_timesteps( timesteps ).save( fire_table_fn )
+	return out
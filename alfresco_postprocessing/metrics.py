@@ -2,13 +2,14 @@
 # ALFRESCO POST-PROCESSING METRICS CLASSES
 # * * * * * * * * * * * * * * * * * * * * * * * * * * *
 import numpy as np
+from alfresco_postprocessing.firetable import fire_table_columns, fire_metrics
 
 class Fire( object ):
 	'''
 	calculate FireScar metrics from ALFRESCO Fire Dynamics Model 
 	output rasters across subdomains if applicable.
 	'''
-	def __init__( self, alf_ds, **kwargs ):
+	def __init__( self, alf_ds, veg_arr=None, severity_arr=None, **kwargs ):
 		'''
 		initialize fire scar data and calculate fire metrics
 
@@ -16,6 +17,10 @@ class Fire( object ):
 		----------
 		alf_ds = (AlfrescoDataset) an object of type AlfrescoDataset which contains
 				all needed attributes to run the fire metrics.
+		veg_arr = (numpy.ndarray) vegetation of the previous year. if given the dominant
+				pre-fire vegetation of each fire is added to `fires`. default:None
+		severity_arr = (numpy.ndarray) BurnSeverity of the same year. if given the mean
+				severity of each fire is added to `fires`. default:None
 
 		returns:
 		--------
@@ -24,28 +29,21 @@ class Fire( object ):
 
 		'''
 		self.alf_ds = alf_ds
+		# one row per fire x domain, everything else is derived from it
+		self.fires = fire_table_columns( alf_ds, veg_arr=veg_arr, severity_arr=severity_arr )
 		self.fire_counts = self._unique_counts_domains( )
-		self.all_fire_sizes = self._all_fire_sizes( )
-		self.avg_fire_size = self._avg_fire_size( )
-		self.number_of_fires = self._number_of_fires( )
-		self.total_area_burned = self._total_area_burned( )
+		metrics = fire_metrics( self.fires )
+		self.all_fire_sizes = metrics[ 'all_fire_sizes' ]
+		self.avg_fire_size = metrics[ 'avg_fire_size' ]
+		self.number_of_fires = metrics[ 'number_of_fires' ]
+		self.total_area_burned = metrics[ 'total_area_burned' ]
 
-	def _all_fire_sizes( self, *args, **kwargs ):
-		return { i:self.fire_counts[ i ].values() for i in self.fire_counts.keys() }
-	def _avg_fire_size( self, *args, **kwargs ):
-		return { i:( np.round( np.average( self.all_fire_sizes[ i ]), decimals=2 ) \
-					if len(self.all_fire_sizes[ i ]) > 0 else 0 ) for i in self.all_fire_sizes }
-	def _number_of_fires( self, *args, **kwargs ):
-		return { i:len( self.fire_counts[ i ].values() ) for i in self.fire_counts.keys() }
-	def _total_area_burned( self, *args, **kwargs ):
-		return { i:np.sum( self.fire_counts[ i ].values() ) for i in self.fire_counts.keys() }
 	def _unique_counts_domains( self ):
-		domains = self.alf_ds.sub_domains.sub_domains
-		domains = [ (np.unique( domain[domain > 0] )[0], domain) for domain in domains ]
-		raster_arr = self.alf_ds.raster_arr
-		return { self.alf_ds.sub_domains.names_dict[domain_num]:\
-					dict( zip( *np.unique( raster_arr[ (domain == domain_num) & (raster_arr > 0) ], return_counts=True ) ) ) \
-					for domain_num, domain in domains } # changed (raster_arr > 0) from (raster_arr >= 0)  WATCH IT!
+		''' {domain:{fire_id:pixels}} '''
+		fires = self.fires
+		return { name:dict( zip( fires[ 'fire_id' ][ fires[ 'domain' ] == code ].tolist(),
+								fires[ 'pixels' ][ fires[ 'domain' ] == code ].tolist() ) ) \
+					for code, name in enumerate( fires[ 'domains' ] ) }
 
 
 class Veg( object ):
@@ -79,9 +77,69 @@ class Veg( object ):
 		hold = { self.alf_ds.sub_domains.names_dict[domain_num]:\
 					dict( zip( *np.unique( raster_arr[ domain == domain_num ], return_counts=True ) ) ) \
 					for domain_num, domain in domains }
-		return { k:{ self.veg_name_dict[int(vegtype)]:v[int(vegtype)] \
-					for vegtype in v.keys() if vegtype in self.veg_name_dict.keys() } \
-					for k,v in hold.iteritems() }
+		return { k:{ self.veg_name_dict[int(vegtype)]:int( v[vegtype] ) \
+					for vegtype in v.keys() if int(vegtype) in self.veg_name_dict.keys() } \
+					for k,v in hold.items() }
+
+
+class VegTransition( object ):
+	'''
+	calculate the year-over-year vegetation transitions ( veg t-1 -> veg t ) from
+	ALFRESCO Fire Dynamics Model output Veg rasters across subdomains if applicable.
+	'''
+	def __init__( self, alf_ds, lag_arr=None, nodata=255, **kwargs ):
+		'''
+		initialize vegetation data and count the transitions from the previous year
+
+		Arguments:
+		----------
+		alf_ds = (AlfrescoDataset) a Veg dataset. The previous year is found with
+				`alf_ds.veglag` ( AlfrescoDataset._get_lag ).
+		lag_arr = (numpy.ndarray) the previous years Veg if it has already been read.
+				default:None (read from alf_ds.veglag)
+		nodata = (int) veg value that is left out of the counts. default:255
+
+		returns:
+		--------
+		object of class VegTransition with `transitions` holding, per domain, the
+		non-zero cells of the transition count matrix as columns
+		{ 'from':[...], 'to':[...], 'count':[...] }. These are empty for the first
+		year of a replicate, where there is no previous year.
+
+		'''
+		self.alf_ds = alf_ds
+		self.nodata = nodata
+		self.lag_arr = lag_arr if lag_arr is not None else self._read_lag( )
+		self.transitions = self._transition_counts_domains( )
+
+	def _read_lag( self ):
+		import os, rasterio
+		if not os.path.exists( self.alf_ds.veglag ):
+			return None
+		with rasterio.open( self.alf_ds.veglag ) as rst:
+			return rst.read( 1 )
+
+	def _transition_counts_domains( self ):
+		domains = self.alf_ds.sub_domains.sub_domains
+		domains = [ (np.unique( domain[domain > 0] )[0], domain) for domain in domains ]
+		names = self.alf_ds.sub_domains.names_dict
+		if self.lag_arr is None:
+			return { names[domain_num]:{ 'from':[], 'to':[], 'count':[] } for domain_num, domain in domains }
+
+		prev = self.lag_arr.astype( np.int64 )
+		cur = self.alf_ds.raster_arr.astype( np.int64 )
+		nclasses = int( max( prev.max(), cur.max(), self.nodata ) ) + 1
+		valid = ( prev != self.nodata ) & ( cur != self.nodata )
+		# joint ( from, to ) code of every pixel, counted in one bincount per domain
+		joint = prev * nclasses + cur
+		out = {}
+		for domain_num, domain in domains:
+			counts = np.bincount( joint[ valid & ( domain == domain_num ) ], minlength=nclasses * nclasses )
+			nonzero = np.flatnonzero( counts )
+			out[ names[domain_num] ] = { 'from':( nonzero // nclasses ).tolist(),
+										'to':( nonzero % nclasses ).tolist(),
+										'count':counts[ nonzero ].tolist() }
+		return out
 
 
 class VegFire( object ):
@@ -176,7 +234,9 @@ class BurnSeverity( object ):
 		domains = self.alf_ds.sub_domains.sub_domains
 		domains = [ (np.unique( domain[domain > 0] )[0], domain) for domain in domains ]
 		raster_arr = self.alf_ds.raster_arr
+		# plain str:int so the counts serialize to json, where keys are strings anyway
 		return { self.alf_ds.sub_domains.names_dict[domain_num]:\
-					dict( zip( *np.unique( raster_arr[ (domain == domain_num) & (raster_arr > 0) & (raster_arr != 255) ], return_counts=True ) ) ) \
+					{ str( int( severity ) ):int( count ) for severity, count in \
+					zip( *np.unique( raster_arr[ (domain == domain_num) & (raster_arr > 0) & (raster_arr != 255) ], return_counts=True ) ) } \
 					for domain_num, domain in domains }
 
@@ -0,0 +1,202 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING CONCURRENCY PLANNER
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import os, warnings
+
+# rough estimate of the working set of a timestep per pixel, on top of the sub_domains:
+# the band reads plus the labeling and per-domain temporaries of Fire, Veg and
+# BurnSeverity. The fire table and veg transitions ( previous year Veg, per-fire
+# columns ) about double it. These are estimates, not measurements; compare them
+# with the `worker_max_rss` of a run with profile=True on a large grid.
+TIMESTEP_BYTES_PER_PIXEL = 24
+FIRE_TABLE_BYTES_PER_PIXEL = 24
+# python + numpy + rasterio + pandas in a worker
+WORKER_OVERHEAD_MB = 150
+# variables read for each timestep by `_open_timestep`
+_TIMESTEP_VARIABLES = [ 'FireScar', 'Veg', 'BurnSeverity' ]
+# numerical library thread pools that multiply with the worker processes. They are
+# sized when numpy is imported, so they have to be set before python starts
+THREAD_ENV_VARS = [ 'OPENBLAS_NUM_THREADS', 'OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS' ]
+
+def _cgroup_memory_mb( ):
+	''' memory limit of the cgroup ( e.g. a slurm job ) this process runs in, None if unlimited '''
+	for fn in ( '/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes' ):
+		try:
+			with open( fn ) as f:
+				value = f.read().strip()
+		except OSError:
+			continue
+		if value.isdigit() and int( value ) < 2**60:
+			return int( value ) / 2.0**20
+	return None
+
+def available_memory_mb( ):
+	'''
+	memory available to this process in MB: MemAvailable of the machine, capped by the
+	cgroup limit of a slurm job or container ( total memory where /proc is missing ).
+	'''
+	available = None
+	try:
+		with open( '/proc/meminfo' ) as f:
+			for line in f:
+				if line.startswith( 'MemAvailable:' ):
+					available = int( line.split()[1] ) / 1024.0
+	except OSError:
+		pass
+	if available is None:
+		available = os.sysconf( 'SC_PAGE_SIZE' ) * os.sysconf( 'SC_PHYS_PAGES' ) / 2.0**20
+	limit = _cgroup_memory_mb()
+	return available if limit is None else min( available, limit )
+
+def available_cpus( ):
+	''' cpus this process may run on ( the slurm / taskset affinity ), else the cpu count '''
+	if hasattr( os, 'sched_getaffinity' ):
+		return len( os.sched_getaffinity( 0 ) )
+	return os.cpu_count()
+
+class RunPlan( object ):
+	'''
+	the number of worker processes, prefetch depth and chunk size
+	chosen for a post processing run, with the estimates they are based on.
+	'''
+	def __init__( self, ncores, chunksize, prefetch, prefetch_threads, worker_mb,
+		parent_mb, mem_budget_mb, ncpus, ntimesteps, shape, ndomains, limited_by, *args, **kwargs ):
+		self.ncores = ncores
+		self.chunksize = chunksize
+		self.prefetch = prefetch
+		self.prefetch_threads = prefetch_threads
+		self.worker_mb = worker_mb
+		self.parent_mb = parent_mb
+		self.mem_budget_mb = mem_budget_mb
+		self.ncpus = ncpus
+		self.ntimesteps = ntimesteps
+		self.shape = shape
+		self.ndomains = ndomains
+		self.limited_by = limited_by
+
+	@property
+	def total_mb( self ):
+		''' estimated peak memory of the run '''
+		return self.parent_mb + self.ncores * self.worker_mb
+
+	def env( self ):
+		'''
+		one thread for each numerical library pool: numpy's work here is elementwise, so
+		more threads only oversubscribe the cpus the workers use. For the environment of
+		a job ( e.g. `write_campaign( env=plan.env() )` ), as setting them in a running
+		python has no effect on numpy.
+		'''
+		return { name:'1' for name in THREAD_ENV_VARS }
+
+	def to_dict( self ):
+		out = dict( self.__dict__ )
+		out.update( total_mb=self.total_mb, env=self.env() )
+		return out
+
+	def report( self ):
+		return '\n'.join([
+			'ALFRESCO post processing plan:',
+			'  %d timesteps of %d x %d pixels, %d sub-domains' % ( ( self.ntimesteps, ) + tuple( self.shape ) + ( self.ndomains, ) ),
+			'  %d cpus, %.0f MB memory budget' % ( self.ncpus, self.mem_budget_mb ),
+			'  ~%.0f MB per worker, ~%.0f MB in the parent, ~%.0f MB in total' % ( self.worker_mb, self.parent_mb, self.total_mb ),
+			'  %d worker processes ( limited by %s )' % ( self.ncores, self.limited_by ),
+			'  chunksize %d, prefetch %d on %d thread(s)' % ( self.chunksize, self.prefetch, self.prefetch_threads ) ])
+
+	def __repr__( self ):
+		return 'RunPlan( ncores=%d, chunksize=%d, prefetch=%d, prefetch_threads=%d )' % \
+				( self.ncores, self.chunksize, self.prefetch, self.prefetch_threads )
+
+def plan_run( maps_path=None, timesteps=None, raster_fn=None, sub_domains=None, ndomains=None, ntimesteps=None, fire_table=False,
+	veg_transitions=False, mem_mb=None, ncpus=None, prefetch=None, memory_fraction=0.8, overhead_mb=WORKER_OVERHEAD_MB ):
+	'''
+	choose the worker processes, prefetch depth and chunk size of
+	a post processing run from the raster dimensions and dtypes, the number of
+	sub-domains and timesteps, and the memory and cpus available, so that big grids
+	do not run out of memory and small ones use the whole node.
+
+	Arguments:
+	----------
+	maps_path = [str] ALFRESCO output Maps directory, to count the timesteps and read
+		the raster dimensions and dtypes. default:None (give timesteps, or raster_fn and ntimesteps)
+	timesteps = [list] TimeStep objects of a FileLister, instead of maps_path. default:None
+	raster_fn = [str] a raster of the run, for its dimensions. default:None (from maps_path)
+	sub_domains = sub-domains object from `read_subdomains`, for its size. default:None
+		(ndomains full size uint8 arrays)
+	ndomains = [int] number of sub-domains if sub_domains is not given. default:None (1)
+	ntimesteps = [int] number of timesteps. default:None (from maps_path)
+	fire_table, veg_transitions = [bool] whether the run builds the per-fire table
+		and / or the veg transitions, which need more memory. default:False
+	mem_mb = [float] memory budget in MB. default:None (`available_memory_mb()`)
+	ncpus = [int] cpus to use. default:None (`available_cpus()`)
+	prefetch = [int] prefetch depth. default:None (1 when spare cpus and memory allow,
+		else 0)
+	memory_fraction = [float] share of the memory budget the estimates may fill. default:0.8
+	overhead_mb = [float] memory of an idle worker process in MB. default:150
+
+	Returns:
+	--------
+	alfresco_postprocessing.RunPlan
+
+	'''
+	import numpy as np
+	import rasterio
+	read_bytes = 6 # int32 FireScar band + uint8 Veg + uint8 BurnSeverity
+	if timesteps is None and maps_path is not None:
+		from alfresco_postprocessing.postprocess import FileLister
+		timesteps = FileLister( maps_path ).timesteps
+		if len( timesteps ) == 0:
+			raise ValueError( 'no timesteps found in %s' % maps_path )
+	if timesteps is not None:
+		ntimesteps = len( timesteps ) if ntimesteps is None else ntimesteps
+		raster_fn = timesteps[0].FireScar.fn if raster_fn is None else raster_fn
+		read_bytes = 0
+		for variable in _TIMESTEP_VARIABLES:
+			with rasterio.open( getattr( timesteps[0], variable ).fn ) as rst:
+				band = 1 if variable == 'FireScar' and rst.count > 1 else 0 # FireScar fire ids are band 2
+				read_bytes += np.dtype( rst.dtypes[ band ] ).itemsize
+	if raster_fn is None or ntimesteps is None:
+		raise ValueError( 'give maps_path, timesteps, or raster_fn and ntimesteps' )
+	with rasterio.open( raster_fn ) as rst:
+		shape = ( rst.height, rst.width )
+	pixels = shape[0] * shape[1]
+
+	if sub_domains is not None:
+		ndomains = len( sub_domains.sub_domains )
+		sub_domains_mb = sum( np.asarray( arr ).nbytes for arr in sub_domains.sub_domains ) / 2.0**20
+	else:
+		ndomains = 1 if ndomains is None else ndomains
+		sub_domains_mb = ndomains * pixels / 2.0**20
+	timestep_mb = pixels * ( TIMESTEP_BYTES_PER_PIXEL + ( FIRE_TABLE_BYTES_PER_PIXEL if fire_table or veg_transitions else 0 ) ) / 2.0**20
+	read_mb = pixels * ( read_bytes + ( 1 if fire_table or veg_transitions else 0 ) ) / 2.0**20
+
+	mem_budget_mb = available_memory_mb() if mem_mb is None else mem_mb
+	ncpus = available_cpus() if ncpus is None else ncpus
+	usable_mb = mem_budget_mb * memory_fraction
+	# the parent holds the sub_domains it sends and the records coming back
+	parent_mb = overhead_mb + sub_domains_mb
+
+	def worker_mb( depth ):
+		return overhead_mb + sub_domains_mb + timestep_mb + depth * read_mb
+
+	fit = int( ( usable_mb - parent_mb ) // worker_mb( 0 ) )
+	ncores = max( 1, min( ncpus, ntimesteps, fit ) )
+	if fit <= min( ncpus, ntimesteps ):
+		limited_by = 'memory'
+	else:
+		limited_by = 'cpus' if ncpus <= ntimesteps else 'timesteps'
+	if fit < 1:
+		warnings.warn( 'one worker ( ~%.0f MB ) and the parent ( ~%.0f MB ) may not fit in the %.0f MB memory budget' % \
+					( worker_mb( 0 ), parent_mb, usable_mb ), RuntimeWarning )
+
+	# cpus left over ( memory or timestep bound ) read ahead on prefetch threads, if
+	# the workers get runs of timesteps and the read-ahead still fits
+	spare = ncpus - ncores
+	if prefetch is None:
+		prefetch = min( 2, spare // ncores ) if ntimesteps > ncores else 0
+		while prefetch > 0 and parent_mb + ncores * worker_mb( prefetch ) > usable_mb:
+			prefetch -= 1
+	prefetch_threads = max( 1, min( prefetch, spare // ncores ) )
+	# a few chunks per worker to balance the load, as multiprocessing.Pool.map does
+	chunksize = max( 1, -( -ntimesteps // ( ncores * 4 ) ) )
+	return RunPlan( ncores, chunksize, prefetch, prefetch_threads, worker_mb( prefetch ), parent_mb,
+				mem_budget_mb, ncpus, ntimesteps, shape, ndomains, limited_by )
@@ -1,22 +1,38 @@
-import matplotlib
-matplotlib.use( 'Agg' )
-import pandas as pd
 import numpy as np
 import alfresco_postprocessing as ap
-import seaborn as sns
+
+def _seaborn( ):
+	'''
+	import seaborn (and matplotlib with the Agg backend) on first use instead of
+	at package import, which every spawned pool worker pays for.
+	'''
+	import sys, matplotlib
+	if 'matplotlib.pyplot' not in sys.modules:
+		matplotlib.use( 'Agg' )
+	import seaborn as sns
+	return sns
+
+# metrics a Plot keeps in memory by default
+PLOT_METRICS = [ 'avg_fire_size', 'number_of_fires', 'total_area_burned', 'veg_counts', 'severity_counts' ]
 
 class Plot( object ):
 	'''
 	class for storing data attributes and methods to abstract some of the
 	ugliness of plotting the ALFRESCO Post Processing outputs.
 	'''
-	def __init__( self, json_fn, model, scenario, *args, **kwargs ):
+	def __init__( self, json_fn, model, scenario, cache_bytes=2**30, metrics=None, *args, **kwargs ):
 		'''
 		Arguments:
 		----------
 		json_fn = [str] path to the alfresco_postprocessing output TinyDB JSON database file
 		model = [str] name of the model being processed (used in naming)
 		scenario = [str] name of the scenario being processed (used in naming)
+		cache_bytes = [int] approximate memory cap of the cached metric DataFrames. The
+			least recently used metrics are dropped beyond it. default:2**30 (1GB)
+		metrics = [list] only keep these metrics of each record in memory. The records
+			are streamed from json_fn. default:None (the dense metrics, see PLOT_METRICS.
+			'all_fire_sizes' is then read from json_fn when it is asked for rather than
+			kept, as it grows with the number of fires)
 
 		Returns:
 		--------
@@ -24,11 +40,23 @@ class Plot( object ):
 				
 		'''
 		from tinydb import TinyDB
+		from collections import OrderedDict
 		self.json_fn = json_fn
 		self.db = TinyDB( self.json_fn )
-		self.records = self.db.all()
 		self.model = model
 		self.scenario = scenario
+		self.cache_bytes = cache_bytes
+		self.metrics = metrics
+		self._cache = OrderedDict()
+		self._cache_sizes = {}
+		self._load_records()
+
+	def _load_records( self ):
+		from alfresco_postprocessing.jsonstream import read_records
+		metrics = PLOT_METRICS if self.metrics is None else self.metrics
+		self.records = read_records( self.json_fn, metrics=metrics )
+		if len( self.records ) == 0:
+			raise ValueError( 'no records found in %s' % self.json_fn )
 		self.fire_years = self._get_fire_years()
 
 		if 'av_year' in self.records[0].keys():
@@ -38,11 +66,11 @@ class Plot( object ):
 		self.domains = self._get_domains()
 
 	def _get_fire_years( self ):
-		years = np.unique( [ rec['fire_year'] for rec in self.records ] ).astype( np.int )
+		years = np.unique( [ rec['fire_year'] for rec in self.records ] ).astype( int )
 		years.sort()
 		return years.astype( str )
 	def _get_av_years( self ):
-		years = np.unique( [ rec['av_year'] for rec in self.records ] ).astype( np.int )
+		years = np.unique( [ rec['av_year'] for rec in self.records ] ).astype( int )
 		years.sort()
 		return years.astype( str )
 	def _get_replicates( self ):
@@ -51,40 +79,271 @@ class Plot( object ):
 		return replicates
 	def _get_domains( self ):
 		record = self.records[0]
-		metric = record.keys()[0]
-		return record[ metric ].keys()
+		metric = [ key for key, value in record.items() if isinstance( value, dict ) and len( value ) > 0 ][0]
+		return list( record[ metric ].keys() )
+	def _dense_metrics( self ):
+		''' the metrics in the records that can be built in one get_metric_arrays pass '''
+		from alfresco_postprocessing.postprocess import SCALAR_METRICS, CLASS_METRICS
+		record = self.records[0]
+		return [ name for name in SCALAR_METRICS + list( CLASS_METRICS ) if name in record ]
 	def get_metric_dataframes( self, metric_name ):
 		'''
 		output a dict of pandas.DataFrame objects representing the 
 		data of type metric_name in key:value pairs of 
 		domainname:corresponding_DataFrame
 
+		The frames are cached. On the first request every dense metric of the
+		database ( all but 'all_fire_sizes' ) is reshaped in a single pass over the
+		records, so later requests for any metric are free until `invalidate`. The
+		cached frames are shared between callers, treat them as read only.
+
 		Arguments:
 		----------
 		metric_name = [str] metric name to be converted to pandas DataFrame obj(s).
 
 		Returns:
 		--------
-		dict of pandas DataFrame objects from the output alfresco TinyDB json file
-		for the desired metric_name
+		dict of pandas DataFrame objects ( index of years as str, a column per
+		replicate ) from the output alfresco TinyDB json file for the desired
+		metric_name. 'veg_counts' is nested one more level as { domain:{ vegtype:DataFrame } }.
+		'''
+		if metric_name in self._cache:
+			self._cache.move_to_end( metric_name )
+			return self._cache[ metric_name ]
+
+		if metric_name == 'all_fire_sizes':
+			frames = { metric_name:self._fire_size_frames() }
+		else:
+			if metric_name not in self._dense_metrics():
+				raise ValueError( 'metric %s not found in %s' % ( metric_name, self.json_fn ) )
+			names = [ name for name in self._dense_metrics() if name not in self._cache ]
+			frames = _metric_frames( self, names )
+		for name, value in frames.items():
+			self._cache[ name ] = value
+			self._cache_sizes[ name ] = _frames_nbytes( value )
+		self._cache.move_to_end( metric_name )
+		self._evict( keep=metric_name )
+		return self._cache[ metric_name ]
+
+	def _fire_size_frames( self ):
+		''' year x replicate DataFrames of fire size lists per domain '''
+		import pandas as pd
+		from alfresco_postprocessing.firesizes import ragged_fire_sizes
+		values, offsets, coords, processed = ragged_fire_sizes( _fire_size_records( self ) )
+		replicates, years, domains = [ labels for dim, labels in coords ]
+		cells = np.split( values, offsets[ 1:-1 ] )
+		shape = ( len( replicates ), len( years ), len( domains ) )
+		frames = {}
+		for d, domain in enumerate( domains ):
+			data = { rep:[ cells[ ( r * shape[1] + y ) * shape[2] + d ].tolist() for y in range( shape[1] ) ]
+						for r, rep in enumerate( replicates ) }
+			frames[ domain ] = pd.DataFrame( data, index=[ str( y ) for y in years ], columns=replicates )
+		return frames
+
+	def _evict( self, keep=None ):
+		''' drop least recently used metrics until the cache is under cache_bytes '''
+		while sum( self._cache_sizes.values() ) > self.cache_bytes and len( self._cache ) > 1:
+			name = next( iter( self._cache ) )
+			if name == keep:
+				break
+			del self._cache[ name ]
+			del self._cache_sizes[ name ]
+
+	def invalidate( self, metric_name=None, reload=False ):
 		'''
-		from collections import defaultdict
-		metric_select = ap.get_metric_json( self.db, metric_name )
-		panel = pd.Panel( metric_select )
-
-		dd = defaultdict( lambda: defaultdict( lambda: defaultdict ) )
-		for domain in self.domains:
-			if metric_name != 'veg_counts': # fire
-				dd[ domain ] = panel[ :, domain, : ]
-
-			if metric_name == 'veg_counts': # veg
-				df = panel[ :, domain, : ]
-				vegtypes = sorted( df.ix[0,0].keys() )
-				new_panel = pd.Panel( df.to_dict() )
-				for vegtype in vegtypes:
-					# subset the data again into vegetation types
-					dd[ domain ][ vegtype ] = new_panel[ :, vegtype, : ]
-		return dd
+		drop cached metric DataFrames, e.g. after the database was added to.
+
+		Arguments:
+		----------
+		metric_name = [str] metric to drop. default:None (all)
+		reload = [bool] also re-read the records ( and years, replicates, domains )
+			from the database. default:False
+		'''
+		if metric_name is None or reload:
+			self._cache.clear()
+			self._cache_sizes.clear()
+		elif metric_name in self._cache:
+			del self._cache[ metric_name ]
+			del self._cache_sizes[ metric_name ]
+		if reload:
+			self._load_records()
+
+def _frames_nbytes( frames ):
+	''' approximate memory use of a ( possibly nested ) dict of DataFrames '''
+	if isinstance( frames, dict ):
+		return sum( _frames_nbytes( value ) for value in frames.values() )
+	nbytes = int( frames.memory_usage( index=True ).sum() )
+	if ( frames.dtypes == object ).any():
+		# lists of fire sizes, ~8 bytes per list pointer plus ~28 per python int
+		nbytes += 36 * sum( len( cell ) for cell in frames.values.ravel() if isinstance( cell, list ) )
+	return nbytes
+
+def _get_records( obj ):
+	''' records from a Plot object, a TinyDB or a list of records '''
+	if hasattr( obj, 'records' ):
+		return obj.records
+	if hasattr( obj, 'all' ):
+		return obj.all()
+	return obj
+
+def _fire_size_records( obj ):
+	''' records holding all_fire_sizes, streamed from the file of a Plot that did not keep them '''
+	if hasattr( obj, 'json_fn' ) and len( obj.records ) > 0 and 'all_fire_sizes' not in obj.records[0]:
+		return obj.json_fn
+	return _get_records( obj )
+
+def _metric_frames( obj, metric_names ):
+	'''
+	the per domain year x replicate DataFrames of `Plot.get_metric_dataframes` for
+	several metrics from a single `get_metric_arrays` pass over the records.
+	Returns { metric_name:{ domain:DataFrame } } and, for 'veg_counts',
+	{ metric_name:{ domain:{ vegtype:DataFrame } } }. The index is the years as str.
+	'''
+	import pandas as pd
+	from alfresco_postprocessing.postprocess import get_metric_arrays
+	arrays = get_metric_arrays( _get_records( obj ), metric_names )
+	out = {}
+	for metric_name, ( arr, coords ) in arrays.items():
+		labels = dict( coords )
+		years = [ str( y ) for y in labels[ 'year' ] ]
+		frames = {}
+		for d, domain in enumerate( labels[ 'domain' ] ):
+			if arr.ndim == 3:
+				frames[ domain ] = pd.DataFrame( arr[ :, :, d ].T, index=years, columns=labels[ 'replicate' ] )
+			else:
+				frames[ domain ] = { cls:pd.DataFrame( arr[ :, :, d, c ].T, index=years, columns=labels[ 'replicate' ] )
+									for c, cls in enumerate( coords[ 3 ][1] ) }
+		out[ metric_name ] = frames
+	return out
+
+def _rank_along_years( arr ):
+	'''
+	average ranks along axis 1 (years) of a ( replicate, year, domain ) array,
+	leaving NaNs in place.
+	'''
+	import pandas as pd
+	nrep, nyear, ndom = arr.shape
+	flat = pd.DataFrame( arr.transpose( 1, 0, 2 ).reshape( nyear, nrep * ndom ) )
+	ranked = flat.rank( axis=0, method='average' ).values
+	return ranked.reshape( nyear, nrep, ndom ).transpose( 1, 0, 2 )
+
+def _masked_pearson( x, y, valid ):
+	''' pearson correlation along axis 1 over the pairwise-complete `valid` entries '''
+	n = valid.sum( axis=1 ).astype( float )
+	x = np.where( valid, x, 0.0 )
+	y = np.where( valid, y, 0.0 )
+	with np.errstate( invalid='ignore', divide='ignore' ):
+		xm = x.sum( axis=1 ) / n
+		ym = y.sum( axis=1 ) / n
+		xc = np.where( valid, x - xm[ :, None, : ], 0.0 )
+		yc = np.where( valid, y - ym[ :, None, : ], 0.0 )
+		return ( xc * yc ).sum( axis=1 ) / np.sqrt( ( xc ** 2 ).sum( axis=1 ) * ( yc ** 2 ).sum( axis=1 ) )
+
+def _masked_kendall( x, y, valid ):
+	'''
+	kendall tau-b along axis 1 over the pairwise-complete `valid` entries. Loops
+	over domains only, each domain is computed for all replicates at once.
+	'''
+	nrep, nyear, ndom = x.shape
+	out = np.full( ( nrep, ndom ), np.nan )
+	iu = np.triu_indices( nyear, k=1 )
+	for d in range( ndom ):
+		xd, yd, vd = x[ :, :, d ], y[ :, :, d ], valid[ :, :, d ]
+		pair_valid = ( vd[ :, :, None ] & vd[ :, None, : ] )[ :, iu[0], iu[1] ]
+		sx = np.sign( xd[ :, None, : ] - xd[ :, :, None ] )[ :, iu[0], iu[1] ] * pair_valid
+		sy = np.sign( yd[ :, None, : ] - yd[ :, :, None ] )[ :, iu[0], iu[1] ] * pair_valid
+		sx, sy = np.nan_to_num( sx ), np.nan_to_num( sy )
+		with np.errstate( invalid='ignore', divide='ignore' ):
+			out[ :, d ] = ( sx * sy ).sum( axis=1 ) / np.sqrt( ( sx != 0 ).sum( axis=1 ) * ( sy != 0 ).sum( axis=1 ) )
+	return out
+
+def rank_replicates( modplot, obsplot, metrics=[ 'total_area_burned' ], domains=None, methods=( 'pearson', 'spearman', 'kendall' ),
+		rank_by='spearman', year_range=None ):
+	'''
+	rank every modeled replicate against the observed record for all of the
+	requested metrics and domains at once. Each database is converted to arrays
+	a single time and the correlations / errors are computed in matrix form over
+	replicates x domains, rather than per domain and per replicate column.
+
+	Arguments:
+	----------
+	modplot = [ alfresco_postprocessing.Plot ] modeled data (a TinyDB or list of records also works)
+	obsplot = [ alfresco_postprocessing.Plot ] observed data (a TinyDB or list of records also works)
+	metrics = [list] scalar metrics to compare. default:['total_area_burned']
+	domains = [list] domain names to compare. default:None (all domains in both)
+	methods = [tuple] correlation methods among 'pearson', 'kendall', 'spearman'.
+		default:('pearson', 'spearman', 'kendall')
+	rank_by = [str] one of the methods, or 'rmse', 'mae', 'bias' to rank by.
+		correlations rank high-to-low, errors low-to-high (absolute for bias). default:'spearman'
+	year_range = [tuple] of ( begin_year, end_year ) to restrict the comparison to.
+		default:None which uses the years present in both.
+
+	Returns:
+	--------
+	pandas.DataFrame with one row per metric x domain x replicate and columns
+	for n (years compared), each correlation method, rmse, mae, bias and rank
+	(1 is best, ties share a rank) sorted by metric, domain and rank.
+
+	'''
+	import pandas as pd
+	from alfresco_postprocessing.postprocess import get_metric_arrays
+	mod_arrays = get_metric_arrays( _get_records( modplot ), metrics )
+	obs_arrays = get_metric_arrays( _get_records( obsplot ), metrics )
+
+	tables = []
+	for metric_name in metrics:
+		mod, mod_coords = mod_arrays[ metric_name ]
+		obs, obs_coords = obs_arrays[ metric_name ]
+		mod_coords, obs_coords = dict( mod_coords ), dict( obs_coords )
+
+		years = [ y for y in mod_coords[ 'year' ] if y in set( obs_coords[ 'year' ] ) ]
+		if year_range is not None:
+			begin, end = year_range
+			years = [ y for y in years if begin <= y <= end ]
+		doms = [ d for d in mod_coords[ 'domain' ] if d in set( obs_coords[ 'domain' ] ) ]
+		if domains is not None:
+			doms = [ d for d in doms if d in set( domains ) ]
+
+		take = lambda arr, coords: arr[ :, [ coords[ 'year' ].index( y ) for y in years ], : ][ :, :, [ coords[ 'domain' ].index( d ) for d in doms ] ]
+		x = take( mod, mod_coords )
+		y = np.broadcast_to( take( obs, obs_coords )[ :1 ], x.shape )
+		valid = ~np.isnan( x ) & ~np.isnan( y )
+		x = np.where( valid, x, np.nan )
+		y = np.where( valid, y, np.nan )
+
+		cols = { 'n':valid.sum( axis=1 ) }
+		for method in methods:
+			if method == 'pearson':
+				cols[ method ] = _masked_pearson( x, y, valid )
+			elif method == 'spearman':
+				cols[ method ] = _masked_pearson( _rank_along_years( x ), _rank_along_years( y ), valid )
+			elif method == 'kendall':
+				cols[ method ] = _masked_kendall( x, y, valid )
+			else:
+				raise ValueError( 'method must be one of pearson, kendall, spearman' )
+		import warnings
+		with warnings.catch_warnings():
+			# all-NaN replicate / domain slices just give NaN
+			warnings.simplefilter( 'ignore', category=RuntimeWarning )
+			diff = x - y
+			cols[ 'rmse' ] = np.sqrt( np.nanmean( diff ** 2, axis=1 ) )
+			cols[ 'mae' ] = np.nanmean( np.abs( diff ), axis=1 )
+			cols[ 'bias' ] = np.nanmean( diff, axis=1 )
+
+		replicates = mod_coords[ 'replicate' ]
+		index = pd.MultiIndex.from_product( [ [ metric_name ], doms, replicates ], names=[ 'metric', 'domain', 'replicate' ] )
+		# ( replicate, domain ) -> rows ordered domain-major
+		df = pd.DataFrame( { name:arr.T.ravel() for name, arr in cols.items() }, index=index )
+		tables.append( df )
+
+	table = pd.concat( tables )
+	if rank_by in ( 'rmse', 'mae', 'bias' ):
+		score, ascending = table[ rank_by ].abs(), True
+	else:
+		score, ascending = table[ rank_by ], False
+	table[ 'rank' ] = score.groupby( level=[ 'metric', 'domain' ] ).rank( method='min', ascending=ascending )
+	table = table.reset_index().sort_values( [ 'metric', 'domain', 'rank' ] ).reset_index( drop=True )
+	return table
 
 def best_rep( modplot, obsplot, domain, method='spearman' ):
 	'''
@@ -102,16 +361,15 @@ def best_rep( modplot, obsplot, domain, method='spearman' ):
 	--------
 	dict with the best replicate number as the key and the correlation value as the value/\.
 
+	Notes:
+	------
+	when ranking many domains use `rank_replicates` once instead of calling this per domain.
+
 	'''
-	mod_tab_dict = modplot.get_metric_dataframes( 'total_area_burned' )
-	mod_df = mod_tab_dict[ domain ]
-	obs_tab_dict = obsplot.get_metric_dataframes( 'total_area_burned' )
-	obs = obs_tab_dict[ domain ][ 'observed' ]
-	years = obs.index
-	mod_df = mod_df.ix[ years, : ]
-	corr = pd.Series({i:mod_df[i].corr( obs, method=method ) for i in mod_df.columns })
-	ind, = np.where( corr == corr.reset_index()[0].max() )
-	return  corr[ ind ].to_dict()
+	table = rank_replicates( modplot, obsplot, metrics=[ 'total_area_burned' ], domains=[ domain ],
+							methods=( method, ), rank_by=method )
+	best = table[ table[ 'rank' ] == 1 ]
+	return dict( zip( best[ 'replicate' ], best[ method ] ) )
 
 def aab_barplot( modeled_rep, observed, output_path, domain, replicate, model, scenario, year_range, *args, **kwargs ):
 	'''
@@ -140,10 +398,11 @@ def aab_barplot( modeled_rep, observed, output_path, domain, replicate, model, s
 	the path to the plot that was just written to disk with the side-effect of a plot being written to disk.
 
 	'''
+	import pandas as pd
 	# order of imports is important here if using 'Agg'
 	import os
+	sns = _seaborn( )
 	from matplotlib import pyplot as plt
-	# import seaborn as sns
 
 	# combine modeled and historical
 	df = pd.concat( [observed, modeled_rep], axis=1 )
@@ -207,8 +466,8 @@ def vegcounts_lineplot( modeled, output_path, domain, model, scenario, vegtype,
 	'''
 	# order of imports is important here if using 'Agg'
 	import os
+	sns = _seaborn( )
 	from matplotlib import pyplot as plt
-	# import seaborn as sns
 	import matplotlib.pyplot as plt
 	import matplotlib.patches as mpatches
 
@@ -255,6 +514,7 @@ def vegcounts_lineplot( modeled, output_path, domain, model, scenario, vegtype,
 			model, scenario, vegtype.replace(' ', '' ), domain.replace(' ', '' ), str(begin), str(end) ]) + '.png' ) 
 	plt.savefig( output_filename )
 	plt.close()
+	return output_filename
 
 def vegcounts_lineplot_factory( modplot, output_path, replicate, year_range=(1950, 2100), *args, **kwargs ):
 	'''
@@ -281,8 +541,8 @@ def aab_lineplot( modeled, observed, output_path, domain, model, scenario, repli
 	'''
 	# order of imports is important here if using 'Agg'
 	import os
+	sns = _seaborn( )
 	from matplotlib import pyplot as plt
-	# import seaborn as sns
 	import matplotlib.pyplot as plt
 	import matplotlib.patches as mpatches
 
@@ -337,7 +597,7 @@ def aab_lineplot( modeled, observed, output_path, domain, model, scenario, repli
 		output_filename = os.path.join( output_path, '_'.join([ 'alfresco_annual_areaburned_line', model, scenario, domain.replace(' ', ''), str(begin), str(end) ]) + '.png' )
 		plt.savefig( output_filename )
 		plt.close()
-	return 'success!'
+	return output_filename
 	
 def aab_lineplot_factory( modplot, obsplot, output_path, replicates=None, year_range=(1950,2100), **kwargs ):
 	# modeled, observed, output_path, domain, model, scenario, replicates=[None], year_range=(1950,2100)
@@ -364,8 +624,8 @@ def cab_lineplot( modeled, observed, output_path, domain, model, scenario, repli
 	'''
 	# order of imports is important here if using 'Agg'
 	import os
+	sns = _seaborn( )
 	from matplotlib import pyplot as plt
-	# import seaborn as sns
 	import matplotlib.pyplot as plt
 	import matplotlib.patches as mpatches
 
@@ -416,7 +676,7 @@ def cab_lineplot( modeled, observed, output_path, domain, model, scenario, repli
 	output_filename = os.path.join( output_path, '_'.join([ 'alfresco_cumsum_areaburned_line', model, scenario, domain.replace(' ', ''), str(begin), str(end) ]) + '.png' )
 	plt.savefig( output_filename )
 	plt.close()
-	return 'success!'
+	return output_filename
 
 def cab_lineplot_factory( modplot, obsplot, output_path, model, scenario, replicates=[None], year_range=(1950, 2100), *args, **kwargs ):
 	'''
@@ -436,80 +696,89 @@ def cab_lineplot_factory( modplot, obsplot, output_path, model, scenario, replic
 		_ = cab_lineplot( mod, obs, output_path, domain, model, scenario, replicates, year_range )
 	return 'success!'
 
-def cab_vs_fs_lineplot( modeled, observed, output_path, domain, model, scenario, replicates=[None], year_range=(1950,2100), *args, **kwargs ):
+def _frame_curves( df, npoints=None ):
+	'''
+	fire size curves from a year x replicate DataFrame of fire size lists ( as from
+	Plot.get_metric_dataframes( 'all_fire_sizes' ) ), one curve per column.
 	'''
-	UNDER DEVELOPMENT AND NON-WORKING
+	import itertools
+	lists = [ df[ col ].tolist() for col in df.columns ]
+	counts = np.array( [ sum( len( i ) for i in col ) for col in lists ], dtype=np.int64 )
+	values = np.fromiter( itertools.chain.from_iterable( itertools.chain.from_iterable( lists ) ), dtype=np.int64, count=int( counts.sum() ) )
+	offsets = np.zeros( len( counts ) + 1, dtype=np.int64 )
+	np.cumsum( counts, out=offsets[ 1: ] )
+	return ( list( df.columns ), ) + ap.cumulative_area_curves( values, offsets, npoints=npoints )
+
+def cab_vs_fs_lineplot( modeled, observed, output_path, domain, model, scenario, replicates=[None], year_range=(1950,2100), npoints=1000, *args, **kwargs ):
+	'''
+	cumulative area burned vs. fire size of every modeled replicate against the observed.
+
+	Arguments:
+	----------
+	modeled, observed = curves as returned by `fire_size_curves`, or year x replicate
+		DataFrames of fire size lists.
+	npoints = [int] plot at most this many points of each curve. default:1000
+
 	'''
 	# order of imports is important here if using 'Agg' backend
-	import matplotlib, os
-	matplotlib.use('Agg')
-	from matplotlib import pyplot as plt
-	# import seaborn as sns
+	import os
+	sns = _seaborn( )
 	import matplotlib.pyplot as plt
 	import matplotlib.patches as mpatches
+	from matplotlib.collections import LineCollection
 
 	# setup -- should become overloaded args for control in the future
 	figsize = (11, 8)
 	begin, end = year_range
-	years = [ str(i) for i in range(begin, end+1) ]
-
-	# # prep data 
-	# modeled
-	df_list = []
-	for col in modeled.columns:
-		mod_sorted = sorted( [ j for i in  modeled[ col ] for j in i ] )
-		mod_cumsum = np.cumsum( mod_sorted )
-		replicate = [ col for i in range( len( mod_sorted ) ) ]
-		df_list.append( pd.DataFrame( {'mod_sorted':mod_sorted, 'mod_cumsum':mod_cumsum, 'replicate':replicate} ) )
 
-	# melt the ragged arrays with a concat -- dirty way
-	mod_melted = pd.concat( df_list )
-
-	# observed
-	obs_sorted = sorted([ j for i in observed.iloc[:,0] for j in i ])
-	obs_cumsum = np.cumsum( obs_sorted )
-	obs_df = pd.DataFrame({ 'obs_sorted':obs_sorted, 'obs_cumsum':obs_cumsum })
+	# # prep data -- ragged ( sizes, cumulative area ) curves per replicate
+	if hasattr( modeled, 'columns' ):
+		modeled = _frame_curves( modeled, npoints )
+	if hasattr( observed, 'columns' ):
+		observed = _frame_curves( observed, npoints )
+	mod_reps, mod_sizes, mod_cumsum, _, mod_offsets = modeled
+	obs_reps, obs_sizes, obs_cumsum, _, obs_offsets = observed
 
 	# # plot
 	sns.set_style( 'white', {'ytick.major.size': 7, 'xtick.major.size': 7} )
 	sns.set( rc={'figure.figsize':figsize} )
+	fig, ax = plt.subplots( figsize=figsize )
 
-	# plt.plot( best_rep_bor['fires'], best_rep_bor['cumsum'], sns.xkcd_rgb['dark blue'] )
-	# plt.plot( best_rep_tun['fires'], best_rep_tun['cumsum'], sns.xkcd_rgb['dark green'] )
-	mod_melted.groupby( 'replicate' ).apply( lambda x: plt.plot( x['mod_sorted'], x['mod_cumsum'], sns.xkcd_rgb['greyish'] ) )
-	plt.plot( obs_df['obs_sorted'], obs_df['obs_cumsum'], sns.xkcd_rgb['indian red'] )
+	# all replicates as a single collection instead of a line per replicate
+	points = np.column_stack( [ mod_sizes, mod_cumsum ] )
+	segments = [ seg for seg in np.split( points, mod_offsets[ 1:-1 ] ) if len( seg ) > 0 ]
+	ax.add_collection( LineCollection( segments, colors=sns.xkcd_rgb['greyish'] ) )
+	for i in range( len( obs_reps ) ):
+		ax.plot( obs_sizes[ obs_offsets[ i ]:obs_offsets[ i+1 ] ], obs_cumsum[ obs_offsets[ i ]:obs_offsets[ i+1 ] ], sns.xkcd_rgb['indian red'] )
+	ax.autoscale()
 
 	# legend
 	red_patch = mpatches.Patch( color=sns.xkcd_rgb['indian red'] , label='Historical' )
-	grn_patch = mpatches.Patch( color=sns.xkcd_rgb['dark green'] , label='Best Boreal Replicate' )
-	blu_patch = mpatches.Patch( color=sns.xkcd_rgb['dark blue'], label='Best Tundra Replicate' )
 	grey_patch = mpatches.Patch( color=sns.xkcd_rgb['greyish'], label='All Replicates' )
-	plt.legend( handles=[ red_patch, grn_patch, blu_patch, grey_patch ], frameon=False, loc=0 )
+	plt.legend( handles=[ red_patch, grey_patch ], frameon=False, loc=0 )
+	plt.xlabel( 'fire size (pixels)' )
+	plt.ylabel( 'cumulative area burned (pixels)' )
 
 	# save
 	sns.despine()
-	output_filename = os.path.join( output_path, '_'.join([ 'alfresco_cab_vs_fs', model, scenario, domain, str(begin), str(end) ]) + '.png' )
+	output_filename = os.path.join( output_path, '_'.join([ 'alfresco_cab_vs_fs', model, scenario, str( domain ).replace(' ', ''), str(begin), str(end) ]) + '.png' )
 	plt.savefig( output_filename )
 	plt.close()
+	return output_filename
 
-def cab_vs_fs_lineplot_factory( modplot, obsplot, output_path, model, scenario, replicates=[None], year_range=(1950, 2100), *args, **kwargs ):
+def cab_vs_fs_lineplot_factory( modplot, obsplot, output_path, model, scenario, replicates=[None], year_range=(1950, 2100), npoints=1000, *args, **kwargs ):
 	'''
-	UNDER DEVELOPMENT AND NON-WORKING
+	cab_vs_fs_lineplot for every modeled domain. The curves are computed vectorized
+	from the flattened fire sizes of each database, observed from year_range[0] on.
 	'''
-	metric = 'all_fire_sizes'
-	# maybe pass this in the right way without the DB's?
-	mod_dict = modplot.get_metric_dataframes( metric )
-	obs_dict = obsplot.get_metric_dataframes( metric )
-
 	begin, end = year_range
-	years = [ str(i) for i in range( begin, end+1 ) ]
-
-	for domain in modplot.domains: # using modeled domains, must be same in obs_dict
-		mod = mod_dict[ domain ].loc[ years, : ]
-		obs = obs_dict[ domain ].loc[ str(begin): ]
-		mod.name = 'modeled'
-		obs.name = 'observed'
-		_ = cab_vs_fs_lineplot( mod, obs, output_path, domain, model, scenario, replicates=[None], year_range=(1950,2100) )
+	mod_sizes = ap.ragged_fire_sizes( _fire_size_records( modplot ) )
+	obs_sizes = ap.ragged_fire_sizes( _fire_size_records( obsplot ) )
+	domains = mod_sizes[ 2 ][ 2 ][ 1 ]
+	for domain in domains: # using modeled domains, must be same in observed
+		mod = ap.fire_size_curves( mod_sizes, domain, years=( begin, end ), npoints=npoints )
+		obs = ap.fire_size_curves( obs_sizes, domain, years=( begin, max( obs_sizes[ 2 ][ 1 ][ 1 ] ) ), npoints=npoints )
+		_ = cab_vs_fs_lineplot( mod, obs, output_path, domain, model, scenario, replicates=replicates, year_range=year_range, npoints=npoints )
 	return 'success!'
 
 
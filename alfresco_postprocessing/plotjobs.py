@@ -0,0 +1,240 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING PARALLEL PLOT RENDERING
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import os, json, hashlib, pickle
+import numpy as np
+
+PLOT_TYPES = [ 'aab_barplot', 'vegcounts_lineplot', 'aab_lineplot', 'cab_lineplot', 'cab_vs_fs_lineplot' ]
+MANIFEST_FN = '.alfresco_plots.json'
+
+class PlotJob( object ):
+	'''
+	a single figure to render: the name of one of the plot functions in
+	alfresco_postprocessing.plot and the ( already prepared ) arguments to call it with.
+	'''
+	def __init__( self, plot_type, args, kwargs, key, *a, **kw ):
+		'''
+		Arguments:
+		----------
+		plot_type = [str] one of PLOT_TYPES.
+		args = [tuple] positional arguments of the plot function.
+		kwargs = [dict] keyword arguments of the plot function.
+		key = [str] name identifying the figure across runs, used in the manifest.
+
+		Returns:
+		--------
+		object of type alfresco_postprocessing.PlotJob
+
+		'''
+		self.plot_type = plot_type
+		self.args = args
+		self.kwargs = kwargs
+		self.key = key
+		self.hash = _data_hash( ( plot_type, args, sorted( kwargs.items() ) ) )
+
+	def run( self ):
+		from alfresco_postprocessing import plot
+		return getattr( plot, self.plot_type )( *self.args, **self.kwargs )
+
+	def __repr__( self ):
+		return 'PlotJob( %s )' % self.key
+
+def _update_hash( h, obj ):
+	''' content hash of the plot data: pandas / numpy objects by value, the rest by pickle '''
+	if hasattr( obj, 'columns' ) or ( hasattr( obj, 'index' ) and hasattr( obj, 'values' ) ):
+		import pandas as pd
+		h.update( repr( list( getattr( obj, 'columns', [ getattr( obj, 'name', None ) ] ) ) ).encode() )
+		h.update( repr( list( obj.index ) ).encode() )
+		h.update( pd.util.hash_pandas_object( obj, index=False ).values.tobytes() )
+	elif isinstance( obj, np.ndarray ):
+		h.update( str( ( obj.dtype, obj.shape ) ).encode() )
+		h.update( np.ascontiguousarray( obj ).tobytes() )
+	elif isinstance( obj, ( list, tuple ) ):
+		h.update( ( '%s%d' % ( type( obj ).__name__, len( obj ) ) ).encode() )
+		for item in obj:
+			_update_hash( h, item )
+	else:
+		h.update( pickle.dumps( obj, protocol=2 ) )
+
+def _data_hash( obj ):
+	h = hashlib.md5()
+	_update_hash( h, obj )
+	return h.hexdigest()
+
+def _year_index( begin, end ):
+	return [ str( i ) for i in range( begin, end + 1 ) ]
+
+def _plot_frames( plot, metric_names ):
+	''' metric frames from the Plot's cache, or a single pass over the records '''
+	from alfresco_postprocessing.plot import _metric_frames
+	if len( metric_names ) == 0:
+		return {}
+	if hasattr( plot, 'get_metric_dataframes' ):
+		return { name:plot.get_metric_dataframes( name ) for name in metric_names }
+	return _metric_frames( plot, metric_names )
+
+def plot_jobs( modplot, obsplot, output_path, plots=None, replicate=0, year_range=(1950, 2100),
+				bar_year_range=(1950, 2010), domains=None, npoints=1000 ):
+	'''
+	enumerate every requested figure of a model run, reading each database once and
+	preparing the data of each figure up front.
+
+	Arguments:
+	----------
+	modplot = [Plot] modeled Plot object, its model and scenario are used in naming.
+	obsplot = [Plot] observed ( historical ) Plot object.
+	output_path = [str] path to the output directory.
+	plots = [list] any of PLOT_TYPES. default:None (all)
+	replicate = [int] replicate shown in the annual area burned barplots. default:0
+	year_range = [tuple] ( begin, end ) of the line plots. default:(1950, 2100)
+	bar_year_range = [tuple] ( begin, end ) of the barplots. default:(1950, 2010)
+	domains = [list] domain names to plot. default:None (all modeled domains)
+	npoints = [int] points per cab_vs_fs_lineplot curve. default:1000
+
+	Returns:
+	--------
+	list of PlotJob
+
+	'''
+	from alfresco_postprocessing.plot import _fire_size_records
+	from alfresco_postprocessing.firesizes import ragged_fire_sizes, fire_size_curves
+	plots = PLOT_TYPES if plots is None else plots
+	for plot_type in plots:
+		if plot_type not in PLOT_TYPES:
+			raise ValueError( 'unknown plot type %s, use one of %s' % ( plot_type, PLOT_TYPES ) )
+	model, scenario = modplot.model, modplot.scenario
+
+	mod_metrics = []
+	if set( plots ) & set( [ 'aab_barplot', 'aab_lineplot', 'cab_lineplot' ] ):
+		mod_metrics.append( 'total_area_burned' )
+	if 'vegcounts_lineplot' in plots:
+		mod_metrics.append( 'veg_counts' )
+	mod = _plot_frames( modplot, mod_metrics )
+	obs = _plot_frames( obsplot, [ 'total_area_burned' ] if 'total_area_burned' in mod_metrics else [] )
+	if 'cab_vs_fs_lineplot' in plots:
+		mod_sizes = ragged_fire_sizes( _fire_size_records( modplot ) )
+		obs_sizes = ragged_fire_sizes( _fire_size_records( obsplot ) )
+		all_domains = mod_sizes[ 2 ][ 2 ][ 1 ]
+	else:
+		all_domains = list( list( mod.values() )[0].keys() )
+	domains = all_domains if domains is None else domains
+
+	jobs = []
+	for domain in domains:
+		name = '%s|%s|%s' % ( model, scenario, domain )
+		if 'total_area_burned' in mod:
+			mod_df = mod[ 'total_area_burned' ][ domain ]
+			obs_df = obs[ 'total_area_burned' ][ domain ]
+		if 'aab_barplot' in plots:
+			years = _year_index( *bar_year_range )
+			mod_rep = mod_df.reindex( years )[ str( replicate ) ].rename( 'modeled' )
+			obs_rep = obs_df.reindex( years )[ 'observed' ]
+			jobs.append( PlotJob( 'aab_barplot', ( mod_rep, obs_rep, output_path, domain, replicate, model, scenario, bar_year_range ), {},
+								'aab_barplot|%s|%s|%s' % ( name, replicate, bar_year_range ) ) )
+		if 'aab_lineplot' in plots:
+			years = _year_index( *year_range )
+			jobs.append( PlotJob( 'aab_lineplot', ( mod_df.reindex( years ), obs_df.reindex( years ), output_path, domain, model, scenario, None, year_range ), {},
+								'aab_lineplot|%s|%s' % ( name, year_range ) ) )
+		if 'cab_lineplot' in plots:
+			years = _year_index( *year_range )
+			jobs.append( PlotJob( 'cab_lineplot', ( mod_df.reindex( years ), obs_df.loc[ str( year_range[0] ): ], output_path, domain, model, scenario ),
+								{ 'year_range':year_range }, 'cab_lineplot|%s|%s' % ( name, year_range ) ) )
+		if 'vegcounts_lineplot' in plots:
+			years = _year_index( *year_range )
+			for vegtype, veg_df in mod[ 'veg_counts' ][ domain ].items():
+				jobs.append( PlotJob( 'vegcounts_lineplot', ( veg_df.reindex( years ), output_path, domain, model, scenario, vegtype ),
+									{ 'year_range':year_range }, 'vegcounts_lineplot|%s|%s|%s' % ( name, vegtype, year_range ) ) )
+		if 'cab_vs_fs_lineplot' in plots:
+			mod_curves = fire_size_curves( mod_sizes, domain, years=year_range, npoints=npoints )
+			obs_curves = fire_size_curves( obs_sizes, domain, years=( year_range[0], max( obs_sizes[ 2 ][ 1 ][ 1 ] ) ), npoints=npoints )
+			jobs.append( PlotJob( 'cab_vs_fs_lineplot', ( mod_curves, obs_curves, output_path, domain, model, scenario ),
+								{ 'year_range':year_range, 'npoints':npoints }, 'cab_vs_fs_lineplot|%s|%s' % ( name, year_range ) ) )
+	return jobs
+
+# matplotlib state is per process: each worker switches to Agg once and resets the
+# rcParams before every figure, since the plot functions change the seaborn style.
+_PLOT_WORKER_READY = False
+
+def _render( job ):
+	global _PLOT_WORKER_READY
+	import matplotlib
+	if not _PLOT_WORKER_READY:
+		from alfresco_postprocessing.plot import _seaborn
+		_seaborn( )
+		import matplotlib.pyplot as plt
+		plt.switch_backend( 'Agg' )
+		_PLOT_WORKER_READY = True
+	import matplotlib.pyplot as plt
+	matplotlib.rcdefaults()
+	try:
+		output_filename = job.run()
+	finally:
+		plt.close( 'all' )
+	return job.key, job.hash, output_filename
+
+def _read_manifest( manifest_fn ):
+	if not os.path.exists( manifest_fn ):
+		return {}
+	with open( manifest_fn ) as f:
+		return json.load( f )
+
+def _write_manifest( manifest, manifest_fn ):
+	''' write to a temp file and rename, so an interrupted run leaves the old manifest '''
+	tmp_fn = manifest_fn + '.tmp'
+	with open( tmp_fn, 'w' ) as f:
+		json.dump( manifest, f, indent=1, sort_keys=True )
+	os.replace( tmp_fn, manifest_fn )
+
+def render_plots( jobs, output_path, ncores=None, executor=None, force=False ):
+	'''
+	render plot jobs in parallel, skipping those whose data and arguments hash to
+	the same value as when their existing output was written.
+
+	Arguments:
+	----------
+	jobs = [list] of PlotJob, as from `plot_jobs`.
+	output_path = [str] output directory, which holds the manifest of rendered figures.
+	ncores = [int] number of worker processes. default:None (os.cpu_count())
+	executor = [alfresco_postprocessing.Executor] reuse an existing worker pool.
+		default:None (a pool is started for this call)
+	force = [bool] re-render every figure. default:False
+
+	Returns:
+	--------
+	dict with 'rendered' and 'skipped' lists of output filenames.
+
+	'''
+	from alfresco_postprocessing.executor import Executor
+	manifest_fn = os.path.join( output_path, MANIFEST_FN )
+	manifest = _read_manifest( manifest_fn )
+	todo, skipped = [], []
+	for job in jobs:
+		entry = manifest.get( job.key )
+		if not force and entry is not None and entry[ 'hash' ] == job.hash and entry[ 'output' ] and os.path.exists( entry[ 'output' ] ):
+			skipped.append( entry[ 'output' ] )
+		else:
+			todo.append( job )
+
+	rendered = []
+	if len( todo ) > 0:
+		own_executor = executor is None
+		if own_executor:
+			executor = Executor( ncores=min( ncores or os.cpu_count(), len( todo ) ) )
+		try:
+			results = executor.map( _render, todo, chunksize=1 )
+		finally:
+			if own_executor:
+				executor.close()
+		for key, job_hash, output_filename in results:
+			manifest[ key ] = { 'hash':job_hash, 'output':output_filename }
+			rendered.append( output_filename )
+		_write_manifest( manifest, manifest_fn )
+	return { 'rendered':rendered, 'skipped':skipped }
+
+def render_all_plots( modplot, obsplot, output_path, ncores=None, plots=None, force=False, **kwargs ):
+	'''
+	`plot_jobs` + `render_plots`: every requested figure of a run, rendered in
+	parallel. kwargs are passed to `plot_jobs`.
+	'''
+	jobs = plot_jobs( modplot, obsplot, output_path, plots=plots, **kwargs )
+	return render_plots( jobs, output_path, ncores=ncores, force=force )
@@ -2,7 +2,6 @@
 # ALFRESCO POST-PROCESSING RUN CLASSES
 # * * * * * * * * * * * * * * * * * * * * * * * * * * *
 import alfresco_postprocessing as ap
-import pandas as pd
 import numpy as np
 import os
 
@@ -42,12 +41,14 @@ class FileLister( object ):
 		pandas.DataFrame containing the Filename object and 
 		related metadata attributes.
 		'''
+		import pandas as pd
 		files = [ Filename(i) for i in self.files ]
 		df = pd.DataFrame([{'object':i,'year':i.year,'replicate':i.replicate, 'variable':i.variable} for i in files ])
 		# sort by replicate and year
 		df = df.sort_values(['replicate','year'], ascending=[1,1])
 		return df
 	def _to_df( self ):
+		import pandas as pd
 		# convert to objects for easier parsing
 		files = [ Filename( i ) for i in self.files ]
 		# create an unpacked DataFrame with the file objects
@@ -62,6 +63,7 @@ class FileLister( object ):
 		variables = df_wide.columns		
 		return df_wide
 	def _lag_fire( self ):
+		import pandas as pd
 		df = self.df
 		firevars = [ 'FireScar','BurnSeverity' ]
 		othervars = [ 'Age','Veg','BasalArea' ]
@@ -110,12 +112,14 @@ class ObservedFileLister( FileLister ):
 		pandas.DataFrame containing the Filename object and 
 		related metadata attributes.
 		'''
+		import pandas as pd
 		files = [ ObservedFilename(i) for i in self.files ]
 		df = pd.DataFrame([{'object':i,'year':i.year,'variable':i.variable} for i in files ])
 		# sort by year
 		df = df.sort_values(['year'], ascending=[1])
 		return df
 	def _to_df( self ):
+		import pandas as pd
 		# convert to objects for easier parsing
 		files = [ ObservedFilename( i ) for i in self.files ]
 		# create an unpacked DataFrame with the file objects
@@ -281,6 +285,176 @@ def get_metric_json( db, metric_name ):
 			for replicate in replicates  }
 	return metric_select
 
+# metrics stored per domain as a single value or as a dict of class counts
+SCALAR_METRICS = [ 'avg_fire_size', 'number_of_fires', 'total_area_burned' ]
+CLASS_METRICS = { 'veg_counts':'vegtype', 'severity_counts':'severity' }
+
+def _sorted_labels( labels ):
+	''' sort labels numerically when they are all integer-like, else as strings '''
+	labels = list( set( labels ) )
+	try:
+		return [ l for _, l in sorted( ( int( l ), l ) for l in labels ) ]
+	except ( TypeError, ValueError ):
+		return sorted( labels, key=str )
+
+def get_metric_arrays( db, metric_names ):
+	'''
+	take an ALFRESCO Post Processing output TinyDB database (or its list of
+	records) and in a single pass over the records return each of the requested
+	metrics as a dense numpy array with labeled dimensions.
+
+	Arguments:
+	----------
+	db = [tinydb.TinyDB or list] open tinydb object from an ALFRESCO Post Processing run,
+		or the list of records as returned by `db.all()`.
+	metric_names = [list] of metric names. supported types: 'avg_fire_size',
+		'number_of_fires', 'total_area_burned', 'veg_counts', 'severity_counts'
+
+	Returns:
+	--------
+	dict of metric_name:( numpy.ndarray, coords ) where coords is a list of
+	( dimension_name, labels ) pairs in axis order. scalar metrics have dims
+	( replicate, year, domain ) and class count metrics get a fourth dimension
+	( vegtype or severity ). Missing values are NaN.
+
+	Notes:
+	------
+	`all_fire_sizes` is ragged and is not supported here.
+
+	'''
+	import numpy as np
+	records = db.all() if hasattr( db, 'all' ) else db
+	for metric_name in metric_names:
+		if metric_name not in SCALAR_METRICS and metric_name not in CLASS_METRICS:
+			raise ValueError( 'metric %s cannot be represented as a dense array' % metric_name )
+
+	# first pass collects (replicate, year, domain, class, value) columns per metric
+	cols = { metric_name:( [], [], [], [], [] ) for metric_name in metric_names }
+	for rec in records:
+		replicate = rec[ 'replicate' ]
+		year = int( rec[ 'fire_year' ] )
+		for metric_name in metric_names:
+			reps, years, doms, classes, values = cols[ metric_name ]
+			for domain, value in rec[ metric_name ].items():
+				if metric_name in CLASS_METRICS:
+					for cls, count in value.items():
+						reps.append( replicate ); years.append( year ); doms.append( domain )
+						classes.append( cls ); values.append( count )
+				else:
+					reps.append( replicate ); years.append( year ); doms.append( domain )
+					values.append( value )
+
+	out = {}
+	for metric_name in metric_names:
+		reps, years, doms, classes, values = cols[ metric_name ]
+		coords = [ ( 'replicate', _sorted_labels( [ rec[ 'replicate' ] for rec in records ] ) ),
+					( 'year', sorted( set( int( rec[ 'fire_year' ] ) for rec in records ) ) ),
+					( 'domain', _sorted_labels( doms ) ) ]
+		columns = [ reps, years, doms ]
+		if metric_name in CLASS_METRICS:
+			coords.append( ( CLASS_METRICS[ metric_name ], _sorted_labels( classes ) ) )
+			columns.append( classes )
+
+		# labels -> integer positions along each axis
+		index = []
+		for ( dim, labels ), column in zip( coords, columns ):
+			lookup = { label:i for i, label in enumerate( labels ) }
+			index.append( np.array( [ lookup[ c ] for c in column ], dtype=np.intp ) )
+
+		arr = np.full( tuple( len( labels ) for dim, labels in coords ), np.nan )
+		if len( values ) > 0:
+			arr[ tuple( index ) ] = np.asarray( values, dtype=np.float64 )
+		out[ metric_name ] = ( arr, coords )
+	return out
+
+def get_metric_array( db, metric_name ):
+	'''
+	single metric version of `get_metric_arrays`. Returns ( numpy.ndarray, coords ).
+	'''
+	return get_metric_arrays( db, [ metric_name ] )[ metric_name ]
+
+def get_transition_array( db ):
+	'''
+	the `veg_transitions` of a run made with run_postprocessing( ..., veg_transitions=True )
+	as a dense count array with dims ( replicate, year, domain, from, to ). The
+	transitions stored for year t are from the veg of t-1 to the veg of t.
+
+	Returns:
+	--------
+	( numpy.ndarray, coords ) with coords as in `get_metric_arrays`. Timesteps
+	without stored transitions ( the first year of a replicate ) are 0.
+
+	'''
+	import numpy as np
+	records = db.all() if hasattr( db, 'all' ) else db
+	records = [ rec for rec in records if 'veg_transitions' in rec ]
+	if len( records ) == 0:
+		raise ValueError( 'no veg_transitions found, run with veg_transitions=True' )
+	classes = set()
+	for rec in records:
+		for cols in rec[ 'veg_transitions' ].values():
+			classes.update( cols[ 'from' ] )
+			classes.update( cols[ 'to' ] )
+	classes = sorted( classes )
+	coords = [ ( 'replicate', _sorted_labels( [ rec[ 'replicate' ] for rec in records ] ) ),
+				( 'year', sorted( set( int( rec[ 'fire_year' ] ) for rec in records ) ) ),
+				( 'domain', _sorted_labels( [ d for rec in records for d in rec[ 'veg_transitions' ] ] ) ),
+				( 'from', classes ), ( 'to', classes ) ]
+	lookups = [ { label:i for i, label in enumerate( labels ) } for dim, labels in coords ]
+	arr = np.zeros( tuple( len( labels ) for dim, labels in coords ), dtype=np.int64 )
+	for rec in records:
+		r, y = lookups[0][ rec[ 'replicate' ] ], lookups[1][ int( rec[ 'fire_year' ] ) ]
+		for domain, cols in rec[ 'veg_transitions' ].items():
+			src = [ lookups[3][ c ] for c in cols[ 'from' ] ]
+			dst = [ lookups[4][ c ] for c in cols[ 'to' ] ]
+			arr[ r, y, lookups[2][ domain ], src, dst ] = cols[ 'count' ]
+	return arr, coords
+
+def veg_transition_matrix( db, domain, years=None, replicates=None, veg_name_dict=None, normalize=False ):
+	'''
+	sum the stored veg transitions of a domain over a period and replicates into
+	a single from x to matrix, without reopening any rasters.
+
+	Arguments:
+	----------
+	db = [tinydb.TinyDB or list] database or records of a run made with veg_transitions=True.
+	domain = [str] domain name.
+	years = [tuple] ( begin_year, end_year ) inclusive, of the years transitioned into.
+		default:None (all)
+	replicates = [list] replicates to include. default:None (all)
+	veg_name_dict = [dict] veg class:name. if given only those classes are kept and
+		they are labeled by name. default:None
+	normalize = [bool] divide each row by its total so rows are transition
+		probabilities. default:False
+
+	Returns:
+	--------
+	pandas.DataFrame with the from classes as the index and the to classes as the columns.
+
+	'''
+	import numpy as np
+	import pandas as pd
+	arr, coords = get_transition_array( db )
+	( _, reps ), ( _, yrs ), ( _, domains ), ( _, classes ), _ = coords
+	rep_mask = np.ones( len( reps ), dtype=bool )
+	if replicates is not None:
+		rep_mask = np.isin( reps, [ str( r ) for r in replicates ] )
+	yrs = np.array( yrs )
+	year_mask = np.ones( len( yrs ), dtype=bool )
+	if years is not None:
+		year_mask = ( yrs >= years[0] ) & ( yrs <= years[1] )
+	mat = arr[ rep_mask ][ :, year_mask ][ :, :, domains.index( domain ) ].sum( axis=( 0, 1 ) )
+
+	labels = list( classes )
+	if veg_name_dict is not None:
+		keep = [ i for i, c in enumerate( classes ) if c in veg_name_dict ]
+		mat = mat[ np.ix_( keep, keep ) ]
+		labels = [ veg_name_dict[ classes[ i ] ] for i in keep ]
+	df = pd.DataFrame( mat, index=pd.Index( labels, name='from' ), columns=pd.Index( labels, name='to' ) )
+	if normalize:
+		df = df.div( df.sum( axis=1 ).replace( 0, np.nan ), axis=0 )
+	return df
+
 def metric_to_csvs_historical( db, metric_name, output_path, suffix=None ):
 	'''
 	output Historical Observed Fire Derived Summary Statistics to CSV files
@@ -307,12 +481,11 @@ def metric_to_csvs_historical( db, metric_name, output_path, suffix=None ):
 	import os
 
 	metric_select = get_metric_json( db, metric_name )
-	replicate = metric_select.keys()[0] # only one replicate (observed) for obs 
-	years = metric_select[ replicate ].keys()
+	replicate = list( metric_select.keys() )[0] # only one replicate (observed) for obs 
+	years = list( metric_select[ replicate ].keys() )
 	startyear = str( min([ int(y) for y in years ]) )
 	endyear =  str( max([ int(y) for y in years ]) )
-	domains = metric_select[ replicate ][ years[0] ].keys()
-	panel = pd.Panel( metric_select )
+	domains = list( metric_select[ replicate ][ years[0] ].keys() )
 
 	for domain in domains:
 		if suffix == None:
@@ -322,11 +495,29 @@ def metric_to_csvs_historical( db, metric_name, output_path, suffix=None ):
 			output_filename = os.path.join( output_path, '_'.join([ 'firehistory', metric_name.replace('_',''), domain,\
 												suffix, startyear, endyear ]) + '.csv' )
 
-		panel_select = panel[ :, domain, : ]
+		panel_select = _replicate_frame( metric_select, domain )
 		panel_select = panel_select.fillna( 0 ) # change NaNs to Zero
 		panel_select.to_csv( output_filename, sep=',' )
 	return 1
 
+def _replicate_frame( metric_select, domain, cls=None ):
+	'''
+	years x replicates DataFrame of one domain from the nested dict returned by
+	`get_metric_json`, as a slice of the former pandas Panel. For class count
+	metrics ( veg_counts ) `cls` selects the class. missing values are NaN.
+	'''
+	import pandas as pd
+	data = {}
+	for replicate, years in metric_select.items():
+		column = {}
+		for year, domains in years.items():
+			value = domains.get( domain )
+			if cls is not None:
+				value = value.get( cls ) if value is not None else None
+			column[ year ] = value
+		data[ replicate ] = column
+	return pd.DataFrame( data ).sort_index()
+
 def metric_to_csvs( db, metric_name, output_path, suffix=None ):
 	'''
 	output ALFRESCO Derived Summary Statistics to CSV files
@@ -353,16 +544,13 @@ def metric_to_csvs( db, metric_name, output_path, suffix=None ):
 	import os
 	# select the data we need from the TinyDB
 	metric_select = get_metric_json( db, metric_name )
-	replicates = metric_select.keys()
+	replicates = list( metric_select.keys() )
 	column_order = np.array(replicates).astype( int )
 	column_order.sort()
 	column_order = column_order.astype( str )
 	column_order_names = [ '_'.join(['rep',i]) for i in column_order ]
-	years = metric_select[ replicates[0] ].keys()
-	domains = metric_select[ replicates[0] ][ years[0] ].keys()
-
-	# make a panel (replicates, domains, years)
-	panel = pd.Panel( metric_select ) 
+	years = list( metric_select[ replicates[0] ].keys() )
+	domains = list( metric_select[ replicates[0] ][ years[0] ].keys() )
 	startyear = min(years)
 	endyear = max(years)
 
@@ -375,16 +563,15 @@ def metric_to_csvs( db, metric_name, output_path, suffix=None ):
 				output_filename = os.path.join( output_path, '_'.join([ 'alfresco', metric_name.replace('_',''), domain,\
 													suffix, startyear, endyear ]) + '.csv' )
 
-			panel_select = panel[ :, domain, : ]
+			panel_select = _replicate_frame( metric_select, domain )
 			panel_select = panel_select[ column_order ]
 			panel_select = panel_select.fillna( 0 ) # change NaNs to Zero
 			panel_select.columns = column_order_names
 			panel_select.to_csv( output_filename, sep=',' )
 
 		elif metric_name == 'veg_counts': # veg
-			df = panel[ :, domain, : ]
-			vegtypes = sorted( df.ix[0,0].keys() )
-			new_panel = pd.Panel( df.to_dict() )
+			vegtypes = sorted( set( vegtype for years in metric_select.values() for domains in years.values() \
+								for vegtype in domains.get( domain, {} ).keys() ) )
 			for vegtype in vegtypes:
 				# subset the data again into vegetation types
 				if suffix == None:
@@ -395,11 +582,9 @@ def metric_to_csvs( db, metric_name, output_path, suffix=None ):
 												domain, vegtype.replace(' ', ''), suffix, startyear, endyear ]) + '.csv' )
 
 				# reorder the columns to 0-nreps !
-				veg_df = new_panel[ :, vegtype, : ]
+				veg_df = _replicate_frame( metric_select, domain, vegtype )
 				veg_df = veg_df[ column_order ]
 				veg_df.columns = column_order_names
-				# deal with NaN's? !
-				veg_df.fillna( 0 )
 				veg_df.to_csv( output_filename, sep=',' )
 
 		elif metric_name == 'severity_counts':
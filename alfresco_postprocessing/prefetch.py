@@ -0,0 +1,108 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING I/O PREFETCHING
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import time
+
+class Prefetcher( object ):
+	'''
+	iterate over `items` yielding ( item, read_func( item ) ) in order, while a small
+	pool of threads reads the next `depth` items in the background. GDAL releases
+	the GIL while reading and decompressing GeoTiffs, so the reads of the next
+	timesteps overlap with the counting done on the current one.
+
+	The time spent reading (summed over the threads), waiting on a read that was
+	not ready yet, and computing between items is recorded -- see `stats`.
+	'''
+	def __init__( self, items, read_func, depth=2, nthreads=2, *args, **kwargs ):
+		'''
+		Arguments:
+		----------
+		items = [iterable] items to read, e.g. a list of TimeStep objects.
+		read_func = [callable] function taking a single item and returning what was read.
+		depth = [int] number of items read ahead of the one being computed. 0 reads
+			each item only when it is needed (no overlap). default:2
+		nthreads = [int] number of reader threads. default:2
+
+		Returns:
+		--------
+		object of type alfresco_postprocessing.Prefetcher
+
+		'''
+		self.items = items
+		self.read_func = read_func
+		self.depth = max( int( depth ), 0 )
+		self.nthreads = max( int( nthreads ), 1 )
+		self.nitems = 0
+		self.read_times = []
+		self.wait_time = 0.0
+		self.compute_time = 0.0
+		self.elapsed = 0.0
+
+	def _timed_read( self, item ):
+		tic = time.time()
+		try:
+			return self.read_func( item )
+		finally:
+			# list.append is atomic, no lock needed across the reader threads
+			self.read_times.append( time.time() - tic )
+
+	def __iter__( self ):
+		from concurrent.futures import ThreadPoolExecutor
+		from collections import deque
+		items = iter( self.items )
+		start = time.time()
+		with ThreadPoolExecutor( max_workers=self.nthreads ) as pool:
+			pending = deque()
+			def submit( ):
+				for item in items:
+					pending.append( ( item, pool.submit( self._timed_read, item ) ) )
+					return True
+				return False
+			# the item being computed plus `depth` ahead of it
+			for _ in range( self.depth + 1 ):
+				if not submit( ):
+					break
+			try:
+				while len( pending ) > 0:
+					item, future = pending.popleft()
+					tic = time.time()
+					result = future.result()
+					self.wait_time += time.time() - tic
+					self.nitems += 1
+					tic = time.time()
+					yield item, result
+					self.compute_time += time.time() - tic
+					# refill only once the item is done, so `depth` reads run behind it
+					submit( )
+			finally:
+				# don't leave reads running if the consumer stops early or raises
+				for item, future in pending:
+					future.cancel()
+				self.elapsed = time.time() - start
+
+	def stats( self ):
+		'''
+		dict of the prefetching instrumentation. `read_time` is the total time spent
+		in read_func across the threads, `wait_time` the part of it the consumer was
+		blocked on, and `overlap` the fraction of the read time hidden behind compute.
+		'''
+		return _prefetch_stats( self.nitems, sum( self.read_times ), self.wait_time,
+							self.compute_time, self.elapsed, depth=self.depth, nthreads=self.nthreads )
+
+def _prefetch_stats( nitems, read_time, wait_time, compute_time, elapsed, depth=None, nthreads=None ):
+	hidden = max( read_time - wait_time, 0.0 )
+	return { 'nitems':nitems, 'depth':depth, 'nthreads':nthreads,
+			'read_time':read_time, 'wait_time':wait_time, 'compute_time':compute_time,
+			'elapsed':elapsed, 'hidden_read_time':hidden,
+			'overlap':( hidden / read_time ) if read_time > 0 else 0.0 }
+
+def merge_prefetch_stats( stats_list ):
+	''' combine the `Prefetcher.stats` of several chunks ( e.g. one per worker task ) '''
+	stats_list = [ s for s in stats_list if s is not None ]
+	if len( stats_list ) == 0:
+		return None
+	keys = [ 'nitems', 'read_time', 'wait_time', 'compute_time', 'elapsed' ]
+	totals = { k:sum( s[ k ] for s in stats_list ) for k in keys }
+	merged = _prefetch_stats( depth=stats_list[0][ 'depth' ], nthreads=stats_list[0][ 'nthreads' ], **totals )
+	merged[ 'nchunks' ] = len( stats_list )
+	return merged
@@ -0,0 +1,217 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING PROFILING CLASSES
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import os, time, threading
+from contextlib import contextmanager
+
+class TimestepProfile( object ):
+	'''
+	record per-stage wall time, bytes read and change in resident memory (RSS)
+	for a single timestep processed in a worker.
+	'''
+	def __init__( self, replicate=None, year=None, *args, **kwargs ):
+		'''
+		Arguments:
+		----------
+		replicate = [str] replicate identifier of the timestep being profiled.
+		year = [str] year of the timestep being profiled.
+
+		Returns:
+		--------
+		object of type alfresco_postprocessing.TimestepProfile
+
+		'''
+		self.replicate = replicate
+		self.year = year
+		self.pid = os.getpid()
+		self.stages = []
+		self.result_bytes = 0
+		self.rss_start = _current_rss()
+
+	@contextmanager
+	def stage( self, name, fn=None, nbytes=0 ):
+		'''
+		context manager timing the enclosed block as stage `name`. If `fn` is
+		given its size on disk is recorded as the bytes read by the stage. The
+		change in the RSS of the worker from the start to the end of the block (
+		the memory the stage holds on to, not its transient peak ) is recorded as
+		`rss_delta`. With prefetching, stages on other threads overlap and share it.
+		'''
+		start = time.time()
+		rss_start = _current_rss()
+		try:
+			yield self
+		finally:
+			end = time.time()
+			if fn is not None and os.path.exists( fn ):
+				nbytes += os.path.getsize( fn )
+			# tid separates stages run on prefetching threads from the main thread in traces
+			self.stages.append( { 'name':name, 'start':start, 'end':end, 'bytes_read':nbytes,
+								'rss_delta':_current_rss() - rss_start, 'tid':threading.get_ident() } )
+
+	def to_dict( self ):
+		''' plain dict representation that is cheap to pickle back to the parent '''
+		return { 'replicate':self.replicate, 'year':self.year, 'pid':self.pid,
+				'rss_start':self.rss_start, 'rss_end':_current_rss(), 'worker_max_rss':_max_rss(),
+				'result_bytes':self.result_bytes, 'stages':self.stages }
+
+
+class NullProfile( object ):
+	'''
+	drop-in for TimestepProfile when profiling is switched off so the
+	instrumented code paths do not need to branch.
+	'''
+	def __init__( self, *args, **kwargs ):
+		self.stages = []
+
+	@contextmanager
+	def stage( self, name, fn=None, nbytes=0 ):
+		yield self
+
+	def to_dict( self ):
+		return None
+
+
+def _current_rss( ):
+	'''
+	current resident set size of this process in bytes, from /proc/self/statm.
+	Returns 0 where /proc is unavailable.
+	'''
+	try:
+		with open( '/proc/self/statm' ) as f:
+			return int( f.read().split()[1] ) * os.sysconf( 'SC_PAGE_SIZE' )
+	except ( OSError, ValueError, IndexError ):
+		return 0
+
+def _max_rss( ):
+	'''
+	high-water mark of the resident set size of this process in bytes, i.e. the
+	largest RSS the worker reached over all the timesteps it ran so far, not the
+	peak of the current timestep. Returns 0 where the `resource` module is unavailable.
+	'''
+	try:
+		import resource, sys
+	except ImportError:
+		return 0
+	maxrss = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+	# linux reports kilobytes, macOS reports bytes
+	if sys.platform == 'darwin':
+		return int( maxrss )
+	return int( maxrss ) * 1024
+
+def summarize_profiles( profiles ):
+	'''
+	aggregate a list of TimestepProfile dicts (as returned by `to_dict`) across
+	all workers into a per-stage summary.
+
+	Arguments:
+	----------
+	profiles = [list] of dicts as returned by TimestepProfile.to_dict().
+
+	Returns:
+	--------
+	dict with keys `stages` (per-stage count, total, mean, max and 95th percentile
+	wall time in seconds, total bytes read, and the mean and max change in RSS),
+	`workers` (timesteps handled and RSS high-water mark per worker pid),
+	`ntimesteps`, `worker_max_rss` (largest high-water mark of any worker) and
+	`result_bytes` (pickled size of the records sent back to the parent).
+
+	'''
+	import numpy as np
+	profiles = [ p for p in profiles if p is not None ]
+	durations = {}
+	nbytes = {}
+	rss_deltas = {}
+	order = []
+	for prof in profiles:
+		for stage in prof[ 'stages' ]:
+			name = stage[ 'name' ]
+			if name not in durations:
+				order.append( name )
+				durations[ name ] = []
+				nbytes[ name ] = 0
+				rss_deltas[ name ] = []
+			durations[ name ].append( stage[ 'end' ] - stage[ 'start' ] )
+			nbytes[ name ] += stage[ 'bytes_read' ]
+			rss_deltas[ name ].append( stage.get( 'rss_delta', 0 ) )
+
+	stages = {}
+	for name in order:
+		arr = np.array( durations[ name ] )
+		rss = np.array( rss_deltas[ name ] )
+		stages[ name ] = { 'count':int( arr.size ),
+						'total':float( arr.sum() ),
+						'mean':float( arr.mean() ),
+						'max':float( arr.max() ),
+						'p95':float( np.percentile( arr, 95 ) ),
+						'bytes_read':int( nbytes[ name ] ),
+						'rss_delta_mean':float( rss.mean() ),
+						'rss_delta_max':int( rss.max() ) }
+
+	workers = {}
+	result_bytes = 0
+	for prof in profiles:
+		result_bytes += prof.get( 'result_bytes', 0 )
+		pid = str( prof[ 'pid' ] )
+		worker = workers.setdefault( pid, { 'ntimesteps':0, 'max_rss':0 } )
+		worker[ 'ntimesteps' ] += 1
+		worker[ 'max_rss' ] = max( worker[ 'max_rss' ], prof[ 'worker_max_rss' ] )
+
+	worker_max_rss = max([ w[ 'max_rss' ] for w in workers.values() ]) if len( workers ) > 0 else 0
+	return { 'ntimesteps':len( profiles ), 'stage_order':order, 'stages':stages,
+			'workers':workers, 'worker_max_rss':worker_max_rss, 'result_bytes':result_bytes }
+
+def to_chrome_trace( profiles ):
+	'''
+	convert TimestepProfile dicts to the Chrome trace event format, which can be
+	loaded in chrome://tracing or https://ui.perfetto.dev. Each worker pid shows
+	as its own process, with a track per thread.
+	'''
+	profiles = [ p for p in profiles if p is not None ]
+	if len( profiles ) == 0:
+		return { 'traceEvents':[] }
+	t0 = min([ s[ 'start' ] for p in profiles for s in p[ 'stages' ] ] or [ 0 ])
+	events = []
+	for prof in profiles:
+		for stage in prof[ 'stages' ]:
+			events.append( { 'name':stage[ 'name' ], 'ph':'X', 'pid':prof[ 'pid' ], 'tid':stage.get( 'tid', prof[ 'pid' ] ),
+							'ts':( stage[ 'start' ] - t0 ) * 1e6,
+							'dur':( stage[ 'end' ] - stage[ 'start' ] ) * 1e6,
+							'args':{ 'replicate':prof[ 'replicate' ], 'year':prof[ 'year' ],
+									'bytes_read':stage[ 'bytes_read' ],
+									'rss_delta':stage.get( 'rss_delta', 0 ) } } )
+	return { 'traceEvents':events, 'displayTimeUnit':'ms' }
+
+def write_profile_report( profiles, out_fn, trace_fn=None, extra=None ):
+	'''
+	write the aggregated profiling summary to JSON at `out_fn` and optionally the
+	raw per-timestep events as a Chrome trace JSON at `trace_fn`.
+
+	Arguments:
+	----------
+	profiles = [list] of dicts as returned by TimestepProfile.to_dict().
+	out_fn = [str] path to the summary JSON to be written.
+	trace_fn = [str] path to the Chrome trace JSON to be written. default:None (not written)
+	extra = [dict] additional parent-side timings (e.g. pool map, db insert) to store
+		in the summary under the `parent` key. default:None
+
+	Returns:
+	--------
+	dict summary that was written to `out_fn`.
+
+	'''
+	import json
+	summary = summarize_profiles( profiles )
+	if extra is not None:
+		summary[ 'parent' ] = extra
+	with open( out_fn, 'w' ) as f:
+		json.dump( summary, f, indent=2 )
+	if trace_fn is not None:
+		with open( trace_fn, 'w' ) as f:
+			json.dump( to_chrome_trace( profiles ), f )
+	return summary
+
+def profile_filenames( out_json_fn ):
+	''' summary and trace filenames stored alongside the output database '''
+	base, ext = os.path.splitext( out_json_fn )
+	return base + '_profile.json', base + '_trace.json'
@@ -0,0 +1,202 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING LOOKUP TABLE RECLASSIFICATION
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import os, rasterio
+import numpy as np
+
+# default forest classes of the ALFRESCO Veg maps ( Black Spruce, White Spruce, Deciduous )
+FOREST_VALUES = [ 1, 2, 3 ]
+# and tundra classes ( Shrub, Graminoid and Wetland Tundra )
+TUNDRA_VALUES = [ 4, 5, 6 ]
+
+# treeline change classes
+TREELINE_NONFOREST = 0
+TREELINE_FOREST = 1 # forest at the first year
+TREELINE_EXPANSION = 2 # not forest at the first year, forest at the second
+TREELINE_NODATA = 255
+TREELINE_CMAP = { 0:( 182, 185, 191, 255 ),
+				1:( 95, 135, 36, 255 ),
+				2:( 72, 55, 87, 255 ),
+				255:( 0, 0, 0, 255 ) }
+
+# ( first year class * 3 + second year class ) -> treeline change class, for the
+# classes 0 nonforest, 1 forest, 2 nodata. The mask follows the first year.
+_TREELINE_PAIRS = np.array( [ TREELINE_NONFOREST, TREELINE_EXPANSION, TREELINE_NONFOREST,
+							TREELINE_FOREST, TREELINE_FOREST, TREELINE_FOREST,
+							TREELINE_NODATA, TREELINE_NODATA, TREELINE_NODATA ], dtype=np.uint8 )
+
+def reclass_lut( groups, default=0, size=256, dtype=np.uint8 ):
+	'''
+	build a lookup table mapping each input class to its new class.
+
+	Arguments:
+	----------
+	groups = [dict] new class:list of the input classes that become it.
+	default = [int] new class of the input classes not in any group. default:0
+	size = [int] number of input classes, 256 covers every uint8 value. default:256
+	dtype = [numpy.dtype] dtype of the output classes. default:numpy.uint8
+
+	Returns:
+	--------
+	numpy.ndarray lookup table for `reclassify`.
+
+	'''
+	lut = np.full( size, default, dtype=dtype )
+	for new_value, values in groups.items():
+		lut[ list( values ) ] = new_value
+	return lut
+
+def reclassify( arr, lut, out=None ):
+	'''
+	reclassify a class raster with a lookup table from `reclass_lut` in a single
+	indexing pass, lut[ arr ], instead of a masked assignment per class.
+	'''
+	arr = np.asarray( arr )
+	if arr.dtype != np.uint8 or len( lut ) < 256:
+		if arr.size > 0 and ( arr.min() < 0 or arr.max() >= len( lut ) ):
+			raise ValueError( 'classes outside of the lookup table range 0-%d' % ( len( lut ) - 1 ) )
+	return np.take( lut, arr, out=out )
+
+def _forest_lut( forest_values=FOREST_VALUES, nodata=TREELINE_NODATA ):
+	''' Veg class -> 0 nonforest, 1 forest, 2 nodata '''
+	return reclass_lut( { 1:forest_values, 2:[] if nodata is None else [ int( nodata ) ] } )
+
+def treeline_change_codes( t1_arr, t2_arr, forest_values=FOREST_VALUES, nodata=TREELINE_NODATA ):
+	'''
+	treeline change between two Veg rasters of the same replicate.
+
+	Arguments:
+	----------
+	t1_arr, t2_arr = [numpy.ndarray] uint8 Veg class rasters ( or windows of them ) of
+		the first and the second year.
+	forest_values = [list] Veg classes counted as forest. default:[1, 2, 3]
+	nodata = [int] Veg nodata value. default:255
+
+	Returns:
+	--------
+	numpy.ndarray uint8 with TREELINE_FOREST ( 1 ) where t1 is forest, TREELINE_EXPANSION
+	( 2 ) where t1 is not forest and t2 is, TREELINE_NONFOREST ( 0 ) elsewhere and
+	TREELINE_NODATA ( 255 ) where t1 is nodata.
+
+	'''
+	lut = _forest_lut( forest_values, nodata )
+	codes = reclassify( t1_arr, lut )
+	codes *= 3
+	codes += reclassify( t2_arr, lut )
+	return np.take( _TREELINE_PAIRS, codes )
+
+def _treeline_filename( output_path, label, year1, year2 ):
+	return os.path.join( output_path, 'TreelineExpansion_%s_%s_%s.tif' % ( label, year1, year2 ) )
+
+def _treeline_replicate( task, output_path=None, forest_values=FOREST_VALUES, window_rows=1024 ):
+	'''
+	treeline change of one replicate and year pair, streamed through both Veg rasters
+	`window_rows` rows at a time. Writes the change raster if output_path is given and
+	returns the expansion and valid masks bit-packed along the rows for the
+	across-replicate frequency.
+	'''
+	from rasterio.windows import Window
+	from alfresco_postprocessing.reducers import _tif_meta, _makedirs_for
+	rep, ( year1, fn1 ), ( year2, fn2 ) = task
+	out_fn = None
+	with rasterio.open( fn1 ) as t1, rasterio.open( fn2 ) as t2:
+		if t1.shape != t2.shape:
+			raise ValueError( 'Veg rasters differ in shape: %s %s' % ( fn1, fn2 ) )
+		height, width = t1.shape
+		nodata = TREELINE_NODATA if t1.nodata is None else t1.nodata
+		meta = t1.meta.copy()
+		expanded = np.zeros( ( height, ( width + 7 ) // 8 ), dtype=np.uint8 )
+		valid = np.zeros_like( expanded )
+		dst = None
+		if output_path is not None:
+			out_fn = _treeline_filename( output_path, rep, year1, year2 )
+			dst = rasterio.open( _makedirs_for( out_fn ), 'w', **_tif_meta( meta, np.uint8, TREELINE_NODATA ) )
+		try:
+			for row in range( 0, height, window_rows ):
+				window = Window( 0, row, width, min( window_rows, height - row ) )
+				codes = treeline_change_codes( t1.read( 1, window=window ), t2.read( 1, window=window ), forest_values, nodata )
+				if dst is not None:
+					dst.write( codes, 1, window=window )
+				rows = slice( row, row + codes.shape[0] )
+				expanded[ rows ] = np.packbits( codes == TREELINE_EXPANSION, axis=1 )
+				valid[ rows ] = np.packbits( codes != TREELINE_NODATA, axis=1 )
+			if dst is not None:
+				dst.write_colormap( 1, TREELINE_CMAP )
+		finally:
+			if dst is not None:
+				dst.close()
+	return { 'replicate':rep, 'years':( year1, year2 ), 'filename':out_fn, 'meta':meta,
+			'expanded':expanded, 'valid':valid }
+
+def treeline_expansion( maps_path, output_path, year_pairs, replicates=None, forest_values=FOREST_VALUES,
+	ncores=None, per_replicate=True, window_rows=1024 ):
+	'''
+	treeline change rasters for every replicate and pair of years of an ALFRESCO run,
+	and the frequency of expansion across the replicates. Each replicate x year pair
+	is a task of its own, read and reclassified window by window.
+
+	Arguments:
+	----------
+	maps_path = [str] path to an ALFRESCO output Maps directory. year sub-directories are ok.
+	output_path = [str] directory to write the GeoTiffs to.
+	year_pairs = [list] of ( first_year, second_year ) tuples.
+	replicates = [list] replicates to process. default:None (all)
+	forest_values = [list] Veg classes counted as forest. default:[1, 2, 3]
+	ncores = [int] number of processes. default:None (cpu count)
+	per_replicate = [bool] write the change raster of each replicate,
+		`TreelineExpansion_<rep>_<year1>_<year2>.tif` ( uint8 classes, see
+		`treeline_change_codes`, with a colormap ). default:True
+	window_rows = [int] number of raster rows read at a time. default:1024
+
+	Returns:
+	--------
+	dict of ( year1, year2 ):{ 'frequency':filename, 'replicates':{ replicate:filename } }.
+	The frequency raster `TreelineExpansion_allreps_<year1>_<year2>.tif` holds the
+	fraction of replicates where the pixel became forest (float32, -9999 nodata).
+
+	'''
+	import multiprocessing
+	from functools import partial
+	from alfresco_postprocessing.reducers import _variable_files, _write_tif, FRI_NODATA
+	files = _variable_files( maps_path, 'Veg' )
+	if replicates is not None:
+		files = { rep:fns for rep, fns in files.items() if rep in [ str( r ) for r in replicates ] }
+	year_pairs = [ ( int( year1 ), int( year2 ) ) for year1, year2 in year_pairs ]
+	tasks = []
+	for rep, rep_files in sorted( files.items() ):
+		rep_files = dict( rep_files )
+		for year1, year2 in year_pairs:
+			if year1 in rep_files and year2 in rep_files:
+				tasks.append( ( rep, ( year1, rep_files[ year1 ] ), ( year2, rep_files[ year2 ] ) ) )
+	if len( tasks ) == 0:
+		raise ValueError( 'no Veg files for the years %s found in %s' % ( year_pairs, maps_path ) )
+
+	f = partial( _treeline_replicate, output_path=output_path if per_replicate else None,
+				forest_values=list( forest_values ), window_rows=window_rows )
+	ncores = min( ncores or multiprocessing.cpu_count(), len( tasks ) )
+	totals = {}
+	with multiprocessing.Pool( ncores ) as pool:
+		for res in pool.imap_unordered( f, tasks ):
+			width = res[ 'meta' ][ 'width' ]
+			expanded = np.unpackbits( res[ 'expanded' ], axis=1, count=width ).astype( bool )
+			valid = np.unpackbits( res[ 'valid' ], axis=1, count=width ).astype( bool )
+			total = totals.get( res[ 'years' ] )
+			if total is None:
+				total = totals[ res[ 'years' ] ] = { 'meta':res[ 'meta' ], 'valid':valid, 'nreps':0,
+													'count':np.zeros( expanded.shape, dtype=np.uint16 ), 'replicates':{} }
+			else:
+				total[ 'valid' ] &= valid
+			total[ 'count' ] += expanded
+			total[ 'nreps' ] += 1
+			if res[ 'filename' ] is not None:
+				total[ 'replicates' ][ res[ 'replicate' ] ] = res[ 'filename' ]
+		pool.close()
+		pool.join()
+
+	out = {}
+	for ( year1, year2 ), total in sorted( totals.items() ):
+		frequency = np.full( total[ 'count' ].shape, FRI_NODATA, dtype=np.float32 )
+		frequency[ total[ 'valid' ] ] = total[ 'count' ][ total[ 'valid' ] ] / float( total[ 'nreps' ] )
+		fn = _write_tif( _treeline_filename( output_path, 'allreps', year1, year2 ), frequency, total[ 'meta' ], FRI_NODATA )
+		out[ ( year1, year2 ) ] = { 'frequency':fn, 'replicates':dict( sorted( total[ 'replicates' ].items() ) ) }
+	return out
@@ -0,0 +1,415 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING STREAMING RASTER REDUCERS
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import os, rasterio
+import numpy as np
+
+FRI_NODATA = -9999
+COUNT_NODATA = 65535
+
+class FireReturnAccumulator( object ):
+	'''
+	per-pixel fire history of a single replicate, updated one year at a time so
+	that only one FireScar raster is in memory at once. Keeps the last burn year
+	(uint16, 0 = never), the burn count (uint16) and the sum of the intervals
+	between successive burns (uint32) -- 8 bytes per pixel.
+	'''
+	def __init__( self, shape, *args, **kwargs ):
+		'''
+		Arguments:
+		----------
+		shape = [tuple] ( height, width ) of the FireScar rasters.
+
+		Returns:
+		--------
+		object of type alfresco_postprocessing.FireReturnAccumulator
+
+		'''
+		self.last_burn = np.zeros( shape, dtype=np.uint16 )
+		self.burn_count = np.zeros( shape, dtype=np.uint16 )
+		self.interval_sum = np.zeros( shape, dtype=np.uint32 )
+		self.valid = np.ones( shape, dtype=bool )
+		self.years = []
+
+	def update( self, year, burned, valid=None ):
+		'''
+		add a year. `burned` is a boolean array of the pixels that burned in `year`,
+		`valid` optionally masks pixels outside of the AOI. Years must be added in order.
+		'''
+		if len( self.years ) > 0 and year <= self.years[ -1 ]:
+			raise ValueError( 'years must be added in increasing order, got %s after %s' % ( year, self.years[ -1 ] ) )
+		self.years.append( year )
+		if valid is not None:
+			self.valid &= valid
+		idx = np.flatnonzero( burned )
+		last = self.last_burn.ravel()
+		reburn = idx[ last[ idx ] > 0 ]
+		self.interval_sum.ravel()[ reburn ] += ( year - last[ reburn ] ).astype( np.uint32 )
+		self.burn_count.ravel()[ idx ] += 1
+		last[ idx ] = year
+		return self
+
+	def mean_fri( self ):
+		''' mean interval between successive burns (float32), FRI_NODATA where fewer than two burns '''
+		out = np.full( self.burn_count.shape, FRI_NODATA, dtype=np.float32 )
+		ok = ( self.burn_count > 1 ) & self.valid
+		out[ ok ] = self.interval_sum[ ok ] / ( self.burn_count[ ok ] - 1 ).astype( np.float32 )
+		return out
+
+	def time_since_fire( self, reference_year=None ):
+		''' years from the last burn to `reference_year` (default the last year added), COUNT_NODATA if never burned '''
+		reference_year = self.years[ -1 ] if reference_year is None else reference_year
+		out = np.full( self.burn_count.shape, COUNT_NODATA, dtype=np.uint16 )
+		ok = ( self.last_burn > 0 ) & self.valid
+		out[ ok ] = reference_year - self.last_burn[ ok ]
+		return out
+
+	def counts( self ):
+		''' burn count (uint16), COUNT_NODATA outside the AOI '''
+		return np.where( self.valid, self.burn_count, COUNT_NODATA ).astype( np.uint16 )
+
+
+def _variable_files( maps_path, variable, begin_year=None, end_year=None ):
+	''' {replicate:[ ( year, fn ), ... ]} of the `variable` rasters in year order '''
+	from alfresco_postprocessing.postprocess import FileLister
+	fl = FileLister( maps_path )
+	df = fl.files_df[ fl.files_df[ 'variable' ] == variable ]
+	out = {}
+	for rep, year, obj in zip( df[ 'replicate' ], df[ 'year' ], df[ 'object' ] ):
+		year = int( year )
+		if ( begin_year is not None and year < begin_year ) or ( end_year is not None and year > end_year ):
+			continue
+		out.setdefault( str( rep ), [] ).append( ( year, obj.fn ) )
+	return { rep:sorted( files ) for rep, files in out.items() }
+
+def _firescar_files( maps_path, begin_year=None, end_year=None ):
+	''' {replicate:[ ( year, fn ), ... ]} of the FireScar rasters in year order '''
+	return _variable_files( maps_path, 'FireScar', begin_year, end_year )
+
+def _tif_meta( meta, dtype, nodata ):
+	''' single band, tiled, LZW compressed output profile from a template raster meta '''
+	meta = dict( meta, count=1, dtype=str( np.dtype( dtype ) ), nodata=nodata, compress='lzw', tiled=True, blockxsize=256, blockysize=256 )
+	if meta[ 'width' ] < 256 or meta[ 'height' ] < 256:
+		meta.update( tiled=False )
+		meta.pop( 'blockxsize' ); meta.pop( 'blockysize' )
+	return meta
+
+def _makedirs_for( fn ):
+	dirname = os.path.dirname( fn )
+	if dirname and not os.path.exists( dirname ):
+		os.makedirs( dirname, exist_ok=True )
+	return fn
+
+def _write_tif( fn, arr, meta, nodata ):
+	with rasterio.open( _makedirs_for( fn ), 'w', **_tif_meta( meta, arr.dtype, nodata ) ) as out:
+		out.write( arr, 1 )
+	return fn
+
+def _fri_filenames( output_path, label, begin_year, end_year ):
+	suffix = '_%s_%s_%s.tif' % ( label, begin_year, end_year )
+	return { 'mean_fri':os.path.join( output_path, 'MeanFRI' + suffix ),
+			'burn_count':os.path.join( output_path, 'BurnCount' + suffix ),
+			'time_since_fire':os.path.join( output_path, 'TimeSinceFire' + suffix ) }
+
+def _fri_replicate( rep_files, output_path=None, begin_year=None, end_year=None, band=2 ):
+	'''
+	stream one replicate's FireScar rasters through a FireReturnAccumulator. writes
+	the per-replicate rasters if output_path is given and returns the accumulator
+	arrays for the across-replicate summary.
+	'''
+	rep, files = rep_files
+	acc = None
+	for year, fn in files:
+		with rasterio.open( fn ) as rst:
+			arr = rst.read( band )
+			if acc is None:
+				acc = FireReturnAccumulator( arr.shape )
+				meta = rst.meta.copy()
+			nodata = rst.nodatavals[ band - 1 ]
+		valid = arr != nodata if nodata is not None else None
+		acc.update( year, arr > 0, valid=valid ) # burned this year where the fire id is set, as in Fire
+	begin_year = files[0][0] if begin_year is None else begin_year
+	end_year = files[ -1 ][0] if end_year is None else end_year
+	if output_path is not None:
+		fns = _fri_filenames( output_path, rep, begin_year, end_year )
+		_write_tif( fns[ 'mean_fri' ], acc.mean_fri(), meta, FRI_NODATA )
+		_write_tif( fns[ 'burn_count' ], acc.counts(), meta, COUNT_NODATA )
+		_write_tif( fns[ 'time_since_fire' ], acc.time_since_fire( end_year ), meta, COUNT_NODATA )
+	return { 'replicate':rep, 'meta':meta, 'valid':acc.valid, 'burn_count':acc.burn_count,
+			'interval_sum':acc.interval_sum, 'time_since_fire':acc.time_since_fire( end_year ) }
+
+def fire_return_interval( maps_path, output_path, begin_year=None, end_year=None, ncores=None, per_replicate=True, band=2 ):
+	'''
+	compute per-pixel fire return interval, burn count and time since fire rasters
+	from the FireScar outputs of an ALFRESCO run in a single streaming pass.
+
+	Each replicate's FireScar rasters are read in year order by its own worker,
+	keeping only compact per-pixel accumulators ( last burn year, burn count and
+	the sum of intervals between burns ) in memory. The per-replicate results are
+	folded into the across-replicate summary as they arrive.
+
+	Arguments:
+	----------
+	maps_path = [str] path to an ALFRESCO output Maps directory. year sub-directories are ok.
+	output_path = [str] directory to write the GeoTiffs to.
+	begin_year, end_year = [int] inclusive range of years to use. default:None (all)
+	ncores = [int] number of processes, at most one per replicate. default:None (cpu count)
+	per_replicate = [bool] write the rasters of each replicate as well as the
+		across-replicate summary. default:True
+	band = [int] FireScar band holding the fire ids of the year ( > 0 where burned ). default:2
+
+	Returns:
+	--------
+	dict of output name:filename of the across-replicate rasters:
+		`mean_fri` -- intervals between burns pooled over all replicates (float32),
+		`burn_count` -- mean number of burns per replicate (float32),
+		`time_since_fire` -- mean years since the last burn over the replicates
+			where the pixel burned (float32).
+
+	'''
+	import multiprocessing
+	from functools import partial
+	files = _firescar_files( maps_path, begin_year, end_year )
+	if len( files ) == 0:
+		raise ValueError( 'no FireScar files found in %s' % maps_path )
+	all_years = [ year for rep_files in files.values() for year, fn in rep_files ]
+	begin_year = min( all_years ) if begin_year is None else begin_year
+	end_year = max( all_years ) if end_year is None else end_year
+
+	f = partial( _fri_replicate, output_path=output_path if per_replicate else None,
+				begin_year=begin_year, end_year=end_year, band=band )
+	ncores = min( ncores or multiprocessing.cpu_count(), len( files ) )
+
+	total = None
+	with multiprocessing.Pool( ncores ) as pool:
+		for res in pool.imap_unordered( f, sorted( files.items() ) ):
+			if total is None:
+				shape = res[ 'burn_count' ].shape
+				total = { 'meta':res[ 'meta' ], 'valid':res[ 'valid' ].copy(), 'nreps':0,
+						'burn_count':np.zeros( shape, dtype=np.uint32 ),
+						'interval_sum':np.zeros( shape, dtype=np.uint64 ),
+						'nintervals':np.zeros( shape, dtype=np.uint32 ),
+						'tsf_sum':np.zeros( shape, dtype=np.uint32 ),
+						'tsf_count':np.zeros( shape, dtype=np.uint16 ) }
+			total[ 'nreps' ] += 1
+			total[ 'valid' ] &= res[ 'valid' ]
+			total[ 'burn_count' ] += res[ 'burn_count' ]
+			total[ 'interval_sum' ] += res[ 'interval_sum' ]
+			total[ 'nintervals' ] += np.maximum( res[ 'burn_count' ].astype( np.int32 ) - 1, 0 ).astype( np.uint32 )
+			burned = res[ 'time_since_fire' ] != COUNT_NODATA
+			total[ 'tsf_sum' ][ burned ] += res[ 'time_since_fire' ][ burned ]
+			total[ 'tsf_count' ] += burned
+		pool.close()
+		pool.join()
+
+	valid = total[ 'valid' ]
+	mean_fri = np.full( valid.shape, FRI_NODATA, dtype=np.float32 )
+	ok = valid & ( total[ 'nintervals' ] > 0 )
+	mean_fri[ ok ] = total[ 'interval_sum' ][ ok ] / total[ 'nintervals' ][ ok ]
+	burn_count = np.where( valid, total[ 'burn_count' ] / float( total[ 'nreps' ] ), FRI_NODATA ).astype( np.float32 )
+	tsf = np.full( valid.shape, FRI_NODATA, dtype=np.float32 )
+	ok = valid & ( total[ 'tsf_count' ] > 0 )
+	tsf[ ok ] = total[ 'tsf_sum' ][ ok ] / total[ 'tsf_count' ][ ok ]
+
+	fns = _fri_filenames( output_path, 'allreps', begin_year, end_year )
+	_write_tif( fns[ 'mean_fri' ], mean_fri, total[ 'meta' ], FRI_NODATA )
+	_write_tif( fns[ 'burn_count' ], burn_count, total[ 'meta' ], FRI_NODATA )
+	_write_tif( fns[ 'time_since_fire' ], tsf, total[ 'meta' ], FRI_NODATA )
+	return fns
+
+def _burn_year_replicate( rep_files, output_path, begin_year, end_year, min_year=None, band=1 ):
+	'''
+	stream one replicate's FireScar band 1 ( year of last burn ) in year order into
+	a uint16 last-burn-year composite and its decade, and write both.
+	'''
+	rep, files = rep_files
+	out = None
+	for year, fn in files:
+		with rasterio.open( fn ) as rst:
+			arr = rst.read( band )
+			if out is None:
+				out = np.zeros( arr.shape, dtype=np.uint16 )
+				meta = rst.meta.copy()
+			nodata = rst.nodatavals[ band - 1 ]
+		update = arr > 0
+		if nodata is not None:
+			update &= arr != nodata
+		if min_year is not None:
+			# band 1 carries burns from before the period forward
+			update &= arr >= min_year
+		np.copyto( out, arr, where=update, casting='unsafe' )
+	decade = ( out // 10 ) * 10 # 0 ( never burned ) stays 0
+	fns = { 'burn_year':os.path.join( output_path, 'BurnYear_%s_%s_%s.tif' % ( rep, begin_year, end_year ) ),
+			'burn_decade':os.path.join( output_path, 'BurnDecade_%s_%s_%s.tif' % ( rep, begin_year, end_year ) ) }
+	_write_tif( fns[ 'burn_year' ], out, meta, 0 )
+	_write_tif( fns[ 'burn_decade' ], decade, meta, 0 )
+	return rep, fns
+
+def burn_year_composites( maps_path, output_path, begin_year=None, end_year=None, replicates=None, ncores=None, band=1 ):
+	'''
+	build the last-burn-year and last-burn-decade composites of every replicate
+	from FireScar band 1, with the replicates processed in parallel and each one
+	streamed a raster at a time.
+
+	Arguments:
+	----------
+	maps_path = [str] path to an ALFRESCO output Maps directory. year sub-directories are ok.
+	output_path = [str] directory to write `BurnYear_<rep>_<begin>_<end>.tif` and
+		`BurnDecade_<rep>_<begin>_<end>.tif` to ( uint16, tiled, LZW, 0 = not burned ).
+	begin_year, end_year = [int] inclusive range of years to use. Burns before
+		begin_year are left out. default:None (all)
+	replicates = [list] replicates to process. default:None (all)
+	ncores = [int] number of processes. default:None (cpu count)
+	band = [int] FireScar band holding the year of last burn. default:1
+
+	Returns:
+	--------
+	dict of replicate:{ 'burn_year':filename, 'burn_decade':filename }
+
+	'''
+	import multiprocessing
+	from functools import partial
+	files = _firescar_files( maps_path, begin_year, end_year )
+	if replicates is not None:
+		files = { rep:fns for rep, fns in files.items() if rep in [ str( r ) for r in replicates ] }
+	if len( files ) == 0:
+		raise ValueError( 'no FireScar files found in %s' % maps_path )
+	all_years = [ year for rep_files in files.values() for year, fn in rep_files ]
+	min_year = begin_year
+	begin_year = min( all_years ) if begin_year is None else begin_year
+	end_year = max( all_years ) if end_year is None else end_year
+
+	f = partial( _burn_year_replicate, output_path=output_path, begin_year=begin_year, end_year=end_year,
+				min_year=min_year, band=band )
+	ncores = min( ncores or multiprocessing.cpu_count(), len( files ) )
+	with multiprocessing.Pool( ncores ) as pool:
+		out = dict( pool.imap_unordered( f, sorted( files.items() ) ) )
+		pool.close()
+		pool.join()
+	return out
+
+def _tiles( height, width, tile_size ):
+	''' ( row_off, col_off, nrows, ncols ) of the tiles covering a raster '''
+	return [ ( row, col, min( tile_size, height - row ), min( tile_size, width - col ) ) \
+			for row in range( 0, height, tile_size ) for col in range( 0, width, tile_size ) ]
+
+def _tundra_basal_tile( task, tundra_fn, tundra_values ):
+	'''
+	mean across replicates of the basal area of the pixels that are tundra both in
+	the input veg map and in the replicate's Veg of the year, for one year and tile.
+	Replicates are added to a running sum one at a time.
+	'''
+	from rasterio.windows import Window
+	from alfresco_postprocessing.reclass import reclass_lut, reclassify
+	year, ( row, col, nrows, ncols ), rep_files = task
+	window = Window( col, row, ncols, nrows )
+	# the precomputed mask is memory mapped, only the tile is read
+	tundra = np.load( tundra_fn, mmap_mode='r' )[ row:row + nrows, col:col + ncols ]
+	tundra_lut = reclass_lut( { 1:tundra_values } )
+	total = np.zeros( tundra.shape, dtype=np.float64 )
+	for basal_fn, veg_fn in rep_files:
+		with rasterio.open( basal_fn ) as rst:
+			basal = rst.read( 1, window=window )
+		with rasterio.open( veg_fn ) as rst:
+			veg = rst.read( 1, window=window )
+		keep = ( tundra == 1 ) & ( reclassify( veg, tundra_lut ) == 1 ) & ( basal > 0 )
+		total[ keep ] += basal[ keep ]
+	out = ( total / len( rep_files ) ).astype( np.float32 )
+	out[ tundra == 255 ] = FRI_NODATA
+	return year, window, out
+
+def _read_aligned( fn, template, fill_value ):
+	''' band 1 of `fn` over the extent of the rasterio `template` ( e.g. a larger input map ) '''
+	from rasterio.windows import from_bounds
+	with rasterio.open( fn ) as rst:
+		window = from_bounds( *template.bounds, transform=rst.transform ).round_offsets().round_lengths()
+		arr = rst.read( 1, window=window, boundless=True, fill_value=fill_value )
+	if arr.shape != template.shape:
+		raise ValueError( '%s does not align with the ALFRESCO outputs %s' % ( fn, template.name ) )
+	return arr
+
+def tundra_basal_area_change( maps_path, output_path, vegmap_fn, begin_year=None, end_year=None, replicates=None,
+	tundra_values=None, ncores=None, tile_size=1024 ):
+	'''
+	for each year, the mean across replicates of the basal area of the pixels that
+	were tundra in the input veg map and are still tundra in the replicate's Veg
+	output ( 0 elsewhere ) -- a map of the likelihood of tundra -> spruce transition.
+
+	The tundra mask of the input veg map is computed once and memory mapped by the
+	workers. Each year x tile is a task of its own that sums the replicates one at
+	a time, so the memory used is bounded by the tile size whatever the number of
+	replicates or years.
+
+	Arguments:
+	----------
+	maps_path = [str] path to an ALFRESCO output Maps directory. year sub-directories are ok.
+	output_path = [str] directory to write `alfresco_basalchange_acrossreps_<year>.tif` to
+		( float32, -9999 where the input veg map is 255 or does not cover the outputs ).
+	vegmap_fn = [str] path to the input veg ( land cover ) map of the run. A larger map
+		is read over the extent of the outputs.
+	begin_year, end_year = [int] inclusive range of years to use. default:None (all)
+	replicates = [list] replicates to use. default:None (all)
+	tundra_values = [list] Veg classes counted as tundra. default:None (TUNDRA_VALUES, 4 5 6)
+	ncores = [int] number of processes. default:None (cpu count)
+	tile_size = [int] height and width of the tiles in pixels. default:1024
+
+	Returns:
+	--------
+	dict of year:filename
+
+	'''
+	import multiprocessing, tempfile, shutil
+	from functools import partial
+	from alfresco_postprocessing.reclass import TUNDRA_VALUES, reclass_lut, reclassify
+	tundra_values = TUNDRA_VALUES if tundra_values is None else list( tundra_values )
+	basal_files = _variable_files( maps_path, 'BasalArea', begin_year, end_year )
+	veg_files = _variable_files( maps_path, 'Veg', begin_year, end_year )
+	if replicates is not None:
+		basal_files = { rep:fns for rep, fns in basal_files.items() if rep in [ str( r ) for r in replicates ] }
+	by_year = {}
+	for rep, rep_files in sorted( basal_files.items() ):
+		rep_veg = dict( veg_files.get( rep, [] ) )
+		for year, basal_fn in rep_files:
+			if year in rep_veg:
+				by_year.setdefault( year, [] ).append( ( basal_fn, rep_veg[ year ] ) )
+	if len( by_year ) == 0:
+		raise ValueError( 'no BasalArea and Veg files found in %s' % maps_path )
+
+	with rasterio.open( by_year[ min( by_year ) ][0][0] ) as template:
+		meta = template.meta.copy()
+		vegmap = _read_aligned( vegmap_fn, template, fill_value=255 )
+	# 1 tundra, 0 other classes, 255 outside of the input map
+	tundra = reclassify( vegmap, reclass_lut( { 1:tundra_values, 255:[ 255 ] } ) )
+	del vegmap
+	tmpdir = tempfile.mkdtemp( prefix='alfpp_tundra_' )
+	tundra_fn = os.path.join( tmpdir, 'tundra.npy' )
+	np.save( tundra_fn, tundra )
+	del tundra
+
+	tiles = _tiles( meta[ 'height' ], meta[ 'width' ], tile_size )
+	tasks = [ ( year, tile, by_year[ year ] ) for year in sorted( by_year ) for tile in tiles ]
+	f = partial( _tundra_basal_tile, tundra_fn=tundra_fn, tundra_values=tundra_values )
+	ncores = min( ncores or multiprocessing.cpu_count(), len( tasks ) )
+
+	out, open_files = {}, {}
+	out_meta = _tif_meta( meta, np.float32, FRI_NODATA )
+	try:
+		with multiprocessing.Pool( ncores ) as pool:
+			# tasks are handed out year by year, so only the years in flight are open for writing
+			for year, window, arr in pool.imap_unordered( f, tasks ):
+				if year not in open_files:
+					out[ year ] = os.path.join( output_path, 'alfresco_basalchange_acrossreps_%s.tif' % year )
+					open_files[ year ] = [ rasterio.open( _makedirs_for( out[ year ] ), 'w', **out_meta ), len( tiles ) ]
+				dst = open_files[ year ]
+				dst[0].write( arr, 1, window=window )
+				dst[1] -= 1
+				if dst[1] == 0:
+					dst[0].close()
+					del open_files[ year ]
+			pool.close()
+			pool.join()
+	finally:
+		for dst, remaining in open_files.values():
+			dst.close()
+		shutil.rmtree( tmpdir, ignore_errors=True )
+	return dict( sorted( out.items() ) )
@@ -0,0 +1,187 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING HIERARCHICAL DOMAIN ROLL-UP
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import numpy as np
+
+# metrics that count fires, and so can't be summed over child domains -- a fire
+# crossing a boundary is in both children. they are rolled up from a FireTable.
+FIRE_COUNT_METRICS = [ 'all_fire_sizes', 'avg_fire_size', 'number_of_fires' ]
+# metrics that are pixel counts and can simply be summed over child domains
+SUMMABLE_METRICS = [ 'total_area_burned', 'veg_counts', 'severity_counts' ]
+
+def domain_ancestors( hierarchy ):
+	'''
+	resolve a child->parent domain mapping transitively.
+
+	Arguments:
+	----------
+	hierarchy = [dict] child domain name:parent domain name, e.g.
+		{ 'FMZ 1':'Interior', 'FMZ 2':'Interior', 'Interior':'Statewide' }
+
+	Returns:
+	--------
+	dict of domain:[ parent, grandparent, ... ] for every domain in the hierarchy.
+
+	'''
+	hierarchy = { str( k ):str( v ) for k, v in hierarchy.items() }
+	ancestors = {}
+	for domain in set( hierarchy.keys() ) | set( hierarchy.values() ):
+		chain, node = [], domain
+		while node in hierarchy:
+			node = hierarchy[ node ]
+			if node == domain or node in chain:
+				raise ValueError( 'domain hierarchy has a cycle through %s' % domain )
+			chain.append( node )
+		ancestors[ domain ] = chain
+	return ancestors
+
+def _merge_fires( replicate, year, domain, fire_id, pixels, veg=None, severity=None ):
+	'''
+	collapse rows of the same fire in the same domain ( the pieces of a fire that
+	spans several child domains ) into one. Pixels are summed, the dominant veg is
+	taken from the largest piece and the severity is the pixel weighted mean.
+	'''
+	order = np.lexsort( ( pixels, fire_id, domain, year, replicate ) )
+	keys = [ arr[ order ] for arr in ( replicate, year, domain, fire_id ) ]
+	change = np.zeros( len( order ), dtype=bool )
+	change[ :1 ] = True
+	for arr in keys:
+		change[ 1: ] |= arr[ 1: ] != arr[ :-1 ]
+	starts = np.flatnonzero( change )
+	ends = np.append( starts[ 1: ], len( order ) ) - 1 # largest piece, pixels sort ascending
+
+	out = { 'replicate':keys[0][ starts ], 'year':keys[1][ starts ], 'domain':keys[2][ starts ], 'fire_id':keys[3][ starts ] }
+	out[ 'pixels' ] = np.add.reduceat( pixels[ order ], starts ) if len( order ) > 0 else pixels[ :0 ]
+	if veg is not None:
+		out[ 'veg' ] = veg[ order ][ ends ]
+	if severity is not None:
+		sev = severity[ order ].astype( np.float64 )
+		weight = np.where( np.isnan( sev ), 0, pixels[ order ] )
+		if len( order ) > 0:
+			with np.errstate( invalid='ignore', divide='ignore' ):
+				out[ 'severity' ] = np.add.reduceat( np.nan_to_num( sev ) * weight, starts ) / np.add.reduceat( weight, starts )
+		else:
+			out[ 'severity' ] = sev
+	return out
+
+def rollup_fire_table( table, hierarchy, include_children=True ):
+	'''
+	aggregate a FireTable computed at the finest domain level up a domain
+	hierarchy without touching the rasters. Each fire is counted once per parent
+	domain even when it burned in several of its children.
+
+	Arguments:
+	----------
+	table = [alfresco_postprocessing.FireTable] per-fire table of the finest domains.
+	hierarchy = [dict] child->parent domain names, applied transitively ( see domain_ancestors ).
+	include_children = [bool] keep the rows of the input domains alongside the parents.
+		default:True
+
+	Returns:
+	--------
+	alfresco_postprocessing.FireTable with a `domains` list holding the ( child and )
+	parent domains.
+
+	'''
+	from alfresco_postprocessing.firetable import FireTable
+	ancestors = domain_ancestors( hierarchy )
+	domains = list( table.domains ) if include_children else []
+	for child in table.domains:
+		for parent in ancestors.get( child, [] ):
+			if parent not in domains:
+				domains.append( parent )
+	codes = { d:i for i, d in enumerate( domains ) }
+	optional = [ name for name in ( 'veg', 'severity' ) if name in table.columns ]
+
+	parts = []
+	if include_children:
+		parts.append( dict( table.columns, domain=np.array( [ codes[ d ] for d in table.domains ], dtype=np.int16 )[ table[ 'domain' ] ] ) )
+	depth = max( [ len( a ) for a in ancestors.values() ] + [ 0 ] )
+	for level in range( depth ):
+		# child code -> code of its level-th ancestor ( -1 if it doesn't have one )
+		lut = np.array( [ codes[ ancestors[ d ][ level ] ] if len( ancestors.get( d, [] ) ) > level else -1 for d in table.domains ], dtype=np.int64 )
+		parent = lut[ table[ 'domain' ] ]
+		keep = parent >= 0
+		merged = _merge_fires( table[ 'replicate' ][ keep ], table[ 'year' ][ keep ], parent[ keep ],
+							table[ 'fire_id' ][ keep ], table[ 'pixels' ][ keep ],
+							veg=table[ 'veg' ][ keep ] if 'veg' in optional else None,
+							severity=table[ 'severity' ][ keep ] if 'severity' in optional else None )
+		parts.append( merged )
+
+	names = [ 'replicate', 'year', 'fire_id', 'domain', 'pixels' ] + optional
+	columns = { name:np.concatenate( [ part[ name ] for part in parts ] ) if len( parts ) > 0 else table[ name ][ :0 ] for name in names }
+	return FireTable( columns, table.replicates, domains, table.timesteps )
+
+def rollup_records( db, hierarchy, fire_table=None, include_children=True ):
+	'''
+	aggregate the per-timestep records of a post processing run up a domain
+	hierarchy. pixel count metrics ( total_area_burned, veg_counts, severity_counts )
+	are summed over the children, which assumes the children of a parent do not
+	overlap. Fire count metrics ( number_of_fires, avg_fire_size, all_fire_sizes )
+	are taken from `fire_table` rolled up with `rollup_fire_table` so that a fire
+	spanning children is counted once; without a fire table they are left out.
+
+	Arguments:
+	----------
+	db = [tinydb.TinyDB or list] database or records of a run at the finest domains.
+	hierarchy = [dict] child->parent domain names, applied transitively.
+	fire_table = [alfresco_postprocessing.FireTable] per-fire table of the same run,
+		e.g. from run_postprocessing( ..., fire_table_fn=... ). default:None
+	include_children = [bool] keep the input domains alongside the parents. default:True
+
+	Returns:
+	--------
+	list of records in the TinyDB layout.
+
+	'''
+	import copy
+	records = db.all() if hasattr( db, 'all' ) else db
+	ancestors = domain_ancestors( hierarchy )
+	fire_records = {}
+	if fire_table is not None:
+		rolled = rollup_fire_table( fire_table, hierarchy, include_children=include_children )
+		fire_records = { ( str( rec[ 'replicate' ] ), int( rec[ 'fire_year' ] ) ):rec for rec in rolled.to_records() }
+
+	out = []
+	for rec in records:
+		new = { k:copy.deepcopy( v ) for k, v in rec.items() if k not in SUMMABLE_METRICS + FIRE_COUNT_METRICS }
+		for metric_name in SUMMABLE_METRICS:
+			if metric_name in rec:
+				new[ metric_name ] = _rollup_metric( rec[ metric_name ], ancestors, include_children )
+		key = ( str( rec[ 'replicate' ] ), int( rec[ 'fire_year' ] ) )
+		if key in fire_records:
+			for metric_name in FIRE_COUNT_METRICS:
+				# keep all_fire_sizes out if the run was made with store_fire_sizes=False
+				if metric_name == 'all_fire_sizes' and metric_name not in rec:
+					continue
+				new[ metric_name ] = fire_records[ key ][ metric_name ]
+		out.append( new )
+	return out
+
+def _rollup_metric( values, ancestors, include_children=True ):
+	''' sum {domain:count} or {domain:{class:count}} into the ancestors of each domain '''
+	out = {}
+	def add( domain, value ):
+		if isinstance( value, dict ):
+			hold = out.setdefault( domain, {} )
+			for cls, count in value.items():
+				hold[ cls ] = hold.get( cls, 0 ) + count
+		else:
+			out[ domain ] = out.get( domain, 0 ) + value
+	for domain, value in values.items():
+		if include_children:
+			add( domain, value )
+		for parent in ancestors.get( str( domain ), [] ):
+			add( parent, value )
+	return out
+
+def rollup_db( db, hierarchy, out_json_fn, fire_table=None, include_children=True ):
+	'''
+	`rollup_records` written to a new TinyDB at `out_json_fn`, so the rolled up
+	domains can be used with Plot, to_csvs and to_cube_store like any other run.
+	'''
+	from alfresco_postprocessing import _open_tinydb
+	records = rollup_records( db, hierarchy, fire_table=fire_table, include_children=include_children )
+	out_db = _open_tinydb( out_json_fn )
+	out_db.insert_multiple( records )
+	return out_db
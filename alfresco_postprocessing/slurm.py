@@ -0,0 +1,201 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING SLURM CAMPAIGNS
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import os, shlex, subprocess
+
+# a campaign is a directory holding:
+#	tasks.txt -- one shell command per map task
+#	array.slurm -- a job array running line $SLURM_ARRAY_TASK_ID + 1 of tasks.txt
+#	reduce.slurm -- the reduce command, submitted to run once the whole array succeeded
+#	submit.sh -- the sbatch calls, to run by hand ( or with SBATCH=/path/to/fake_sbatch )
+#	logs/ -- the slurm output of every job
+CAMPAIGN_FILES = { 'tasks':'tasks.txt', 'array':'array.slurm', 'reduce':'reduce.slurm', 'submit':'submit.sh' }
+
+def slurm_header( job_name, cpus_per_task=1, mem_mb=None, time=None, partition=None, account=None,
+	mail_user=None, mail_type='FAIL', output=None, array=None, extra=None ):
+	'''
+	the `#!/bin/sh` + `#SBATCH` header of a single node job.
+
+	Arguments:
+	----------
+	job_name = [str] slurm job name.
+	cpus_per_task = [int] cpus for the job. default:1
+	mem_mb = [int] memory of the job in MB. default:None (the partition default)
+	time = [str] time limit, e.g. '12:00:00'. default:None (the partition default)
+	partition, account, mail_user = [str] default:None (not set)
+	mail_type = [str] when to send mail. default:'FAIL'
+	output = [str] path of the job log, with the slurm filename patterns. default:None
+	array = [str] array indices, e.g. '0-99%10'. default:None (not an array)
+	extra = [list] more `#SBATCH` option strings, e.g. [ '--exclusive' ]. default:None
+
+	Returns:
+	--------
+	[str] the header lines
+
+	'''
+	options = [ '--job-name=%s' % job_name, '--nodes=1', '--ntasks=1', '--cpus-per-task=%d' % cpus_per_task ]
+	if mem_mb is not None:
+		options.append( '--mem=%dM' % mem_mb )
+	if time is not None:
+		options.append( '--time=%s' % time )
+	if partition is not None:
+		options.append( '--partition=%s' % partition )
+	if account is not None:
+		options.append( '--account=%s' % account )
+	if mail_user is not None:
+		options.extend([ '--mail-type=%s' % mail_type, '--mail-user=%s' % mail_user ])
+	if output is not None:
+		options.append( '--output=%s' % output )
+	if array is not None:
+		options.append( '--array=%s' % array )
+	options.extend( extra or [] )
+	return '#!/bin/sh\n' + ''.join( '#SBATCH %s\n' % option for option in options )
+
+def task_resources( raster_fn, arrays_per_worker=4, mem_per_node_mb=None, cpus_per_node=None, overhead_mb=500 ):
+	'''
+	size a map task from the raster size and a node memory budget: the number of
+	worker processes that fit and the memory to request for them.
+
+	Arguments:
+	----------
+	raster_fn = [str] one of the rasters the task reads, for its dimensions.
+	arrays_per_worker = [int] number of full size 8 byte arrays a worker holds at
+		once ( e.g. the 50 replicate group + sum of relative flammability ). default:4
+	mem_per_node_mb = [int] memory budget of a node in MB. default:None (the available
+		memory of this machine)
+	cpus_per_node = [int] cpus of a node. default:None (the cpus of this machine)
+	overhead_mb = [int] memory of a python process with the libraries loaded. default:500
+
+	Returns:
+	--------
+	dict with 'cpus_per_task', 'mem_mb' and the 'worker_mb' estimate of each worker.
+
+	'''
+	import rasterio
+	from alfresco_postprocessing.planner import available_memory_mb, available_cpus
+	with rasterio.open( raster_fn ) as rst:
+		raster_mb = rst.height * rst.width * 8 / 2.0**20
+	worker_mb = overhead_mb + arrays_per_worker * raster_mb
+	if mem_per_node_mb is None:
+		mem_per_node_mb = available_memory_mb()
+	if cpus_per_node is None:
+		cpus_per_node = available_cpus()
+	# the parent process holds about one worker's worth ( the summed result )
+	cpus = int( max( 1, min( cpus_per_node, ( mem_per_node_mb - worker_mb ) // worker_mb ) ) )
+	return { 'cpus_per_task':cpus, 'mem_mb':int( ( cpus + 1 ) * worker_mb ), 'worker_mb':worker_mb }
+
+def write_campaign( campaign_path, tasks, reduce_command=None, job_name='alfpp', cpus_per_task=1, mem_mb=None,
+	max_concurrent=None, time=None, partition=None, account=None, mail_user=None, env=None, reduce_mem_mb=None ):
+	'''
+	write a postprocessing campaign as a slurm job array of map tasks plus a reduce
+	job that only starts once every map task succeeded.
+
+	Arguments:
+	----------
+	campaign_path = [str] directory to write the scripts to. Should be on a filesystem
+		the compute nodes can see.
+	tasks = [list] shell commands, one per map task ( array element ).
+	reduce_command = [str] shell command run after all the tasks. default:None (no reduce job)
+	job_name = [str] slurm job name, the reduce job gets a `_reduce` suffix. default:'alfpp'
+	cpus_per_task, mem_mb = [int] resources of each map task, see `task_resources`.
+		default:1, None
+	max_concurrent = [int] limit on the number of array tasks running at once. default:None
+	time, partition, account, mail_user = see `slurm_header`.
+	env = [dict] environment variables exported in the jobs, e.g. { 'OPENBLAS_NUM_THREADS':1 }.
+		default:None
+	reduce_mem_mb = [int] memory of the reduce job in MB. default:None (mem_mb)
+
+	Returns:
+	--------
+	dict of the filenames written ( see CAMPAIGN_FILES ).
+
+	'''
+	if len( tasks ) == 0:
+		raise ValueError( 'a campaign needs at least one task' )
+	campaign_path = os.path.abspath( campaign_path )
+	os.makedirs( os.path.join( campaign_path, 'logs' ), exist_ok=True )
+	fns = { name:os.path.join( campaign_path, fn ) for name, fn in CAMPAIGN_FILES.items() }
+	exports = ''.join( 'export %s=%s\n' % ( key, shlex.quote( str( value ) ) ) for key, value in ( env or {} ).items() )
+	common = dict( time=time, partition=partition, account=account, mail_user=mail_user )
+
+	with open( fns[ 'tasks' ], 'w' ) as f:
+		for task in tasks:
+			if '\n' in task:
+				raise ValueError( 'task commands must be single lines: %r' % task )
+			f.write( task + '\n' )
+	array = '0-%d' % ( len( tasks ) - 1 )
+	if max_concurrent is not None:
+		array += '%%%d' % max_concurrent
+	with open( fns[ 'array' ], 'w' ) as f:
+		f.write( slurm_header( job_name, cpus_per_task, mem_mb, array=array,
+					output=os.path.join( campaign_path, 'logs', '%s_%%A_%%a.out' % job_name ), **common ) )
+		f.write( '\n' + exports )
+		f.write( 'TASK=$( sed -n "$(( SLURM_ARRAY_TASK_ID + 1 ))p" %s )\n' % shlex.quote( fns[ 'tasks' ] ) )
+		f.write( 'echo "$TASK"\n' )
+		f.write( 'exec sh -c "$TASK"\n' )
+
+	submit = [ '#!/bin/sh', '# submit the campaign, SBATCH may point to another sbatch ( e.g. a fake one for testing )', 'set -e',
+			'ARRAY_ID=$( ${SBATCH:-sbatch} --parsable %s | cut -d ";" -f 1 )' % shlex.quote( fns[ 'array' ] ), 'echo "$ARRAY_ID"' ]
+	if reduce_command is not None:
+		with open( fns[ 'reduce' ], 'w' ) as f:
+			f.write( slurm_header( job_name + '_reduce', 1, mem_mb if reduce_mem_mb is None else reduce_mem_mb,
+						output=os.path.join( campaign_path, 'logs', '%s_reduce_%%j.out' % job_name ), **common ) )
+			f.write( '\n' + exports + reduce_command + '\n' )
+		submit.append( '${SBATCH:-sbatch} --parsable --dependency=afterok:$ARRAY_ID %s | cut -d ";" -f 1' % shlex.quote( fns[ 'reduce' ] ) )
+	else:
+		if os.path.exists( fns[ 'reduce' ] ):
+			os.unlink( fns[ 'reduce' ] ) # from an earlier write of the campaign
+		del fns[ 'reduce' ]
+	with open( fns[ 'submit' ], 'w' ) as f:
+		f.write( '\n'.join( submit ) + '\n' )
+	os.chmod( fns[ 'submit' ], 0o755 )
+	return fns
+
+def _sbatch( sbatch, args ):
+	''' run sbatch --parsable and return the job id '''
+	out = subprocess.run( shlex.split( sbatch ) + [ '--parsable' ] + args, check=True, stdout=subprocess.PIPE, universal_newlines=True )
+	return out.stdout.strip().split( ';' )[0]
+
+def submit_campaign( campaign_path, sbatch='sbatch', dry_run=False ):
+	'''
+	submit a campaign written by `write_campaign`: the job array, then the reduce
+	job with an afterok dependency on it.
+
+	Arguments:
+	----------
+	campaign_path = [str] campaign directory.
+	sbatch = [str] sbatch command, e.g. a fake sbatch for testing. default:'sbatch'
+	dry_run = [bool] only print the commands ( the scripts are left to inspect or to
+		submit with submit.sh ). default:False
+
+	Returns:
+	--------
+	dict of 'array' and 'reduce' job ids ( None with dry_run or without a reduce job ).
+
+	'''
+	fns = { name:os.path.join( os.path.abspath( campaign_path ), fn ) for name, fn in CAMPAIGN_FILES.items() }
+	has_reduce = os.path.exists( fns[ 'reduce' ] )
+	if dry_run:
+		print( '%s --parsable %s' % ( sbatch, fns[ 'array' ] ) )
+		if has_reduce:
+			print( '%s --parsable --dependency=afterok:<array job id> %s' % ( sbatch, fns[ 'reduce' ] ) )
+		return { 'array':None, 'reduce':None }
+	array_id = _sbatch( sbatch, [ fns[ 'array' ] ] )
+	reduce_id = _sbatch( sbatch, [ '--dependency=afterok:%s' % array_id, fns[ 'reduce' ] ] ) if has_reduce else None
+	return { 'array':array_id, 'reduce':reduce_id }
+
+def run_campaign_locally( campaign_path ):
+	'''
+	run a campaign on this machine without slurm: every array task in turn with its
+	SLURM_ARRAY_TASK_ID set, then the reduce job if they all succeeded. Raises a
+	subprocess.CalledProcessError at the first failing task. Returns the number of
+	tasks run.
+	'''
+	fns = { name:os.path.join( os.path.abspath( campaign_path ), fn ) for name, fn in CAMPAIGN_FILES.items() }
+	with open( fns[ 'tasks' ] ) as f:
+		ntasks = sum( 1 for line in f if line.strip() )
+	for i in range( ntasks ):
+		subprocess.run( [ 'sh', fns[ 'array' ] ], check=True, env=dict( os.environ, SLURM_ARRAY_TASK_ID=str( i ) ) )
+	if os.path.exists( fns[ 'reduce' ] ):
+		subprocess.run( [ 'sh', fns[ 'reduce' ] ], check=True )
+	return ntasks
@@ -0,0 +1,239 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING SYNTHETIC DATA GENERATORS
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import os
+import numpy as np
+
+# ALFRESCO Alaska Albers output grid defaults
+SYNTHETIC_CRS = 'EPSG:3338'
+SYNTHETIC_ORIGIN = ( -1725000.0, 2390000.0 )
+SYNTHETIC_RES = 1000.0
+# the description and colormap ALFRESCO writes into its Veg outputs
+VEG_DESCRIPTION = 'Value Index: 0=Not Vegetated, 1=Black Spruce, 2=White Spruce, 3=Deciduous, 4=Shrub Tundra, ' + \
+				'5=Graminoid Tundra, 6=Wetland Tundra, 7=Barren lichen-moss, 8=Temperate Rainforest'
+VEG_CMAP = { 0:( 255, 255, 255, 255 ), 1:( 0, 100, 0, 255 ), 2:( 34, 139, 34, 255 ), 3:( 154, 205, 50, 255 ),
+			4:( 188, 143, 143, 255 ), 5:( 238, 232, 170, 255 ), 6:( 95, 158, 160, 255 ), 7:( 169, 169, 169, 255 ),
+			8:( 0, 128, 128, 255 ) }
+
+def _profile( shape, dtype, count=1, nodata=None ):
+	''' rasterio write profile for a synthetic ALFRESCO grid '''
+	from rasterio.transform import from_origin
+	height, width = shape
+	west, north = SYNTHETIC_ORIGIN
+	return { 'driver':'GTiff', 'height':height, 'width':width, 'count':count, 'dtype':dtype,
+			'crs':SYNTHETIC_CRS, 'transform':from_origin( west, north, SYNTHETIC_RES, SYNTHETIC_RES ),
+			'nodata':nodata, 'compress':'lzw' }
+
+def _write( fn, arrs, profile, tags=None, colormap=None ):
+	import rasterio
+	dirname = os.path.dirname( fn )
+	if dirname != '' and not os.path.exists( dirname ):
+		os.makedirs( dirname )
+	with rasterio.open( fn, 'w', **profile ) as out:
+		for band, arr in enumerate( arrs ):
+			out.write( arr.astype( profile[ 'dtype' ] ), band + 1 )
+		if tags is not None:
+			out.update_tags( **tags )
+		if colormap is not None:
+			out.write_colormap( 1, colormap )
+	return fn
+
+def make_aoi_mask( shape, seed=0 ):
+	'''
+	boolean array marking the in-bounds (land) area of a synthetic grid. The
+	outside is an irregular coastline so that background handling gets exercised.
+	'''
+	rng = np.random.RandomState( seed )
+	height, width = shape
+	yy, xx = np.mgrid[ 0:height, 0:width ]
+	cy, cx = height / 2.0, width / 2.0
+	angle = np.arctan2( yy - cy, xx - cx )
+	# wobbly ellipse
+	wobble = 1 + 0.08 * np.sin( 5 * angle + rng.uniform( 0, np.pi ) ) + 0.05 * np.sin( 11 * angle )
+	dist = np.sqrt( ( ( yy - cy ) / ( 0.48 * height ) ) ** 2 + ( ( xx - cx ) / ( 0.48 * width ) ) ** 2 )
+	return dist < wobble
+
+def make_initial_veg( shape, aoi, seed=0 ):
+	'''
+	patchy vegetation map using the standard ALFRESCO veg classes 1-7 with 255
+	outside of the AOI and 0 for the handful of no-veg pixels.
+	'''
+	rng = np.random.RandomState( seed )
+	height, width = shape
+	# coarse random classes upsampled to make contiguous patches
+	block = 16
+	coarse = rng.choice( [ 1, 2, 3, 4, 5, 6, 7 ], p=[ 0.3, 0.12, 0.13, 0.18, 0.12, 0.1, 0.05 ],
+						size=( height // block + 1, width // block + 1 ) )
+	veg = np.kron( coarse, np.ones( ( block, block ), dtype=coarse.dtype ) )[ :height, :width ]
+	# speckle some pixels so patch edges are not perfectly square
+	speckle = rng.rand( height, width ) < 0.05
+	veg[ speckle ] = rng.randint( 1, 8, size=speckle.sum() )
+	veg[ rng.rand( height, width ) < 0.002 ] = 0
+	veg[ ~aoi ] = 255
+	return veg.astype( np.uint8 )
+
+def make_fire_patches( shape, aoi, nfires, mean_size=40.0, rng=None ):
+	'''
+	burn `nfires` irregular fire patches into a grid. Fire sizes are lognormal
+	around `mean_size` pixels, as in ALFRESCO where many small and few very
+	large fires occur.
+
+	Returns:
+	--------
+	tuple of ( fire_ids, ignitions ) ndarrays where fire_ids holds the unique
+	patch number (1..n, 0 unburned) and ignitions is 1 at each ignition point.
+
+	'''
+	if rng is None:
+		rng = np.random.RandomState( 0 )
+	height, width = shape
+	fire_ids = np.zeros( shape, dtype=np.int32 )
+	ignitions = np.zeros( shape, dtype=np.int32 )
+	candidates = np.flatnonzero( aoi.ravel() )
+	if len( candidates ) == 0 or nfires == 0:
+		return fire_ids, ignitions
+
+	fire_id = 0
+	for idx in rng.choice( candidates, size=nfires ):
+		cy, cx = np.unravel_index( idx, shape )
+		size = rng.lognormal( np.log( mean_size ), 1.0 )
+		ry = max( np.sqrt( size / np.pi ) * rng.uniform( 0.6, 1.6 ), 1 )
+		rx = max( size / ( np.pi * ry ), 1 )
+		y0, y1 = int( max( cy - 2 * ry, 0 ) ), int( min( cy + 2 * ry + 1, height ) )
+		x0, x1 = int( max( cx - 2 * rx, 0 ) ), int( min( cx + 2 * rx + 1, width ) )
+		yy, xx = np.mgrid[ y0:y1, x0:x1 ]
+		dist = ( ( yy - cy ) / ry ) ** 2 + ( ( xx - cx ) / rx ) ** 2
+		# ragged perimeter
+		patch = ( dist + rng.uniform( -0.35, 0.35, size=dist.shape ) ) < 1
+		patch &= aoi[ y0:y1, x0:x1 ] & ( fire_ids[ y0:y1, x0:x1 ] == 0 )
+		if not patch.any():
+			continue
+		fire_id += 1
+		fire_ids[ y0:y1, x0:x1 ][ patch ] = fire_id
+		ignitions[ cy, cx ] = 1
+	return fire_ids, ignitions
+
+def make_maps( output_path, nreps=2, years=( 1901, 1905 ), shape=( 256, 256 ), fires_per_year=20,
+		mean_fire_size=40.0, year_folders=True, seed=0 ):
+	'''
+	generate a synthetic ALFRESCO output Maps directory with FireScar (3-band),
+	Veg, Age, BurnSeverity and BasalArea GeoTiffs for each replicate and year,
+	named like the model outputs `<Variable>_<replicate>_<year>.tif`.
+
+	Arguments:
+	----------
+	output_path = [str] path to the Maps directory to be generated.
+	nreps = [int] number of replicates. default:2
+	years = [tuple] of ( begin_year, end_year ) inclusive. default:(1901, 1905)
+	shape = [tuple] of ( height, width ) of the rasters. default:(256, 256)
+	fires_per_year = [int] mean number of fires per replicate-year. default:20
+	mean_fire_size = [float] mean (median) fire size in pixels. default:40.0
+	year_folders = [bool] store each year in its own sub-directory as ALFRESCO does.
+		default:True
+	seed = [int] random seed used to make the output reproducible. default:0
+
+	Returns:
+	--------
+	[str] output_path, with the side-effect of the rasters being written to disk.
+
+	'''
+	begin, end = years
+	aoi = make_aoi_mask( shape, seed=seed )
+	veg_init = make_initial_veg( shape, aoi, seed=seed )
+	for rep in range( nreps ):
+		rng = np.random.RandomState( seed + 1000 * ( rep + 1 ) )
+		veg = veg_init.copy()
+		last_burn = np.zeros( shape, dtype=np.int32 )
+		age = np.where( aoi, rng.randint( 0, 200, size=shape ), -2147483647 ).astype( np.int32 )
+		basal = np.where( aoi, rng.uniform( 0, 20, size=shape ), -3.4e38 ).astype( np.float32 )
+		for year in range( begin, end + 1 ):
+			fire_ids, ignitions = make_fire_patches( shape, aoi, rng.poisson( fires_per_year ),
+										mean_size=mean_fire_size, rng=rng )
+			burned = fire_ids > 0
+			last_burn[ burned ] = year
+
+			# post-fire succession: spruce burns to deciduous, tundra stays tundra
+			veg[ burned & ( ( veg == 1 ) | ( veg == 2 ) ) ] = 3
+			# unburned deciduous slowly returns to spruce
+			regrow = ( ~burned ) & ( veg == 3 ) & ( rng.rand( *shape ) < 0.01 )
+			veg[ regrow ] = 1
+			age[ aoi ] += 1
+			age[ burned ] = 0
+			basal[ burned ] = 0
+			basal[ aoi & ~burned ] = np.minimum( basal[ aoi & ~burned ] + 0.1, 20 )
+
+			severity = np.where( burned, rng.randint( 1, 5, size=shape ), 0 )
+			severity[ ~aoi ] = 255
+
+			firescar_band1 = np.where( aoi, last_burn, -2147483647 )
+			firescar_band2 = np.where( aoi, fire_ids, -2147483647 )
+			# ignition point 1, rest of the scar 0, unburned nodata
+			firescar_band3 = np.where( burned, ignitions, -2147483647 )
+
+			dirname = os.path.join( output_path, str( year ) ) if year_folders else output_path
+			name = lambda variable: os.path.join( dirname, '_'.join([ variable, str( rep ), str( year ) ]) + '.tif' )
+			_write( name( 'FireScar' ), [ firescar_band1, firescar_band2, firescar_band3 ],
+					_profile( shape, 'int32', count=3, nodata=-2147483647 ) )
+			_write( name( 'Veg' ), [ veg ], _profile( shape, 'uint8', nodata=255 ),
+					tags={ 'TIFFTAG_IMAGEDESCRIPTION':VEG_DESCRIPTION }, colormap=VEG_CMAP )
+			_write( name( 'Age' ), [ age ], _profile( shape, 'int32', nodata=-2147483647 ) )
+			_write( name( 'BurnSeverity' ), [ severity ], _profile( shape, 'uint8', nodata=255 ) )
+			_write( name( 'BasalArea' ), [ basal ], _profile( shape, 'float32', nodata=-3.4e38 ) )
+	return output_path
+
+def make_firehistory( output_path, years=( 1950, 1960 ), shape=( 256, 256 ), fires_per_year=20,
+		mean_fire_size=40.0, seed=0 ):
+	'''
+	generate a synthetic observed FireHistory directory of boolean burned GeoTiffs
+	named like the ALFRESCO inputs `ALF_AK_FireHistory_<year>.tif`, as used by
+	`run_postprocessing_historical`.
+	'''
+	begin, end = years
+	aoi = make_aoi_mask( shape, seed=seed )
+	rng = np.random.RandomState( seed + 7 )
+	for year in range( begin, end + 1 ):
+		fire_ids, ignitions = make_fire_patches( shape, aoi, rng.poisson( fires_per_year ),
+									mean_size=mean_fire_size, rng=rng )
+		fn = os.path.join( output_path, 'ALF_AK_FireHistory_%d.tif' % year )
+		_write( fn, [ ( fire_ids > 0 ).astype( np.uint8 ) ], _profile( shape, 'uint8', nodata=None ) )
+	return output_path
+
+def _domain_labels( shape, ndomains ):
+	''' split the grid into ndomains vertical strips labeled 1..ndomains '''
+	height, width = shape
+	edges = np.linspace( 0, width, ndomains + 1 ).astype( int )
+	labels = np.zeros( shape, dtype=np.uint8 )
+	for i in range( ndomains ):
+		labels[ :, edges[ i ]:edges[ i + 1 ] ] = i + 1
+	return labels, edges
+
+def make_subdomains_raster( fn, shape=( 256, 256 ), ndomains=4, background_value=0 ):
+	'''
+	write a synthetic sub-domains raster with `ndomains` strips across the AOI
+	for use with `read_subdomains( subdomains_fn=fn, background_value=0 )`.
+	'''
+	labels, edges = _domain_labels( shape, ndomains )
+	labels[ labels == 0 ] = background_value
+	return _write( fn, [ labels ], _profile( shape, 'uint8', nodata=background_value ) )
+
+def make_subdomains_shapefile( fn, shape=( 256, 256 ), ndomains=4, id_field='OBJECTID', name_field='Name' ):
+	'''
+	write a synthetic sub-domains shapefile with the same `ndomains` strips as
+	`make_subdomains_raster`, as polygons for use with `read_subdomains( subdomains_fn=fn,
+	id_field=id_field, name_field=name_field )`.
+	'''
+	import geopandas as gpd
+	from shapely.geometry import box
+	height, width = shape
+	west, north = SYNTHETIC_ORIGIN
+	labels, edges = _domain_labels( shape, ndomains )
+	geoms = [ box( west + edges[ i ] * SYNTHETIC_RES, north - height * SYNTHETIC_RES,
+					west + edges[ i + 1 ] * SYNTHETIC_RES, north ) for i in range( ndomains ) ]
+	gdf = gpd.GeoDataFrame( { id_field:list( range( 1, ndomains + 1 ) ),
+							name_field:[ 'Domain%d' % i for i in range( 1, ndomains + 1 ) ] },
+							geometry=geoms, crs=SYNTHETIC_CRS )
+	dirname = os.path.dirname( fn )
+	if dirname != '' and not os.path.exists( dirname ):
+		os.makedirs( dirname )
+	gdf.to_file( fn )
+	return fn
@@ -0,0 +1,118 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING DERIVED VEGETATION GROUP METRICS
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import numpy as np
+
+# default groupings of the veg_name_dict classes
+VEG_GROUPS = { 'conifer':[ 'Black Spruce', 'White Spruce' ],
+				'deciduous':[ 'Deciduous' ],
+				'tundra':[ 'Shrub Tundra', 'Graminoid Tundra', 'Wetland Tundra' ] }
+
+def _veg_counts_array( src ):
+	''' ( replicate x year x domain x vegtype array, coords ) from a database, records or metric store '''
+	if isinstance( src, str ):
+		if src.endswith( '.json' ):
+			from alfresco_postprocessing.jsonstream import read_records
+			src = read_records( src, metrics=[ 'veg_counts' ] )
+		else:
+			from alfresco_postprocessing.export import open_cube_store
+			src = open_cube_store( src )
+	if hasattr( src, 'data_vars' ):
+		da = src[ 'veg_counts' ].transpose( 'replicate', 'year', 'domain', 'vegtype' )
+		coords = [ ( dim, da[ dim ].values.tolist() ) for dim in da.dims ]
+		return np.asarray( da.values, dtype=np.float64 ), coords
+	from alfresco_postprocessing.postprocess import get_metric_array
+	return get_metric_array( src, 'veg_counts' )
+
+def _group_counts( arr, coords, groups, veg_name_dict ):
+	''' sum the vegtype axis of a veg_counts array into groups with a membership matrix '''
+	if groups is None:
+		groups = VEG_GROUPS
+	if veg_name_dict is None:
+		import alfresco_postprocessing as ap
+		veg_name_dict = ap.veg_name_dict
+	vegtypes = [ str( v ) for v in coords[ 3 ][1] ]
+	membership = np.zeros( ( len( vegtypes ), len( groups ) ) )
+	for g, classes in enumerate( groups.values() ):
+		for cls in classes:
+			cls = veg_name_dict.get( cls, cls ) if isinstance( cls, ( int, np.integer ) ) else cls
+			if str( cls ) in vegtypes:
+				membership[ vegtypes.index( str( cls ) ), g ] = 1
+	# a timestep that was run has at least one class count in the domain
+	processed = ~np.all( np.isnan( arr ), axis=3 )
+	out = np.nan_to_num( arr ) @ membership
+	out[ ~processed ] = np.nan
+	return out, coords[ :3 ] + [ ( 'group', list( groups.keys() ) ) ]
+
+def veg_group_counts( src, groups=None, veg_name_dict=None ):
+	'''
+	pixel counts of user defined groups of vegetation classes for every replicate x
+	year x domain, summed from the stored veg_counts with a single matrix product
+	( no raster I/O ).
+
+	Arguments:
+	----------
+	src = [tinydb.TinyDB, list, xarray.Dataset or str] output database of an ALFRESCO Post
+		Processing run ( or its records ), a metric store written by `to_cube_store`, or
+		the path to either ( .json is read as a TinyDB ).
+	groups = [dict] group name:list of veg class names ( or veg_name_dict codes ).
+		default:None (VEG_GROUPS)
+	veg_name_dict = [dict] code:name lookup for groups given as integer codes.
+		default:None (alfresco_postprocessing.veg_name_dict)
+
+	Returns:
+	--------
+	( numpy.ndarray, coords ) with dims ( replicate, year, domain, group ). Classes
+	that are absent from a domain count as 0, timesteps that were not run are NaN.
+
+	'''
+	arr, coords = _veg_counts_array( src )
+	return _group_counts( arr, coords, groups, veg_name_dict )
+
+def _ratio( num, den ):
+	with np.errstate( invalid='ignore', divide='ignore' ):
+		return np.where( den > 0, num / den, np.nan )
+
+def veg_group_ratio( src, numerator='conifer', denominator='deciduous', groups=None, veg_name_dict=None ):
+	'''
+	ratio of two veg groups ( e.g. conifer:deciduous ) for every replicate x year x
+	domain. Returns ( numpy.ndarray, coords ) with dims ( replicate, year, domain ),
+	NaN where the denominator group is absent. See `veg_group_counts` for the arguments.
+	'''
+	counts, coords = veg_group_counts( src, groups=groups, veg_name_dict=veg_name_dict )
+	names = coords[ 3 ][1]
+	return _ratio( counts[ ..., names.index( numerator ) ], counts[ ..., names.index( denominator ) ] ), coords[ :3 ]
+
+def veg_group_shares( src, groups=None, veg_name_dict=None ):
+	'''
+	share of each veg group in the total count of all stored classes in its domain,
+	for every replicate x year x domain. Returns ( numpy.ndarray, coords ) with dims
+	( replicate, year, domain, group ). See `veg_group_counts` for the arguments.
+	'''
+	arr, coords = _veg_counts_array( src )
+	counts, coords = _group_counts( arr, coords, groups, veg_name_dict )
+	return _ratio( counts, np.nansum( arr, axis=3 )[ ..., None ] ), coords
+
+def veg_group_table( src, groups=None, ratios=( ( 'conifer', 'deciduous' ), ), veg_name_dict=None ):
+	'''
+	group counts, shares and ratios as one tidy pandas.DataFrame with a row per
+	replicate x year x domain and the columns <group>, <group>_share and
+	<numerator>:<denominator> for each of `ratios`. Timesteps that were not run are
+	left out.
+	'''
+	import pandas as pd
+	arr, coords = _veg_counts_array( src )
+	counts, gcoords = _group_counts( arr, coords, groups, veg_name_dict )
+	names = gcoords[ 3 ][1]
+	shares = _ratio( counts, np.nansum( arr, axis=3 )[ ..., None ] )
+	keep = ~np.isnan( counts[ ..., 0 ] ) if len( names ) > 0 else np.zeros( counts.shape[ :3 ], dtype=bool )
+	idx = np.nonzero( keep )
+	df = pd.DataFrame( { dim:np.array( labels, dtype=object )[ i ] for ( dim, labels ), i in zip( coords[ :3 ], idx ) } )
+	df[ 'year' ] = df[ 'year' ].astype( int )
+	for g, name in enumerate( names ):
+		df[ name ] = counts[ ..., g ][ keep ].astype( np.int64 )
+	for g, name in enumerate( names ):
+		df[ name + '_share' ] = shares[ ..., g ][ keep ]
+	for numerator, denominator in ratios:
+		df[ '%s:%s' % ( numerator, denominator ) ] = _ratio( df[ numerator ].values, df[ denominator ].values )
+	return df
@@ -0,0 +1,229 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# ALFRESCO POST-PROCESSING SHARED FILESYSTEM WORK QUEUE
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import os, pickle, socket, time
+
+# a queue is a directory on a filesystem shared by all nodes:
+#	job.pkl -- the sub_domains, veg_name_dict and run options, written once
+#	pending/<task>.pkl -- chunks of timesteps waiting for a worker
+#	claimed/<task>.pkl.<worker> -- claimed by a worker ( touched as it progresses )
+#	done/<task>.pkl -- the output records of a finished chunk
+#	failed/<task>.pkl, failed/<task>.txt -- a chunk that raised, and the traceback
+# a worker claims a task by renaming it out of pending/, which is atomic, so no
+# locks or server are needed and any number of workers can run on any nodes.
+QUEUE_DIRS = [ 'pending', 'claimed', 'done', 'failed' ]
+JOB_FN = 'job.pkl'
+
+def _pickle( obj, fn ):
+	''' write to a temp file and rename, so readers never see a partial pickle '''
+	tmp_fn = '%s.tmp.%s.%d' % ( fn, socket.gethostname(), os.getpid() )
+	with open( tmp_fn, 'wb' ) as f:
+		pickle.dump( obj, f, protocol=pickle.HIGHEST_PROTOCOL )
+	os.replace( tmp_fn, fn )
+	return fn
+
+def _unpickle( fn ):
+	with open( fn, 'rb' ) as f:
+		return pickle.load( f )
+
+def _task_names( queue_path, name ):
+	''' task names in a queue sub-directory, in timestep order '''
+	path = os.path.join( queue_path, name )
+	return sorted( fn.split( '.pkl' )[0] for fn in os.listdir( path ) if '.pkl' in fn and '.tmp.' not in fn )
+
+def create_queue( queue_path, maps_path, veg_name_dict, subdomains_fn=None, id_field=None, name_field=None,
+	background_value=0, chunk_size=10, lagfire=False, fire_table=False, veg_transitions=False ):
+	'''
+	split a `run_postprocessing` run into chunks of timesteps in a work queue on a
+	shared filesystem, to be processed by `work_queue` workers on any number of
+	nodes and merged by `reduce_queue`.
+
+	Arguments:
+	----------
+	queue_path = [str] new ( or empty ) directory on a filesystem all the workers can see.
+	maps_path, veg_name_dict, subdomains_fn, id_field, name_field, background_value,
+		lagfire, veg_transitions = see `run_postprocessing`.
+	chunk_size = [int] number of timesteps in each task. default:10
+	fire_table = [bool] keep the per-fire rows, so `reduce_queue` can write a
+		FireTable. default:False
+
+	Returns:
+	--------
+	[str] queue_path
+
+	'''
+	import rasterio
+	import alfresco_postprocessing as ap
+	if os.path.exists( os.path.join( queue_path, JOB_FN ) ):
+		raise ValueError( 'a queue already exists in %s' % queue_path )
+	for name in QUEUE_DIRS:
+		os.makedirs( os.path.join( queue_path, name ), exist_ok=True )
+	fl = ap.FileLister( maps_path, lagfire=lagfire )
+	with rasterio.open( fl.files[0] ) as rst:
+		sub_domains = ap.read_subdomains( subdomains_fn=subdomains_fn, rasterio_raster=rst, \
+						id_field=id_field, name_field=name_field, background_value=background_value )
+	timesteps = fl.timesteps
+	if len( timesteps ) == 0:
+		raise ValueError( 'no timesteps found in %s' % maps_path )
+	for i, start in enumerate( range( 0, len( timesteps ), chunk_size ) ):
+		_pickle( timesteps[ start:start + chunk_size ], os.path.join( queue_path, 'pending', 'task_%06d.pkl' % i ) )
+	# written last: workers only start on a complete queue
+	_pickle( { 'sub_domains':sub_domains, 'veg_name_dict':veg_name_dict, 'maps_path':maps_path,
+			'fire_table':fire_table, 'veg_transitions':veg_transitions, 'ntasks':i + 1 },
+			os.path.join( queue_path, JOB_FN ) )
+	return queue_path
+
+def _claim( queue_path, worker_id ):
+	''' claim the first pending task, returning ( task name, claim filename ) or None when there are none '''
+	for task in _task_names( queue_path, 'pending' ):
+		claim_fn = os.path.join( queue_path, 'claimed', '%s.pkl.%s' % ( task, worker_id ) )
+		try:
+			os.rename( os.path.join( queue_path, 'pending', task + '.pkl' ), claim_fn )
+		except FileNotFoundError:
+			continue # another worker got it first
+		return task, claim_fn
+	return None
+
+def _heartbeat( claim_fn ):
+	''' touch a claim so `requeue_stale` sees the worker is alive. a missing claim was requeued and is left alone '''
+	try:
+		os.utime( claim_fn )
+	except FileNotFoundError:
+		pass
+
+def _unclaim_pending( queue_path, task ):
+	''' remove a requeued copy of a finished task from pending, if no other worker has claimed it yet '''
+	try:
+		os.unlink( os.path.join( queue_path, 'pending', task + '.pkl' ) )
+	except FileNotFoundError:
+		pass
+
+def _worker_loop( queue_path, prefetch=0, prefetch_threads=2, max_tasks=None ):
+	''' claim and run tasks until the queue has no pending tasks left. returns the number of tasks run '''
+	import traceback
+	from functools import partial
+	import alfresco_postprocessing as ap
+	job = _unpickle( os.path.join( queue_path, JOB_FN ) )
+	worker_id = '%s-%d' % ( socket.gethostname(), os.getpid() )
+	kwargs = { 'fire_table':job[ 'fire_table' ], 'veg_transitions':job[ 'veg_transitions' ] }
+	ntasks = 0
+	while max_tasks is None or ntasks < max_tasks:
+		claimed = _claim( queue_path, worker_id )
+		if claimed is None:
+			break
+		task, claim_fn = claimed
+		heartbeat = partial( _heartbeat, claim_fn )
+		try:
+			timesteps = _unpickle( claim_fn )
+			if prefetch > 0:
+				out, stats = ap._run_timesteps( timesteps, job[ 'sub_domains' ], job[ 'veg_name_dict' ], prefetch=prefetch, \
+									nthreads=prefetch_threads, on_timestep=heartbeat, **kwargs )
+			else:
+				out = []
+				for timestep in timesteps:
+					out.append( ap._run_timestep( timestep, job[ 'sub_domains' ], job[ 'veg_name_dict' ], **kwargs ) )
+					heartbeat()
+			_pickle( out, os.path.join( queue_path, 'done', task + '.pkl' ) )
+			try:
+				os.unlink( claim_fn )
+			except FileNotFoundError:
+				# requeued as stale while running: drop the pending copy, the task is done
+				_unclaim_pending( queue_path, task )
+		except Exception:
+			with open( os.path.join( queue_path, 'failed', task + '.txt' ), 'w' ) as f:
+				f.write( '%s\n%s' % ( worker_id, traceback.format_exc() ) )
+			try:
+				os.replace( claim_fn, os.path.join( queue_path, 'failed', task + '.pkl' ) )
+			except FileNotFoundError:
+				# requeued as stale while running, so it is retried rather than marked failed
+				os.unlink( os.path.join( queue_path, 'failed', task + '.txt' ) )
+		ntasks += 1
+	return ntasks
+
+def work_queue( queue_path, ncores=1, prefetch=0, prefetch_threads=2, max_tasks=None ):
+	'''
+	run worker processes on this node until no tasks are left pending. Start it on
+	as many nodes as wanted ( e.g. from a batch job ), or locally with several
+	`ncores` to stand in for a cluster.
+
+	Arguments:
+	----------
+	queue_path = [str] queue directory made by `create_queue`.
+	ncores = [int] number of worker processes on this node. default:1
+	prefetch, prefetch_threads = see `run_postprocessing`. default:0 (no prefetch)
+	max_tasks = [int] stop each worker after this many tasks. default:None (until
+		the queue is empty)
+
+	Returns:
+	--------
+	[int] number of tasks run on this node.
+
+	'''
+	import multiprocessing
+	from functools import partial
+	if not os.path.exists( os.path.join( queue_path, JOB_FN ) ):
+		raise ValueError( 'no queue in %s' % queue_path )
+	f = partial( _worker_loop, prefetch=prefetch, prefetch_threads=prefetch_threads, max_tasks=max_tasks )
+	if ncores == 1:
+		return f( queue_path )
+	with multiprocessing.Pool( ncores ) as pool:
+		ntasks = sum( pool.map( f, [ queue_path ] * ncores, chunksize=1 ) )
+		pool.close()
+		pool.join()
+	return ntasks
+
+def queue_status( queue_path ):
+	''' dict of the number of tasks pending, claimed, done and failed, plus the total '''
+	status = { name:len( _task_names( queue_path, name ) ) for name in QUEUE_DIRS }
+	status[ 'total' ] = _unpickle( os.path.join( queue_path, JOB_FN ) )[ 'ntasks' ]
+	return status
+
+def requeue_stale( queue_path, max_age=3600, failed=False ):
+	'''
+	put claimed tasks whose worker has not made progress for `max_age` seconds ( e.g.
+	the node died or the job hit its time limit ) back in pending, and with
+	failed=True the failed tasks too. Returns the list of requeued task names.
+	'''
+	requeued = []
+	now = time.time()
+	claimed_path = os.path.join( queue_path, 'claimed' )
+	for fn in sorted( os.listdir( claimed_path ) ):
+		claim_fn = os.path.join( claimed_path, fn )
+		task = fn.split( '.pkl' )[0]
+		try:
+			if now - os.path.getmtime( claim_fn ) > max_age:
+				os.rename( claim_fn, os.path.join( queue_path, 'pending', task + '.pkl' ) )
+				requeued.append( task )
+		except FileNotFoundError:
+			continue # finished in the meantime
+	if failed:
+		for task in _task_names( queue_path, 'failed' ):
+			os.rename( os.path.join( queue_path, 'failed', task + '.pkl' ), os.path.join( queue_path, 'pending', task + '.pkl' ) )
+			os.unlink( os.path.join( queue_path, 'failed', task + '.txt' ) )
+			requeued.append( task )
+	return requeued
+
+def reduce_queue( queue_path, out_json_fn, fire_table_fn=None, store_fire_sizes=True, ensemble_fn=None, ensemble_quantiles=None ):
+	'''
+	merge the results of a finished queue into a TinyDB at `out_json_fn`, as
+	`run_postprocessing` would have written it. `fire_table_fn`, `store_fire_sizes`
+	and `ensemble_fn` are as in `run_postprocessing`. Raises a ValueError if any task
+	is not done yet.
+	'''
+	import alfresco_postprocessing as ap
+	from alfresco_postprocessing.ensemble import DEFAULT_QUANTILES, write_ensemble_summary
+	status = queue_status( queue_path )
+	if status[ 'done' ] != status[ 'total' ]:
+		raise ValueError( '%d of %d tasks done ( %d pending, %d claimed, %d failed )' % \
+						( status[ 'done' ], status[ 'total' ], status[ 'pending' ], status[ 'claimed' ], status[ 'failed' ] ) )
+	if fire_table_fn is not None and not _unpickle( os.path.join( queue_path, JOB_FN ) )[ 'fire_table' ]:
+		raise ValueError( 'the queue was created without fire_table=True' )
+	out = [ rec for task in _task_names( queue_path, 'done' ) \
+			for rec in _unpickle( os.path.join( queue_path, 'done', task + '.pkl' ) ) ]
+	out = ap._collect_fire_table( out, fire_table_fn, store_fire_sizes )
+	db = ap._open_tinydb( out_json_fn )
+	db.insert_multiple( out )
+	del out
+	if ensemble_fn is not None:
+		write_ensemble_summary( db, ensemble_fn, quantiles=DEFAULT_QUANTILES if ensemble_quantiles is None else ensemble_quantiles )
+	return db
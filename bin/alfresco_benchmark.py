@@ -0,0 +1,288 @@
+"""Benchmark alfresco_postprocessing on synthetic ALFRESCO Maps at several scales
+
+Generates synthetic Maps / FireHistory directories and sub-domains with
+alfresco_postprocessing.synthetic, times the main entry points and the bin
+reducers, and writes the timings as JSON so runs can be compared with
+`--compare previous_results.json`.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+# name: (nreps, (begin_year, end_year), (height, width), ndomains)
+SCALES = {
+    "small": (2, (1901, 1905), (128, 128), 2),
+    "medium": (10, (1901, 1920), (512, 512), 4),
+    "large": (30, (1901, 1950), (1024, 1024), 8),
+}
+BIN_DIR = os.path.dirname(os.path.abspath(__file__))
+# fields of the synthetic sub-domains shapefile
+SHP_ID_FIELD = "OBJECTID"
+SHP_NAME_FIELD = "Name"
+
+
+def timeit(func, repeat=1):
+    """Run func `repeat` times and return (list of wall times, last result)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - tic)
+    return times, result
+
+
+def run_script(name, *args):
+    """Run one of the bin reducers as a subprocess, raising on failure."""
+    cmd = [sys.executable, os.path.join(BIN_DIR, name)] + [str(a) for a in args]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode(errors="replace").strip().splitlines()[-1])
+    return proc
+
+
+def import_time():
+    """Fresh interpreter importing the package."""
+    code = "import alfresco_postprocessing"
+    proc = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode(errors="replace").strip().splitlines()[-1])
+    return proc
+
+
+def _worker_import():
+    import alfresco_postprocessing  # noqa: F401
+
+    return os.getpid()
+
+
+def worker_startup():
+    """Start a one-worker spawn-context pool whose task imports the package, then shut it down."""
+    import multiprocessing
+
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_worker_import)
+
+
+def make_data(workdir, scale):
+    from alfresco_postprocessing import synthetic
+
+    nreps, years, shape, ndomains = SCALES[scale]
+    paths = {
+        "maps_path": os.path.join(workdir, "Maps"),
+        "firehistory_path": os.path.join(workdir, "FireHistory"),
+        "subdomains_fn": os.path.join(workdir, "Domains", "subdomains.tif"),
+        "subdomains_shp": os.path.join(workdir, "Domains", "subdomains.shp"),
+        "output_path": os.path.join(workdir, "output"),
+    }
+    tic = time.perf_counter()
+    synthetic.make_maps(paths["maps_path"], nreps=nreps, years=years, shape=shape)
+    synthetic.make_firehistory(paths["firehistory_path"], years=years, shape=shape)
+    synthetic.make_subdomains_raster(paths["subdomains_fn"], shape=shape, ndomains=ndomains)
+    try:
+        synthetic.make_subdomains_shapefile(
+            paths["subdomains_shp"], shape=shape, ndomains=ndomains, id_field=SHP_ID_FIELD, name_field=SHP_NAME_FIELD
+        )
+    except ImportError as e:
+        # geopandas is a package dependency, but the raster sub-domain benchmarks can run without it
+        paths["subdomains_shp_error"] = repr(e)
+    os.makedirs(paths["output_path"])
+    paths["generate_seconds"] = time.perf_counter() - tic
+    return paths
+
+
+def benchmarks(paths, scale, ncores):
+    """Yield (name, callable) pairs to be timed for a generated dataset."""
+    import alfresco_postprocessing as ap
+
+    nreps, (begin, end), shape, ndomains = SCALES[scale]
+    out = paths["output_path"]
+    mod_json = os.path.join(out, "ALF.json")
+    obs_json = os.path.join(out, "OBS.json")
+    metrics = ["avg_fire_size", "number_of_fires", "total_area_burned", "veg_counts"]
+
+    def modeled():
+        db = ap.run_postprocessing(paths["maps_path"], mod_json, ncores, ap.veg_name_dict, paths["subdomains_fn"])
+        db.close()
+
+    def shapefile():
+        if "subdomains_shp_error" in paths:
+            raise RuntimeError("no sub-domains shapefile: {}".format(paths["subdomains_shp_error"]))
+        return paths["subdomains_shp"]
+
+    def read_shapefile_subdomains():
+        import rasterio
+
+        with rasterio.open(ap.FileLister(paths["maps_path"]).files[0]) as rst:
+            ap.read_subdomains(
+                subdomains_fn=shapefile(), rasterio_raster=rst, id_field=SHP_ID_FIELD, name_field=SHP_NAME_FIELD
+            )
+
+    def modeled_shapefile():
+        db = ap.run_postprocessing(
+            paths["maps_path"],
+            os.path.join(out, "ALF_shp.json"),
+            ncores,
+            ap.veg_name_dict,
+            shapefile(),
+            SHP_ID_FIELD,
+            SHP_NAME_FIELD,
+        )
+        db.close()
+
+    def historical():
+        db = ap.run_postprocessing_historical(
+            paths["firehistory_path"], obs_json, ncores, ap.veg_name_dict, paths["subdomains_fn"]
+        )
+        db.close()
+
+    def csvs():
+        from tinydb import TinyDB
+
+        db = TinyDB(mod_json)
+        ap.to_csvs(db, metrics, os.path.join(out, "csvs"), "bench", observed=False)
+        db.close()
+
+    def plot():
+        modplot = ap.Plot(mod_json, model="synthetic", scenario="bench")
+        for metric in metrics:
+            modplot.get_metric_dataframes(metric)
+
+    common = ["-p", paths["maps_path"], "-nc", ncores, "-by", begin, "-ey", end]
+    yield "run_postprocessing", modeled
+    yield "run_postprocessing_historical", historical
+    yield "read_subdomains_shapefile", read_shapefile_subdomains
+    yield "run_postprocessing_shapefile", modeled_shapefile
+    yield "to_csvs", csvs
+    yield "Plot", plot
+    yield "relative_flammability", lambda: run_script(
+        "alfresco_relative_flammability.py", "-o", os.path.join(out, "relflam.tif"), *common
+    )
+    yield "relative_vegetation_change", lambda: run_script(
+        "alfresco_relative_vegetation_change.py", "-o", os.path.join(out, "relveg.tif"), *common
+    )
+    yield "vegetation_change_mode_and_percents", lambda: run_script(
+        "vegetation_change_mode_and_percents.py", "-o", os.path.join(out, "vegmode", "veg.tif"), *common
+    )
+
+
+def timed_record(name, func, info, args):
+    try:
+        times, _ = timeit(func, repeat=args.repeat)
+        record = dict(info, name=name, status="ok", seconds=min(times), times=times)
+    except Exception as e:
+        record = dict(info, name=name, status="error", seconds=None, error=repr(e))
+        if args.verbose:
+            traceback.print_exc()
+    print("{:>10} {:<40} {}".format(str(info["scale"]), name, fmt(record)), flush=True)
+    return record
+
+
+def run(args):
+    results = [
+        timed_record("import", import_time, {"scale": None}, args),
+        timed_record("worker_startup", worker_startup, {"scale": None}, args),
+    ]
+
+    for scale in args.scales:
+        workdir = tempfile.mkdtemp(prefix="alfpp_bench_{}_".format(scale), dir=args.workdir)
+        try:
+            paths = make_data(workdir, scale)
+            nreps, years, shape, ndomains = SCALES[scale]
+            info = {"scale": scale, "nreps": nreps, "years": list(years), "shape": list(shape), "ndomains": ndomains}
+            results.append(dict(info, name="generate", status="ok", seconds=paths["generate_seconds"]))
+            print("{} data generated in {:.1f}s".format(scale, paths["generate_seconds"]), flush=True)
+
+            for name, func in benchmarks(paths, scale, args.ncores):
+                if args.only and name not in args.only:
+                    continue
+                results.append(timed_record(name, func, info, args))
+        finally:
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def fmt(record):
+    if record["status"] != "ok":
+        return "ERROR {}".format(record.get("error", ""))
+    return "{:.3f}s".format(record["seconds"])
+
+
+def metadata(args):
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=BIN_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ncores": args.ncores,
+        "repeat": args.repeat,
+        "commit": commit,
+    }
+
+
+def compare(results, baseline_fn):
+    """Print the ratio of each timing against a previous results file."""
+    with open(baseline_fn) as f:
+        baseline = json.load(f)
+    key = lambda r: (r["name"], r["scale"])
+    old = {key(r): r for r in baseline["results"] if r["status"] == "ok"}
+    print("\n{:>10} {:<40} {:>10} {:>10} {:>8}".format("scale", "benchmark", "baseline", "current", "ratio"))
+    for r in results:
+        if r["status"] != "ok" or key(r) not in old:
+            continue
+        before = old[key(r)]["seconds"]
+        print(
+            "{:>10} {:<40} {:>9.3f}s {:>9.3f}s {:>7.2f}x".format(
+                str(r["scale"]), r["name"], before, r["seconds"], r["seconds"] / before if before else float("nan")
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="benchmark alfresco_postprocessing on synthetic ALFRESCO outputs"
+    )
+    parser.add_argument(
+        "-s",
+        "--scales",
+        nargs="+",
+        default=["small"],
+        choices=sorted(SCALES.keys()),
+        help="dataset scales to run",
+    )
+    parser.add_argument("-nc", "--ncores", type=int, default=2, help="number of cores")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="timed repetitions (min is reported)")
+    parser.add_argument("-o", "--output", type=str, default=None, help="path to write the JSON results")
+    parser.add_argument("-c", "--compare", type=str, default=None, help="previous JSON results to compare against")
+    parser.add_argument("--only", nargs="+", default=None, help="only run the named benchmarks")
+    parser.add_argument("--workdir", type=str, default=None, help="directory for the synthetic data")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic data")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print tracebacks of failing benchmarks")
+    args = parser.parse_args()
+
+    results = run(args)
+    out = {"meta": metadata(args), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(out, f, indent=2)
+        print("results written to {}".format(args.output))
+    if args.compare:
+        compare(results, args.compare)
+    failed = [r["name"] for r in results if r["status"] != "ok"]
+    if failed:
+        sys.exit("{} benchmark(s) failed: {}".format(len(failed), ", ".join(failed)))
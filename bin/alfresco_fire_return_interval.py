@@ -0,0 +1,87 @@
+"""Compute per-pixel fire return interval, burn count and time since fire from FireScar ALFRESCO maps
+
+Each replicate's FireScar rasters are streamed in year order (one raster in memory
+at a time per worker) and the replicates are processed in parallel.
+"""
+
+import argparse
+import os
+
+# potential fix for "OpenBLAS blas_thread_init: pthread_create failed for thread . of 64: Resource temporarily unavailable" warnings
+os.environ["OPENBLAS_NUM_THREADS"] = "1"
+import time
+
+import alfresco_postprocessing as ap
+
+
+if __name__ == "__main__":
+    # track time
+    tic = time.perf_counter()
+
+    parser = argparse.ArgumentParser(
+        description="program to calculate fire return interval, burn count and time since fire from ALFRESCO"
+    )
+    parser.add_argument(
+        "-p",
+        "--maps_path",
+        action="store",
+        dest="maps_path",
+        type=str,
+        help="path to ALFRESCO output Maps directory",
+    )
+    parser.add_argument(
+        "-o",
+        "--output_path",
+        action="store",
+        dest="output_path",
+        type=str,
+        help="path to output directory",
+    )
+    parser.add_argument(
+        "-nc",
+        "--ncores",
+        action="store",
+        dest="ncores",
+        type=int,
+        default=None,
+        help="number of cores (at most one per replicate is used)",
+    )
+    parser.add_argument(
+        "-by",
+        "--begin_year",
+        action="store",
+        dest="begin_year",
+        type=int,
+        default=None,
+        help="beginning year in the range",
+    )
+    parser.add_argument(
+        "-ey",
+        "--end_year",
+        action="store",
+        dest="end_year",
+        type=int,
+        default=None,
+        help="ending year in the range, also the reference year for time since fire",
+    )
+    parser.add_argument(
+        "--summary_only",
+        action="store_true",
+        dest="summary_only",
+        help="only write the across-replicate rasters",
+    )
+
+    args = parser.parse_args()
+
+    out_fns = ap.fire_return_interval(
+        args.maps_path,
+        args.output_path,
+        begin_year=args.begin_year,
+        end_year=args.end_year,
+        ncores=args.ncores,
+        per_replicate=not args.summary_only,
+    )
+
+    for name, fn in out_fns.items():
+        print(f"{name}: {fn}")
+    print(f"Elapsed time: {round((time.perf_counter() - tic) / 60, 1)}m")
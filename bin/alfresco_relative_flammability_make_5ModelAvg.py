@@ -1,30 +1,76 @@
-# make relflam 5modelAvg
-def open_raster( fn, band=1 ):
-	with rasterio.open( fn ) as rst:
-		arr = rst.read(band)
-	return arr
-
-if __name__ == '__main__':
-	import os, glob, rasterio, itertools
-	import numpy as np
-
-	base_path = '/atlas_scratch/malindgren/ALFRESCO_PostProcessing/relative_flammability'
-	scenarios = ['rcp45', 'rcp60', 'rcp85']
-	year_groups = ['1900_1999', '2000_2099', '1900_2099']
-
-	for scenario, year_group in itertools.product(scenarios, year_groups):
-		files = glob.glob(os.path.join( base_path, '*{}*{}*.tif'.format(scenario, year_group)))
-		files = [ fn for fn in files if not '5ModelAvg' in fn ] # remove any old 5ModelAvg files
-		with rasterio.open(files[0]) as tmp:
-			meta = tmp.meta.copy()
-			meta.update(compress='lzw')
-			mask = tmp.read(1) == -9999
-		
-		# read in the files
-		arr = np.array([open_raster(fn) for fn in files]).mean(axis=0).astype(np.float32)
-		arr[ mask ] = -9999
-		out_fn = os.path.join( base_path, 'alfresco_relative_flammability_5ModelAvg_{}_{}.tif'.format( scenario, year_group) )
-		with rasterio.open( out_fn, 'w', **meta ) as out:
-			out.write( arr, 1 )
+"""Average the relative flammability rasters of all models for each scenario and year range
 
+Reads the alfresco_relative_flammability_<model>_<scenario>_<begin>_<end>.tif files in
+a directory and writes alfresco_relative_flammability_5ModelAvg_<scenario>_<begin>_<end>.tif
+for each scenario and year range. This is the reduce step of the relative
+flammability campaign (see relative_flammability_launcher_atlas.py).
+"""
 
+import argparse
+import glob
+import itertools
+import os
+
+import numpy as np
+import rasterio
+
+
+def open_raster(fn, band=1):
+    with rasterio.open(fn) as rst:
+        arr = rst.read(band)
+    return arr
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="average relative flammability rasters across models")
+    parser.add_argument(
+        "-p",
+        "--base_path",
+        action="store",
+        dest="base_path",
+        type=str,
+        required=True,
+        help="directory holding the relative flammability rasters of each model",
+    )
+    parser.add_argument(
+        "-s",
+        "--scenarios",
+        action="store",
+        dest="scenarios",
+        nargs="+",
+        default=["rcp45", "rcp60", "rcp85"],
+        help="scenarios to average",
+    )
+    parser.add_argument(
+        "-y",
+        "--year_groups",
+        action="store",
+        dest="year_groups",
+        nargs="+",
+        default=["1900_1999", "2000_2099", "1900_2099"],
+        help="year ranges to average as begin_end",
+    )
+    args = parser.parse_args()
+
+    for scenario, year_group in itertools.product(args.scenarios, args.year_groups):
+        files = glob.glob(os.path.join(args.base_path, "*{}*{}*.tif".format(scenario, year_group)))
+        files = [fn for fn in files if not "5ModelAvg" in fn]  # remove any old 5ModelAvg files
+        if len(files) == 0:
+            continue
+        with rasterio.open(files[0]) as tmp:
+            meta = tmp.meta.copy()
+            meta.update(compress="lzw")
+            mask = tmp.read(1) == -9999
+
+        # sum the files one at a time
+        arr = np.zeros(mask.shape, dtype=np.float64)
+        for fn in files:
+            arr += open_raster(fn)
+        arr = (arr / len(files)).astype(np.float32)
+        arr[mask] = -9999
+        out_fn = os.path.join(
+            args.base_path, "alfresco_relative_flammability_5ModelAvg_{}_{}.tif".format(scenario, year_group)
+        )
+        with rasterio.open(out_fn, "w", **meta) as out:
+            out.write(arr, 1)
+        print(out_fn)
@@ -31,7 +31,8 @@ def relative_veg_change( veg_list, ncpus=32 ):
 		2-D numpy.ndarray of transition counts across the list of 
 		filenames passed.
 	'''
-	arr_list = mp_map( open_raster, veg_list, nproc=ncpus )
+	with Pool( ncpus ) as pool:
+		arr_list = pool.map( open_raster, veg_list )
 	return count_transitions( arr_list )
 def main( args ):
 	'''
@@ -53,7 +54,7 @@ def main( args ):
 	# calculate relative vegetation change -- parallel
 	# final = mp_map( relative_veg_change, veg_grouped, nproc=int( args.ncpus ) )
 	final = [ relative_veg_change( v, int(args.ncores) ) for v in veg_grouped ]
-	final = np.sum( final, axis=0 ) / np.float( len(veg_list) )
+	final = np.sum( final, axis=0 ) / float( len(veg_list) )
 
 	# set dtype to float32 and round it
 	final = final.astype( np.float32 )
@@ -75,7 +76,7 @@ def main( args ):
 if __name__ == '__main__':
 	from itertools import groupby
 	import glob, os, sys, re, rasterio
-	from pathos.mp_map import mp_map
+	from multiprocessing import Pool
 	import numpy as np
 	import scipy as sp
 	import argparse
@@ -0,0 +1,66 @@
+"""Convert alfresco_postprocessing TinyDB JSON outputs to metric stores and fire tables
+
+Each JSON file is streamed record by record, so multi-GB databases convert with
+bounded memory. Writes <name>.nc (or .zarr) and <name>_fires.npz next to the
+output path for every input file.
+"""
+
+import argparse
+import os
+
+import alfresco_postprocessing as ap
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="convert alfresco_postprocessing TinyDB JSON files to NetCDF/Zarr metric stores and fire tables"
+    )
+    parser.add_argument(
+        "-fn",
+        "--fn",
+        action="store",
+        dest="fns",
+        nargs="+",
+        type=str,
+        help="paths to alfresco_postprocessing generated summary JSON files",
+    )
+    parser.add_argument(
+        "-o",
+        "--output_path",
+        action="store",
+        dest="output_path",
+        type=str,
+        default=".",
+        help="path to output directory",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        action="store",
+        dest="format",
+        type=str,
+        default="netcdf",
+        choices=["netcdf", "zarr"],
+        help="metric store format",
+    )
+    parser.add_argument(
+        "--no_fire_table",
+        action="store_true",
+        dest="no_fire_table",
+        help="do not write the all_fire_sizes fire table",
+    )
+    args = parser.parse_args()
+
+    ext = ".zarr" if args.format == "zarr" else ".nc"
+    for fn in args.fns:
+        name = os.path.splitext(os.path.basename(fn))[0]
+        fire_table_fn = None
+        if not args.no_fire_table:
+            fire_table_fn = os.path.join(args.output_path, name + "_fires.npz")
+        out = ap.tinydb_to_store(
+            fn,
+            store_fn=os.path.join(args.output_path, name + ext),
+            fire_table_fn=fire_table_fn,
+            format=args.format,
+        )
+        print(fn, "->", ", ".join(out.values()))
@@ -1,97 +1,128 @@
-# 0. Load veg input map layer. (With use of veg input map, all years can be processed independently.)
-# # special case --> consider after normal use-case is complete.
-
-# 1. For a single year, load all reps' basal area maps and veg maps.
-
-def prep_basalarea( ts, vegmap ):
-	arr = rasterio.open( ts.fn ).read( 1 )
-	# set to zero all data != Tundra ... classes 4/5/6...
-	arr[ np.where((vegmap != 4) & (vegmap != 5) & (vegmap != 6)) ] = 0
-	return arr
-
-def prep_veg( ts, vegmap ):
-	arr = rasterio.open( ts.fn ).read( 1 )
-	# set to zero all data != Tundra ... classes 4/5/6...
-	arr[ np.where((arr != 4) & (arr != 5) & (arr != 6)) ] = 0
-	arr[ arr > 0 ] = 1
-	return arr
-
-def basal_across_reps( group, vegmap, output_path ):
-	import numpy as np
-	import rasterio, os
-
-	group_id, group = group
-
-	basal_ts_list = group[ group['variable']=='BasalArea' ].object.tolist()
-	veg_ts_list = group[ group['variable']=='Veg' ].object.tolist()
-
-	# we may need to maintain the year information here...
-	prepped_basal = [ prep_basalarea( ts, vegmap ) for ts in basal_ts_list ]
-	prepped_veg = [ prep_veg( ts, vegmap ) for ts in veg_ts_list ]
-
-	del basal_ts_list, veg_ts_list
-
-	processed = []
-	for basal, veg in zip( prepped_basal, prepped_veg ):
-		out_arr = np.zeros_like( basal )
-		out_arr[ np.where( (veg == 1) & (basal > 0) ) ] = basal[ np.where( (veg == 1) & (basal > 0) ) ]
-		processed = processed + [ out_arr ]
-
-	del prepped_veg, prepped_basal
-	basalavg = np.mean( processed, axis=0 )
-
-	del processed
-
-	with rasterio.open( ts.fn ) as rst:
-		meta = rst.meta
-	
-	del rst
-
-	if 'transform' in meta.keys():
-		meta.pop( 'transform' )
-
-	meta.update( compress='lzw', count=1, crs={'init':'epsg:3338'}, dtype='float32', nodata=-9999 )
-
-	output_filename = os.path.join( output_path, 'alfresco_basalchange_acrossreps_{}.tif'.format( group_id ) )
-	with rasterio.open( output_filename, 'w', **meta ) as out:
-		basalavg[ vegmap == 255 ] = -9999
-		out.write( basalavg.astype( np.float32 ), 1 )
-
-	return output_filename
-	
-
-if __name__ == '__main__':
-	import os, rasterio
-	import numpy as np
-	from alfresco_postprocessing import FileLister, veg_name_dict
-	from functools import partial
-	from pathos.mp_map import mp_map
-
-	# inputs
-	vegmap_fn = '/atlas_scratch/ALFRESCO/ALFRESCO_Master_Dataset/ALFRESCO_Model_Input_Datasets/AK_CAN_Inputs/Landcover/LandCover_alf_2005.tif'
-	vegmap = rasterio.open( vegmap_fn ).read( 1 )
-
-	# crop vegmap for use with IEM-based ALF outputs... <<<- this is a hack for working with the SERDP outputs as a TEST
-	vegmap = vegmap[:2100, :3650]
-
-	alf_dir = '/big_scratch/apbennett/ALFRESCO_Projects/SERDP/GFDL-CM3.rcp85/Maps'
-	files = FileLister( alf_dir )
-	timesteps = files.timesteps
-
-	grouped_years = [ i for i in files.files_df.groupby( 'year' ) ]
-	
-	output_path = '/workspace/Shared/Users/malindgren/basal_across_reps'
-	run = partial( basal_across_reps, vegmap=vegmap, output_path=output_path )
-	done = mp_map( run, grouped_years, nproc=15 )
-
-
-
-# 2. In basal area maps, ignore any cells that were not originally tundra in the veg input map (i.e., set to zero).
-
-# 3. For cells which were tundra in the veg input map:
-#     A. Retain the basal area score (1-20) for current veg map tundra cells which have such a basal area map score.
-#     B. If no score is present set basal area map cell to zero if still a tundra cell in the current veg map; set it to 20 if currently a spruce cell.
-
-# 4. Average basal area maps across reps, rescale to [0, 1] or [0, 100], optionally round off.
-
-# Result: One map of likelihood/probability of transition per year.
+"""Likelihood of tundra -> spruce transition from ALFRESCO BasalArea outputs
+
+For each year, pixels that were tundra in the input veg (land cover) map and are
+still tundra in a replicate's Veg output keep that replicate's basal area, all
+other pixels count as 0, and the result is averaged across replicates:
+
+1. ignore any cells that were not tundra in the input veg map.
+2. for cells that were tundra in the input veg map, retain the basal area score
+   of the cells that are tundra in the current Veg map, else 0.
+3. average across replicates.
+
+Result: one map per year of the likelihood of transition. Years and spatial
+tiles are processed in parallel, summing the replicates one at a time.
+"""
+
+import argparse
+import os
+import time
+
+import alfresco_postprocessing as ap
+
+
+if __name__ == "__main__":
+    # track time
+    tic = time.perf_counter()
+
+    parser = argparse.ArgumentParser(
+        description="program to compute the across-replicate tundra basal area of each year of an ALFRESCO run"
+    )
+    parser.add_argument(
+        "-p",
+        "--maps_path",
+        action="store",
+        dest="maps_path",
+        type=str,
+        default="./Maps",
+        help="path to ALFRESCO output Maps directory",
+    )
+    parser.add_argument(
+        "-v",
+        "--vegmap_fn",
+        action="store",
+        dest="vegmap_fn",
+        type=str,
+        required=True,
+        help="path to the input veg (land cover) map of the run, read over the extent of the outputs",
+    )
+    parser.add_argument(
+        "-o",
+        "--output_path",
+        action="store",
+        dest="output_path",
+        type=str,
+        default=".",
+        help="path to output directory",
+    )
+    parser.add_argument(
+        "-r",
+        "--replicates",
+        action="store",
+        dest="replicates",
+        nargs="+",
+        default=None,
+        help="replicate numbers to use (default all)",
+    )
+    parser.add_argument(
+        "-tv",
+        "--tundra_values",
+        action="store",
+        dest="tundra_values",
+        nargs="+",
+        type=int,
+        default=ap.TUNDRA_VALUES,
+        help="Veg classes counted as tundra (default 4 5 6)",
+    )
+    parser.add_argument(
+        "-nc",
+        "--ncores",
+        action="store",
+        dest="ncores",
+        type=int,
+        default=None,
+        help="number of cores",
+    )
+    parser.add_argument(
+        "-t",
+        "--tile_size",
+        action="store",
+        dest="tile_size",
+        type=int,
+        default=1024,
+        help="height and width of the tiles processed at a time, in pixels",
+    )
+    parser.add_argument(
+        "-by",
+        "--begin_year",
+        action="store",
+        dest="begin_year",
+        type=int,
+        default=None,
+        help="beginning year in the range",
+    )
+    parser.add_argument(
+        "-ey",
+        "--end_year",
+        action="store",
+        dest="end_year",
+        type=int,
+        default=None,
+        help="ending year in the range",
+    )
+
+    args = parser.parse_args()
+
+    out_fns = ap.tundra_basal_area_change(
+        args.maps_path,
+        args.output_path,
+        args.vegmap_fn,
+        begin_year=args.begin_year,
+        end_year=args.end_year,
+        replicates=args.replicates,
+        tundra_values=args.tundra_values,
+        ncores=args.ncores,
+        tile_size=args.tile_size,
+    )
+
+    print(f"tundra basal area for {len(out_fns)} years written to {os.path.abspath(args.output_path)}")
+    print(f"Elapsed time: {round((time.perf_counter() - tic) / 60, 1)}m")
@@ -0,0 +1,172 @@
+"""Split one ALFRESCO post processing run across any number of nodes
+
+A queue of timestep chunks is written to a directory on a shared filesystem.
+Workers started on any node (or several locally) claim chunks until none are
+left, and the reduce step merges their results into the usual TinyDB output.
+
+    python alfresco_workqueue.py create -q /shared/queue -p /path/to/Maps -sd domains.shp -id OBJECTID -nf NAME
+    python alfresco_workqueue.py work -q /shared/queue -nc 32      # on every node
+    python alfresco_workqueue.py status -q /shared/queue
+    python alfresco_workqueue.py reduce -q /shared/queue -o /path/to/output.json
+"""
+
+import argparse
+import json
+
+import alfresco_postprocessing as ap
+
+
+def create(args):
+    ap.create_queue(
+        args.queue_path,
+        args.maps_path,
+        ap.veg_name_dict,
+        subdomains_fn=args.subdomains_fn,
+        id_field=args.id_field,
+        name_field=args.name_field,
+        chunk_size=args.chunk_size,
+        fire_table=args.fire_table,
+        veg_transitions=args.veg_transitions,
+    )
+    print(json.dumps(ap.queue_status(args.queue_path)))
+
+
+def work(args):
+    ntasks = ap.work_queue(args.queue_path, ncores=args.ncores, prefetch=args.prefetch)
+    print(f"{ntasks} tasks run")
+    print(json.dumps(ap.queue_status(args.queue_path)))
+
+
+def status(args):
+    print(json.dumps(ap.queue_status(args.queue_path)))
+
+
+def requeue(args):
+    requeued = ap.requeue_stale(args.queue_path, max_age=args.max_age, failed=args.failed)
+    print(f"{len(requeued)} tasks requeued")
+
+
+def reduce(args):
+    ap.reduce_queue(
+        args.queue_path,
+        args.output_json,
+        fire_table_fn=args.fire_table_fn,
+        store_fire_sizes=not args.no_fire_sizes,
+        ensemble_fn=args.ensemble_fn,
+    )
+    print(args.output_json)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="shared filesystem work queue for ALFRESCO post processing")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_queue_path(subparser):
+        subparser.add_argument(
+            "-q",
+            "--queue_path",
+            action="store",
+            dest="queue_path",
+            type=str,
+            required=True,
+            help="queue directory on a filesystem shared by all the nodes",
+        )
+
+    parser_create = subparsers.add_parser("create", help="write the queue of timestep chunks")
+    add_queue_path(parser_create)
+    parser_create.add_argument(
+        "-p", "--maps_path", action="store", dest="maps_path", type=str, required=True, help="input Maps folder"
+    )
+    parser_create.add_argument(
+        "-sd", "--subdomains_fn", action="store", dest="subdomains_fn", type=str, default=None, help="sub-domains file"
+    )
+    parser_create.add_argument(
+        "-id", "--id_field", action="store", dest="id_field", type=str, default=None, help="sub-domains id field"
+    )
+    parser_create.add_argument(
+        "-nf", "--name_field", action="store", dest="name_field", type=str, default=None, help="sub-domains name field"
+    )
+    parser_create.add_argument(
+        "-c",
+        "--chunk_size",
+        action="store",
+        dest="chunk_size",
+        type=int,
+        default=10,
+        help="number of timesteps in each task",
+    )
+    parser_create.add_argument(
+        "--fire_table", action="store_true", dest="fire_table", help="keep the per-fire rows for a fire table"
+    )
+    parser_create.add_argument(
+        "--veg_transitions", action="store_true", dest="veg_transitions", help="add the veg transition counts"
+    )
+    parser_create.set_defaults(func=create)
+
+    parser_work = subparsers.add_parser("work", help="run workers on this node until no tasks are left")
+    add_queue_path(parser_work)
+    parser_work.add_argument(
+        "-nc", "--ncores", action="store", dest="ncores", type=int, default=1, help="number of worker processes"
+    )
+    parser_work.add_argument(
+        "-pf",
+        "--prefetch",
+        action="store",
+        dest="prefetch",
+        type=int,
+        default=0,
+        help="number of timesteps to read ahead in each worker",
+    )
+    parser_work.set_defaults(func=work)
+
+    parser_status = subparsers.add_parser("status", help="count the pending, claimed, done and failed tasks")
+    add_queue_path(parser_status)
+    parser_status.set_defaults(func=status)
+
+    parser_requeue = subparsers.add_parser("requeue", help="put stale claims (and failed tasks) back in the queue")
+    add_queue_path(parser_requeue)
+    parser_requeue.add_argument(
+        "-a",
+        "--max_age",
+        action="store",
+        dest="max_age",
+        type=float,
+        default=3600,
+        help="seconds without progress after which a claim is stale",
+    )
+    parser_requeue.add_argument("--failed", action="store_true", dest="failed", help="also requeue failed tasks")
+    parser_requeue.set_defaults(func=requeue)
+
+    parser_reduce = subparsers.add_parser("reduce", help="merge the results into a TinyDB")
+    add_queue_path(parser_reduce)
+    parser_reduce.add_argument(
+        "-o", "--output_json", action="store", dest="output_json", type=str, required=True, help="output TinyDB JSON"
+    )
+    parser_reduce.add_argument(
+        "-ft",
+        "--fire_table_fn",
+        action="store",
+        dest="fire_table_fn",
+        type=str,
+        default=None,
+        help="output fire table .npz (queue created with --fire_table)",
+    )
+    parser_reduce.add_argument(
+        "--no_fire_sizes",
+        action="store_true",
+        dest="no_fire_sizes",
+        help="leave all_fire_sizes out of the TinyDB",
+    )
+    parser_reduce.add_argument(
+        "-e",
+        "--ensemble_fn",
+        action="store",
+        dest="ensemble_fn",
+        type=str,
+        default=None,
+        help="output CSV of the replicate ensemble summary",
+    )
+    parser_reduce.set_defaults(func=reduce)
+
+    args = parser.parse_args()
+    args.func(args)
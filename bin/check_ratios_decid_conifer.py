@@ -1,43 +1,77 @@
-# how to get ratios from alfresco rasters:
-import os, glob, rasterio
-import pathos.multiprocessing as mp
-
-# list the files:
-maps_path = '/atlas_scratch/apbennett/Calibration/HighCalib/FMO_Calibrated/GISS-E2-R_rcp85_AltFMO/Maps'
-
-files = [ os.path.join( root, i ) for root, subs, files in os.walk( maps_path ) \
-			if len( files ) > 0 for i in files if 'Veg_' in i ]
-
-rep_files = sorted( [ i for i in files if '_0_' in i ] )
-
-# # VEGETATION MAP DEFAULT:
-veg_name_dict = {1:'Black Spruce',
-				2:'White Spruce',
-				3:'Deciduous',
-				4:'Shrub Tundra',
-				5:'Graminoid Tundra',
-				6:'Wetland Tundra',
-				7:'Barren lichen-moss',
-				8:'Temperate Rainforest'}
-
-# conifers = [ 'Black Spruce','White Spruce' ]
-# [ veg_name_dict[ key ] for key in veg_name_dict.keys() ]
-
-# , group1=[1,2], group2=[1] 
-def veg_ratio( veg ):
-	var, rep, year = os.path.basename( veg ).split('.')[0].split( '_' )
-	veg = rasterio.open( veg )
-	arr = veg.read( 1 )
-	conif, = arr[ (arr==1) | (arr==2) ].shape
-	decid, = arr[ arr == 3 ].shape
-	return (year,(conif / float(decid)))
-	
-if __name__ == '__main__':
-	# run that
-	pool = mp.Pool( 32 )
-	ratios = pool.map( veg_ratio, rep_files )
-	pool.close()
-	pool.join()
+"""Conifer:deciduous (or any veg group) ratios from ALFRESCO post processing outputs
 
+Ratios and group shares are derived from the stored veg_counts of an
+alfresco_postprocessing TinyDB JSON or metric store (.nc / .zarr) for all
+replicates, years and domains at once, without reading any Veg rasters.
+"""
 
+import argparse
 
+import alfresco_postprocessing as ap
+
+
+def parse_groups(groups):
+    """["conifer=1,2", "deciduous=3"] -> {"conifer": [1, 2], "deciduous": [3]}"""
+    out = {}
+    for group in groups:
+        name, classes = group.split("=")
+        out[name] = [int(c) if c.strip().isdigit() else c.strip() for c in classes.split(",")]
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="veg group ratios and shares for every replicate, year and domain. output as CSV"
+    )
+    parser.add_argument(
+        "-fn",
+        "--fn",
+        action="store",
+        dest="fn",
+        type=str,
+        help="path to alfresco_postprocessing generated summary JSON, or metric store",
+    )
+    parser.add_argument(
+        "-o",
+        "--output_fn",
+        action="store",
+        dest="output_fn",
+        type=str,
+        help="path to the output CSV",
+    )
+    parser.add_argument(
+        "-g",
+        "--groups",
+        action="store",
+        dest="groups",
+        nargs="+",
+        default=None,
+        help="veg groups as name=code,code (or names), e.g. conifer=1,2 deciduous=3 (default conifer, deciduous, tundra)",
+    )
+    parser.add_argument(
+        "-ratio",
+        "--ratio",
+        action="store",
+        dest="ratios",
+        nargs="+",
+        default=["conifer:deciduous"],
+        help="ratios to compute as numerator:denominator group names",
+    )
+    parser.add_argument(
+        "-r",
+        "--replicates",
+        action="store",
+        dest="replicates",
+        nargs="+",
+        default=None,
+        help="only output these replicates (default all)",
+    )
+    args = parser.parse_args()
+
+    groups = parse_groups(args.groups) if args.groups is not None else None
+    ratios = [tuple(ratio.split(":")) for ratio in args.ratios]
+    df = ap.veg_group_table(args.fn, groups=groups, ratios=ratios)
+    if args.replicates is not None:
+        df = df[df["replicate"].astype(str).isin(args.replicates)]
+    df.to_csv(args.output_fn, index=False)
+    print(args.output_fn)
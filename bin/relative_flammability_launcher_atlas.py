@@ -1,49 +1,205 @@
-# RUN RELATIVE FLAMMABILITY ACROSS ALL SUB-DIRS in IEM_AR5 directory
-def run_model( fn, maps_path, output_filename, ncores, begin_year, end_year ):
-	import os, subprocess
-	head = '#!/bin/sh\n' + \
-			'#SBATCH --ntasks=32\n' + \
-			'#SBATCH --nodes=1\n' + \
-			'#SBATCH --ntasks-per-node=32\n' + \
-			'#SBATCH --account=snap\n' + \
-			'#SBATCH --mail-type=FAIL\n' + \
-			'#SBATCH --mail-user=malindgren@alaska.edu\n' + \
-			'#SBATCH -p main\n'
-	
-	script_path = '/workspace/UA/malindgren/repos/alfresco_postprocessing/bin/alfresco_relative_flammability.py'
-	with open( fn, 'w' ) as f:
-		command = ' '.join([ 'ipython', script_path,\
-							 '--', '-p', maps_path, '-o', output_filename, '-nc', str(ncores), '-by', str(begin_year), '-ey', str(end_year) ])
-		f.writelines( head + '\n' + command + '\n' )
-	subprocess.call([ 'sbatch', fn ])
-	return 1
-
-if __name__ == '__main__':
-	import os, glob, subprocess
-
-	base_path = '/atlas_scratch/apbennett/IEM_AR5'
-	output_path = '/atlas_scratch/jschroder/ALF_outputs/PP_2017-07-19-09-03_all_polygons/relative_flammability'
-	mask_fn = None
-	sub_dirs = [ i for i in glob.glob(base_path+'/*') if 'Plot' not in i and 'Core' not in i and os.path.isdir(i) ] # drop unneeded folders...
-	# i suggest keeping this number low due to RAM overhead issues.  
-	#  10 is good for 200 years / 200 reps over IEM AOI
-	ncores = 10 
-
-	# IEM DATA TIMESTEPS...
-	year_ranges = [(1900,1999), (2000,2099), (1900,2099)]
-	maps_paths = [ os.path.join( base_path, i, 'Maps' ) for i in sub_dirs ]
-	output_filenames = [ os.path.join( output_path, 'alfresco_relative_flammability_'+os.path.basename(sub)+'.tif' ) for sub in sub_dirs ]
-
-	for maps_path, out_fn in zip( maps_paths, output_filenames ):
-		for year_range in year_ranges:
-			begin_year, end_year = year_range
-			output_filename = out_fn.replace('.tif', '_{}_{}.tif'.format(str(begin_year), str(end_year)))
-		
-			slurm_path = os.path.join( output_path, 'slurm' )
-			if not os.path.exists( slurm_path ):
-				os.makedirs( slurm_path )
-			
-			os.chdir( slurm_path )
-			
-			slurm_file = os.path.join( slurm_path, 'slurm_run_{}.slurm'.format(maps_path.split(os.path.sep)[-2]) )
-			run_model( slurm_file, maps_path, output_filename, ncores, begin_year, end_year )
+"""Run relative flammability for every model / scenario and year range as one Slurm campaign
+
+Each model_scenario/Maps directory under the base path x year range is an
+element of a single job array, sized from the FireScar raster dimensions and
+the node memory budget. A reduce job that averages the models of each scenario
+(alfresco_relative_flammability_make_5ModelAvg.py) runs once the whole array
+succeeded. Use --dry_run to only write the scripts, --sbatch to point at a fake
+sbatch, or --local to run the campaign on this machine without Slurm.
+"""
+
+import argparse
+import glob
+import os
+import shlex
+import sys
+
+import alfresco_postprocessing as ap
+
+# relative flammability reads replicate groups of 50 FireScars as 8 byte arrays, plus their sum
+RELFLAM_ARRAYS_PER_WORKER = 51
+
+
+def parse_year_range(year_range):
+    """'1900:1999' -> (1900, 1999)"""
+    begin_year, end_year = year_range.split(":")
+    return int(begin_year), int(end_year)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="relative flammability of many ALFRESCO runs as a Slurm job array")
+    parser.add_argument(
+        "-b",
+        "--base_path",
+        action="store",
+        dest="base_path",
+        type=str,
+        required=True,
+        help="directory of model_scenario folders, each holding a Maps folder",
+    )
+    parser.add_argument(
+        "-o",
+        "--output_path",
+        action="store",
+        dest="output_path",
+        type=str,
+        required=True,
+        help="path to output directory",
+    )
+    parser.add_argument(
+        "-y",
+        "--year_ranges",
+        action="store",
+        dest="year_ranges",
+        nargs="+",
+        type=parse_year_range,
+        default=[(1900, 1999), (2000, 2099), (1900, 2099)],
+        help="year ranges as begin:end",
+    )
+    parser.add_argument(
+        "-c",
+        "--campaign_path",
+        action="store",
+        dest="campaign_path",
+        type=str,
+        default=None,
+        help="directory for the slurm scripts and logs (default <output_path>/slurm)",
+    )
+    parser.add_argument(
+        "-nc",
+        "--ncores",
+        action="store",
+        dest="ncores",
+        type=int,
+        default=None,
+        help="cores per task (default sized from the rasters and the node memory)",
+    )
+    parser.add_argument(
+        "-m",
+        "--mem_per_node",
+        action="store",
+        dest="mem_per_node",
+        type=int,
+        default=64000,
+        help="memory budget of a node in MB",
+    )
+    parser.add_argument(
+        "-cn",
+        "--cpus_per_node",
+        action="store",
+        dest="cpus_per_node",
+        type=int,
+        default=32,
+        help="cpus of a node",
+    )
+    parser.add_argument(
+        "-mc",
+        "--max_concurrent",
+        action="store",
+        dest="max_concurrent",
+        type=int,
+        default=None,
+        help="limit on the number of tasks running at once",
+    )
+    parser.add_argument(
+        "-pa", "--partition", action="store", dest="partition", type=str, default="main", help="slurm partition"
+    )
+    parser.add_argument("-a", "--account", action="store", dest="account", type=str, default=None, help="slurm account")
+    parser.add_argument(
+        "-t", "--time", action="store", dest="time", type=str, default=None, help="time limit of each task"
+    )
+    parser.add_argument(
+        "--mail_user", action="store", dest="mail_user", type=str, default=None, help="mail on failure to this address"
+    )
+    parser.add_argument(
+        "--no_model_average",
+        action="store_true",
+        dest="no_model_average",
+        help="do not add the reduce job averaging the models of each scenario",
+    )
+    parser.add_argument(
+        "--sbatch", action="store", dest="sbatch", type=str, default="sbatch", help="sbatch command to submit with"
+    )
+    parser.add_argument("--dry_run", action="store_true", dest="dry_run", help="only write the scripts")
+    parser.add_argument("--local", action="store_true", dest="local", help="run the campaign here, without slurm")
+
+    args = parser.parse_args()
+    # the jobs run elsewhere, so every path they get is absolute
+    args.base_path = os.path.abspath(args.base_path)
+    args.output_path = os.path.abspath(args.output_path)
+
+    sub_dirs = sorted(
+        i
+        for i in glob.glob(os.path.join(args.base_path, "*"))
+        if "Plot" not in i and "Core" not in i and os.path.isdir(os.path.join(i, "Maps"))
+    )
+    if len(sub_dirs) == 0:
+        sys.exit("no model_scenario/Maps folders found in {}".format(args.base_path))
+
+    firescar_fn = next(
+        os.path.join(root, fn)
+        for root, subs, files in os.walk(os.path.join(sub_dirs[0], "Maps"))
+        for fn in files
+        if fn.startswith("FireScar_") and fn.endswith(".tif")
+    )
+    resources = ap.task_resources(
+        firescar_fn,
+        arrays_per_worker=RELFLAM_ARRAYS_PER_WORKER,
+        mem_per_node_mb=args.mem_per_node,
+        cpus_per_node=args.cpus_per_node,
+    )
+    if args.ncores is not None:
+        resources.update(cpus_per_task=args.ncores, mem_mb=int((args.ncores + 1) * resources["worker_mb"]))
+    # the model average holds a sum, a mask and one raster
+    reduce_mem_mb = ap.task_resources(firescar_fn, arrays_per_worker=3, mem_per_node_mb=args.mem_per_node, cpus_per_node=1)[
+        "mem_mb"
+    ]
+
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alfresco_relative_flammability.py")
+    tasks = []
+    for sub_dir in sub_dirs:
+        for begin_year, end_year in args.year_ranges:
+            output_filename = os.path.join(
+                args.output_path,
+                "alfresco_relative_flammability_{}_{}_{}.tif".format(os.path.basename(sub_dir), begin_year, end_year),
+            )
+            command = [sys.executable, script_path, "-p", os.path.join(sub_dir, "Maps"), "-o", output_filename]
+            command += ["-nc", str(resources["cpus_per_task"]), "-by", str(begin_year), "-ey", str(end_year)]
+            tasks.append(" ".join(shlex.quote(c) for c in command))
+
+    reduce_command = None
+    if not args.no_model_average:
+        scenarios = sorted(set(os.path.basename(sub_dir).split("_")[-1] for sub_dir in sub_dirs))
+        year_groups = ["{}_{}".format(*year_range) for year_range in args.year_ranges]
+        reduce_script = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "alfresco_relative_flammability_make_5ModelAvg.py"
+        )
+        command = [sys.executable, reduce_script, "-p", args.output_path, "-s"] + scenarios + ["-y"] + year_groups
+        reduce_command = " ".join(shlex.quote(c) for c in command)
+
+    campaign_path = args.campaign_path or os.path.join(args.output_path, "slurm")
+    fns = ap.write_campaign(
+        campaign_path,
+        tasks,
+        reduce_command=reduce_command,
+        job_name="relflam",
+        cpus_per_task=resources["cpus_per_task"],
+        mem_mb=resources["mem_mb"],
+        max_concurrent=args.max_concurrent,
+        time=args.time,
+        partition=args.partition,
+        account=args.account,
+        mail_user=args.mail_user,
+        env={"OPENBLAS_NUM_THREADS": 1},
+        reduce_mem_mb=reduce_mem_mb,
+    )
+    print(
+        "{} tasks with {} cores and {} MB each, scripts in {}".format(
+            len(tasks), resources["cpus_per_task"], resources["mem_mb"], campaign_path
+        )
+    )
+
+    if args.local:
+        ap.run_campaign_locally(campaign_path)
+    else:
+        print(ap.submit_campaign(campaign_path, sbatch=args.sbatch, dry_run=args.dry_run))
@@ -6,7 +6,7 @@ import time
 from itertools import groupby
 import rasterio
 import numpy as np
-from pathos.mp_map import mp_map
+from multiprocessing import Pool
 from scipy import stats
 
 
@@ -56,7 +56,8 @@ def main(args):
     # The first-level list stores the replicates for each year.
     # The second-level list stores the rasters for each year's replicates.
     # The rasters are 2D grids of x/y coordinates and vegetation type value.
-    raster_data = [mp_map(open_raster, v, nproc=int(args.ncores)) for v in veg_grouped]
+    with Pool(int(args.ncores)) as pool:
+        raster_data = [pool.map(open_raster, v) for v in veg_grouped]
 
     # Turn list of list of 2D arrays into 4D array with axes:
     # Axis 0: years
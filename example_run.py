@@ -3,10 +3,10 @@
 # * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
 import alfresco_postprocessing as ap
-import os
+import os, logging
 
 # # input args
-ncores = 32
+ncores = 'auto' # or a number of worker processes, see ap.plan_run
 maps_path = './Maps' # alfresco output maps dir
 historical_maps_path = './FireHistory'
 subdomains_fn = './Domains/AOI_SERDP.shp'
@@ -19,6 +19,9 @@ suffix = 'ModelName_scenario' # some id for the output csvs
 metrics = [ 'veg_counts','avg_fire_size','number_of_fires','all_fire_sizes','total_area_burned','severity_counts' ]
 
 # # PostProcess
+# show the worker plan of ncores='auto' runs
+logging.basicConfig( level=logging.INFO )
+
 # alfresco output gtiffs
 pp = ap.run_postprocessing( maps_path, mod_json_fn, ncores, ap.veg_name_dict, subdomains_fn, id_field, name_field )
 
@@ -1,6 +1,8 @@
 from setuptools import setup
 
-dependencies_list = ['numpy','scipy','rasterio','shapely','pandas','geopandas','tinydb','ujson', 'seaborn']
+dependencies_list = ['numpy','scipy','rasterio','shapely','pandas','geopandas','tinydb', 'seaborn']
+# optional dependencies for the lazy raster cube ( ap.open_cube ) and NetCDF/Zarr metric stores ( ap.to_cube_store )
+extras_dict = { 'cube':['dask[array]','xarray'], 'store':['xarray','netCDF4','zarr'] }
 #scripts_list = [	'bin/alfresco_aggregate_domains_json.py', 'bin/alfresco_fire_return_interval_estimate.py', \
 #			'bin/alfresco_json_manipulation_historical.py', 'bin/alfresco_json_manipulation.py', \
 #			'bin/alfresco_modify_postprocessing_colnames_historical.py', 'bin/alfresco_modify_postprocessing_csv_names.py', \
@@ -15,10 +17,10 @@ classifiers = [ 	'Development Status :: 3 - Alpha',
 			'Intended Audience :: End Users/Desktop',
 			'Topic :: Software Development :: Build Tools',
 			'License :: OSI Approved :: MIT License',
-			'Programming Language :: Python :: 2.7',
+			'Programming Language :: Python :: 3',
 			'Natural Language :: English',
 			'Operating System :: POSIX :: Linux',
-			'Programming Language :: Python :: 2.7',
+			'Programming Language :: Python :: 3 :: Only',
 			'Topic :: Scientific/Engineering :: GIS',
 			'Topic :: Scientific/Engineering :: Boreal Fire Dynamics Model'	]
 
@@ -30,7 +32,9 @@ setup(	name='alfresco_postprocessing',
 		author_email='malindgren@alaska.edu',
 		license='MIT',
 		packages=['alfresco_postprocessing'],
+		python_requires='>=3.6',
 		install_requires=dependencies_list,
+		extras_require=extras_dict,
 		zip_safe=False,
 		include_package_data=True,
 		#dependency_links=['https://github.com/uqfoundation/pathos'],
@@ -0,0 +1,33 @@
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+# SHARED FIXTURES: small synthetic ALFRESCO outputs
+# * * * * * * * * * * * * * * * * * * * * * * * * * * *
+import os
+import pytest
+
+SHAPE = ( 64, 64 )
+NREPS = 2
+YEARS = ( 1901, 1903 )
+NDOMAINS = 2
+
+@pytest.fixture( scope='session' )
+def synthetic_run( tmp_path_factory ):
+	''' Maps, FireHistory and a sub-domains raster written once per test session '''
+	from alfresco_postprocessing import synthetic
+	path = str( tmp_path_factory.mktemp( 'synthetic' ) )
+	paths = { 'maps_path':os.path.join( path, 'Maps' ),
+			'firehistory_path':os.path.join( path, 'FireHistory' ),
+			'subdomains_fn':os.path.join( path, 'subdomains.tif' ) }
+	synthetic.make_maps( paths[ 'maps_path' ], nreps=NREPS, years=YEARS, shape=SHAPE )
+	synthetic.make_firehistory( paths[ 'firehistory_path' ], years=( 1950, 1952 ), shape=SHAPE )
+	synthetic.make_subdomains_raster( paths[ 'subdomains_fn' ], shape=SHAPE, ndomains=NDOMAINS )
+	return paths
+
+@pytest.fixture( scope='session' )
+def run_db( synthetic_run, tmp_path_factory ):
+	''' records of a plain run_postprocessing over `synthetic_run` '''
+	import alfresco_postprocessing as ap
+	out_json_fn = str( tmp_path_factory.mktemp( 'run' ) / 'ALF.json' )
+	db = ap.run_postprocessing( synthetic_run[ 'maps_path' ], out_json_fn, 1, ap.veg_name_dict, synthetic_run[ 'subdomains_fn' ] )
+	records = db.all()
+	db.close()
+	return records
@@ -0,0 +1,34 @@
+import json
+import os
+import subprocess
+import sys
+
+BENCHMARK = os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), 'bin', 'alfresco_benchmark.py' )
+
+def _benchmark( tmp_path, *args ):
+	env = dict( os.environ, PYTHONPATH=os.pathsep.join( [ os.path.dirname( os.path.dirname( BENCHMARK ) ) ] + sys.path ) )
+	return subprocess.run( [ sys.executable, BENCHMARK, '-s', 'small', '-nc', '1', '-o', str( tmp_path / 'bench.json' ) ] + list( args ),
+						stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env )
+
+def test_benchmark_runs( tmp_path ):
+	proc = _benchmark( tmp_path, '--only', 'run_postprocessing', 'to_csvs', 'Plot', 'relative_vegetation_change' )
+	assert proc.returncode == 0, proc.stderr.decode()
+	with open( str( tmp_path / 'bench.json' ) ) as f:
+		results = json.load( f )[ 'results' ]
+	names = [ r[ 'name' ] for r in results if r[ 'status' ] == 'ok' ]
+	assert { 'import', 'worker_startup', 'run_postprocessing', 'to_csvs', 'Plot', 'relative_vegetation_change' } <= set( names )
+
+def test_benchmark_fails_on_error( tmp_path ):
+	# to_csvs alone has no database to read, as run_postprocessing did not write one
+	proc = _benchmark( tmp_path, '--only', 'to_csvs' )
+	assert proc.returncode != 0
+	assert b'failed: to_csvs' in proc.stderr
+
+def test_benchmark_shapefile_subdomains( tmp_path ):
+	import pytest
+	pytest.importorskip( 'geopandas' )
+	proc = _benchmark( tmp_path, '--only', 'read_subdomains_shapefile', 'run_postprocessing_shapefile' )
+	assert proc.returncode == 0, proc.stderr.decode()
+	with open( str( tmp_path / 'bench.json' ) ) as f:
+		names = [ r[ 'name' ] for r in json.load( f )[ 'results' ] if r[ 'status' ] == 'ok' ]
+	assert { 'read_subdomains_shapefile', 'run_postprocessing_shapefile' } <= set( names )
@@ -0,0 +1,30 @@
+import os
+import pandas as pd
+import alfresco_postprocessing as ap
+from tinydb import TinyDB
+from tinydb.storages import MemoryStorage
+from conftest import NREPS, YEARS
+
+def test_to_csvs( synthetic_run, run_db, tmp_path ):
+	db = TinyDB( storage=MemoryStorage )
+	db.insert_multiple( run_db )
+	metrics = [ 'avg_fire_size', 'number_of_fires', 'total_area_burned', 'veg_counts', 'severity_counts' ]
+	ap.to_csvs( db, metrics, str( tmp_path ), 'test' )
+	span = '%d_%d' % YEARS
+	df = pd.read_csv( str( tmp_path / 'number_of_fires' / ( 'alfresco_numberoffires_1_test_%s.csv' % span ) ), index_col=0 )
+	assert list( df.columns ) == [ 'rep_%d' % i for i in range( NREPS ) ]
+	assert list( df.index ) == list( range( YEARS[0], YEARS[1] + 1 ) )
+	rec = [ r for r in run_db if r[ 'replicate' ] == '1' and r[ 'fire_year' ] == str( YEARS[0] ) ][0]
+	assert df.loc[ YEARS[0], 'rep_1' ] == rec[ 'number_of_fires' ][ '1' ]
+	veg = pd.read_csv( str( tmp_path / 'veg_counts' / ( 'alfresco_vegcounts_1_BlackSpruce_test_%s.csv' % span ) ), index_col=0 )
+	assert veg.loc[ YEARS[0], 'rep_1' ] == rec[ 'veg_counts' ][ '1' ][ 'Black Spruce' ]
+	assert os.path.exists( str( tmp_path / 'severity_counts' / ( 'alfresco_severitycounts_2_test_%s.csv' % span ) ) )
+
+def test_to_csvs_historical( synthetic_run, tmp_path ):
+	db = ap.run_postprocessing_historical( synthetic_run[ 'firehistory_path' ], str( tmp_path / 'OBS.json' ), 1,
+										ap.veg_name_dict, synthetic_run[ 'subdomains_fn' ] )
+	ap.to_csvs( db, [ 'total_area_burned' ], str( tmp_path / 'csvs' ), 'obs', observed=True )
+	df = pd.read_csv( str( tmp_path / 'csvs' / 'total_area_burned' / 'firehistory_totalareaburned_1_obs_1950_1952.csv' ), index_col=0 )
+	assert list( df.index ) == [ 1950, 1951, 1952 ]
+	assert list( df.columns ) == [ 'observed' ]
+	db.close()
@@ -0,0 +1,39 @@
+import os
+import numpy as np
+import pytest
+import rasterio
+import alfresco_postprocessing as ap
+from conftest import SHAPE, NREPS, YEARS
+
+pytest.importorskip( 'dask' )
+pytest.importorskip( 'xarray' )
+
+def _read( synthetic_run, variable, rep, year, band=1 ):
+	fn = os.path.join( synthetic_run[ 'maps_path' ], str( year ), '%s_%d_%d.tif' % ( variable, rep, year ) )
+	with rasterio.open( fn ) as rst:
+		return rst.read( band )
+
+def test_open_cube_dims( synthetic_run ):
+	cube = ap.open_cube( synthetic_run[ 'maps_path' ], 'Veg' )
+	assert cube.dims == ( 'replicate', 'year', 'y', 'x' )
+	assert cube.shape == ( NREPS, YEARS[1] - YEARS[0] + 1 ) + SHAPE
+	assert list( cube.year.values ) == list( range( YEARS[0], YEARS[1] + 1 ) )
+
+def test_open_cube_values( synthetic_run ):
+	cube = ap.open_cube( synthetic_run[ 'maps_path' ], 'Veg', chunks={ 'y':16, 'x':32 } )
+	assert np.array_equal( cube.sel( replicate=1, year=YEARS[1] ).values, _read( synthetic_run, 'Veg', 1, YEARS[1] ) )
+	window = cube[ 0, 0, 10:20, 5:40 ].values
+	assert np.array_equal( window, _read( synthetic_run, 'Veg', 0, YEARS[0] )[ 10:20, 5:40 ] )
+	# FireScar reads the fire id band by default
+	fire = ap.open_cube( synthetic_run[ 'maps_path' ], 'FireScar' )
+	assert np.array_equal( fire[ 0, 0 ].values, _read( synthetic_run, 'FireScar', 0, YEARS[0], band=2 ) )
+
+def test_open_cube_reduction_and_selection( synthetic_run ):
+	cube = ap.open_cube( synthetic_run[ 'maps_path' ], 'Veg', replicates=[ 1 ], years=( YEARS[0], YEARS[0] + 1 ) )
+	assert cube.shape[ :2 ] == ( 1, 2 )
+	expected = np.mean( [ _read( synthetic_run, 'Veg', 1, year ) for year in ( YEARS[0], YEARS[0] + 1 ) ], axis=0 )
+	assert np.allclose( cube.mean( 'year' ).compute().values[0], expected )
+
+def test_open_cube_missing_variable( synthetic_run ):
+	with pytest.raises( ValueError ):
+		ap.open_cube( synthetic_run[ 'maps_path' ], 'NotAVariable' )
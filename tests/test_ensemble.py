@@ -0,0 +1,37 @@
+import numpy as np
+import alfresco_postprocessing as ap
+from conftest import NREPS, YEARS
+
+def _values( run_db, metric, year, domain, cls=None ):
+	values = [ r[ metric ][ domain ] for r in run_db if r[ 'fire_year' ] == str( year ) ]
+	if cls is not None:
+		values = [ v.get( cls, np.nan ) for v in values ]
+	return np.array( values, dtype=float )
+
+def test_ensemble_arrays( run_db ):
+	out = ap.ensemble_arrays( run_db, metrics=[ 'total_area_burned', 'veg_counts' ], quantiles=( 0.5, 0.975 ) )
+	stats, coords = out[ 'total_area_burned' ]
+	assert [ dim for dim, labels in coords ] == [ 'year', 'domain' ]
+	values = _values( run_db, 'total_area_burned', YEARS[0], '2' )
+	assert stats[ 'n' ][ 0, 1 ] == NREPS
+	assert np.isclose( stats[ 'mean' ][ 0, 1 ], values.mean() )
+	assert np.isclose( stats[ 'std' ][ 0, 1 ], values.std( ddof=1 ) )
+	assert stats[ 'min' ][ 0, 1 ] == values.min() and stats[ 'max' ][ 0, 1 ] == values.max()
+	assert np.isclose( stats[ 'q97.5' ][ 0, 1 ], np.quantile( values, 0.975 ) )
+	veg, coords = out[ 'veg_counts' ]
+	v = dict( coords )[ 'vegtype' ].index( 'Black Spruce' )
+	assert np.isclose( veg[ 'q50' ][ -1, 0, v ], np.median( _values( run_db, 'veg_counts', YEARS[1], '1', 'Black Spruce' ) ) )
+
+def test_run_postprocessing_ensemble( synthetic_run, run_db, tmp_path ):
+	fn = str( tmp_path / 'ensemble.csv' )
+	db = ap.run_postprocessing( synthetic_run[ 'maps_path' ], str( tmp_path / 'ALF.json' ), 1, ap.veg_name_dict,
+								synthetic_run[ 'subdomains_fn' ], ensemble_fn=fn )
+	db.close()
+	df = ap.read_ensemble_summary( fn )
+	assert list( df.columns[ :9 ] ) == [ 'metric', 'year', 'domain', 'class', 'n', 'mean', 'std', 'min', 'max' ]
+	assert [ c for c in df.columns if c.startswith( 'q' ) ] == [ 'q05', 'q25', 'q50', 'q75', 'q95' ]
+	assert set( df[ 'metric' ] ) == { 'avg_fire_size', 'number_of_fires', 'total_area_burned', 'veg_counts', 'severity_counts' }
+	row = df[ ( df[ 'metric' ] == 'number_of_fires' ) & ( df[ 'year' ] == YEARS[1] ) & ( df[ 'domain' ] == '1' ) ].iloc[0]
+	assert row[ 'class' ] == ''
+	assert np.isclose( row[ 'mean' ], _values( run_db, 'number_of_fires', YEARS[1], '1' ).mean() )
+	assert ( df[ 'n' ] > 0 ).all()
@@ -0,0 +1,53 @@
+import os
+import pytest
+import alfresco_postprocessing as ap
+from alfresco_postprocessing import executor as executor_module
+
+def _scale( item, factor=1, offset=0 ):
+	return item * factor + offset
+
+def _worker_states( item, **state ):
+	return os.getpid( ), sorted( executor_module._WORKER_STATE )
+
+def _key( rec ):
+	return ( rec[ 'replicate' ], rec[ 'fire_year' ] )
+
+def test_executor_map_with_state( ):
+	with ap.Executor( ncores=2 ) as executor:
+		assert executor.map( _scale, range( 10 ), state={ 'factor':3, 'offset':1 } ) == [ i * 3 + 1 for i in range( 10 ) ]
+		assert executor.map( _scale, range( 5 ), chunksize=2 ) == list( range( 5 ) )
+		pool = executor._pool
+		assert executor.map( _scale, range( 5 ), state={ 'factor':3, 'offset':1 } ) == [ i * 3 + 1 for i in range( 5 ) ]
+		# the workers and the pickled state are reused across calls
+		assert executor._pool is pool
+		assert len( executor._state_files ) == 1
+
+def test_executor_state_loaded_once_per_worker( ):
+	state = { 'factor':2 }
+	with ap.Executor( ncores=1 ) as executor:
+		key, _ = executor._register_state( state )
+		out = executor.map( _worker_states, range( 4 ), state=state, chunksize=1 )
+	assert len( { pid for pid, keys in out } ) == 1
+	assert all( keys == [ key ] for pid, keys in out )
+
+def test_executor_closed( ):
+	executor = ap.Executor( ncores=1 )
+	executor.map( _scale, [ 1 ] )
+	tmpdir = executor._tmpdir
+	executor.close( )
+	assert not os.path.exists( tmpdir )
+	with pytest.raises( ValueError ):
+		executor.map( _scale, [ 1 ] )
+
+def test_shared_executor_run_postprocessing( synthetic_run, run_db, tmp_path ):
+	with ap.Executor( ncores=2 ) as executor:
+		db = ap.run_postprocessing( synthetic_run[ 'maps_path' ], str( tmp_path / 'ALF.json' ), 2, ap.veg_name_dict,
+									synthetic_run[ 'subdomains_fn' ], executor=executor )
+		pool = executor._pool
+		obs = ap.run_postprocessing_historical( synthetic_run[ 'firehistory_path' ], str( tmp_path / 'OBS.json' ), 2,
+									ap.veg_name_dict, synthetic_run[ 'subdomains_fn' ], executor=executor )
+		assert executor._pool is pool
+	assert sorted( db.all( ), key=_key ) == sorted( run_db, key=_key )
+	assert len( obs ) == 3
+	db.close( )
+	obs.close( )
@@ -0,0 +1,71 @@
+import copy
+import numpy as np
+import pytest
+import alfresco_postprocessing as ap
+
+pytest.importorskip( 'xarray' )
+
+def _replicates( records, reps ):
+	return [ r for r in records if r[ 'replicate' ] in reps ]
+
+def test_metrics_to_dataset( run_db ):
+	ds = ap.metrics_to_dataset( run_db )
+	assert ds[ 'total_area_burned' ].dims == ( 'replicate', 'year', 'domain' )
+	assert ds[ 'veg_counts' ].dims == ( 'replicate', 'year', 'domain', 'vegtype' )
+	rec = run_db[0]
+	value = ds[ 'total_area_burned' ].sel( replicate=rec[ 'replicate' ], year=int( rec[ 'fire_year' ] ), domain='1' )
+	assert float( value ) == rec[ 'total_area_burned' ][ '1' ]
+
+@pytest.mark.parametrize( 'ext', [ '.nc', '.zarr' ] )
+def test_to_cube_store_round_trip_and_append( run_db, tmp_path, ext ):
+	if ext == '.zarr':
+		pytest.importorskip( 'zarr' )
+	else:
+		pytest.importorskip( 'netCDF4' )
+	fn = str( tmp_path / ( 'store' + ext ) )
+	ap.to_cube_store( _replicates( run_db, [ '0' ] ), fn )
+	ap.to_cube_store( _replicates( run_db, [ '1' ] ), fn, append=True )
+	ds = ap.open_cube_store( fn )
+	full = ap.metrics_to_dataset( run_db )
+	assert sorted( ds[ 'replicate' ].values.tolist() ) == [ '0', '1' ]
+	assert np.array_equal( ds[ 'number_of_fires' ].sel( replicate=[ '0', '1' ] ).values,
+						full[ 'number_of_fires' ].sel( replicate=[ '0', '1' ] ).values )
+	ds.close()
+	# the same replicates again
+	with pytest.raises( ValueError ):
+		ap.to_cube_store( _replicates( run_db, [ '1' ] ), fn, append=True )
+
+def test_to_cube_store_append_new_year_raises( run_db, tmp_path ):
+	pytest.importorskip( 'netCDF4' )
+	fn = str( tmp_path / 'store.nc' )
+	ap.to_cube_store( _replicates( run_db, [ '0' ] ), fn )
+	later = copy.deepcopy( _replicates( run_db, [ '1' ] ) )
+	for rec in later:
+		rec[ 'fire_year' ] = str( int( rec[ 'fire_year' ] ) + 100 )
+	with pytest.raises( ValueError, match='year' ):
+		ap.to_cube_store( later, fn, append=True )
+	# the store is left as it was
+	ds = ap.open_cube_store( fn )
+	assert ds[ 'replicate' ].values.tolist() == [ '0' ]
+	ds.close()
+
+@pytest.mark.parametrize( 'ext', [ '.nc', '.zarr' ] )
+def test_to_cube_store_append_longer_replicate_labels( run_db, tmp_path, ext ):
+	''' replicates 10-19 appended to a store of 0-9 keep their full labels '''
+	pytest.importorskip( 'zarr' if ext == '.zarr' else 'netCDF4' )
+	def relabeled( reps ):
+		out = []
+		for rep in reps:
+			for rec in copy.deepcopy( _replicates( run_db, [ '0' ] ) ):
+				rec[ 'replicate' ] = str( rep )
+				out.append( rec )
+		return out
+	fn = str( tmp_path / ( 'store' + ext ) )
+	ap.to_cube_store( relabeled( range( 10 ) ), fn )
+	ap.to_cube_store( relabeled( range( 10, 20 ) ), fn, append=True )
+	ds = ap.open_cube_store( fn )
+	assert sorted( ds[ 'replicate' ].values.tolist(), key=int ) == [ str( rep ) for rep in range( 20 ) ]
+	assert float( ds[ 'total_area_burned' ].sel( replicate='12' ).sum() ) == float( ds[ 'total_area_burned' ].sel( replicate='0' ).sum() )
+	ds.close()
+	with pytest.raises( ValueError ):
+		ap.to_cube_store( relabeled( [ 1 ] ), fn, append=True )
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+import alfresco_postprocessing as ap
+
+THRESHOLDS = [ 1, 5, 20, 50 ]
+BINS = [ 1, 10, 50, 200 ]
+
+def _sizes( run_db, replicate, year, domain ):
+	rec = [ r for r in run_db if r[ 'replicate' ] == replicate and r[ 'fire_year' ] == str( year ) ][0]
+	return np.array( rec[ 'all_fire_sizes' ][ domain ] )
+
+def test_ragged_fire_sizes( run_db ):
+	values, offsets, coords, processed = ap.ragged_fire_sizes( run_db )
+	( _, reps ), ( _, years ), ( _, domains ) = coords
+	assert processed.all()
+	assert len( offsets ) == len( reps ) * len( years ) * len( domains ) + 1
+	i = ( 1 * len( years ) + 0 ) * len( domains ) + 1
+	assert sorted( values[ offsets[ i ]:offsets[ i + 1 ] ] ) == sorted( _sizes( run_db, reps[1], years[0], domains[1] ) )
+
+def test_fire_size_count_thresholds( run_db ):
+	arrays = ap.fire_size_count_arrays( run_db, thresholds=THRESHOLDS )
+	below, coords = arrays[ 'count_below' ]
+	above, _ = arrays[ 'count_above' ]
+	( _, reps ), ( _, years ), ( _, domains ), ( _, thresholds ) = coords
+	assert thresholds == THRESHOLDS
+	for r, rep in enumerate( reps ):
+		for y, year in enumerate( years ):
+			for d, domain in enumerate( domains ):
+				sizes = _sizes( run_db, rep, year, domain )
+				for t, threshold in enumerate( THRESHOLDS ):
+					assert below[ r, y, d, t ] == ( sizes < threshold ).sum()
+					assert above[ r, y, d, t ] == ( sizes > threshold ).sum()
+
+def test_fire_size_count_bins( run_db ):
+	arr, coords = ap.fire_size_count_arrays( run_db, bins=BINS )[ 'count' ]
+	( _, reps ), ( _, years ), ( _, domains ), ( _, lower ) = coords
+	assert lower == BINS[ :-1 ]
+	for r, rep in enumerate( reps ):
+		for y, year in enumerate( years ):
+			for d, domain in enumerate( domains ):
+				hist, _ = np.histogram( _sizes( run_db, rep, year, domain ), bins=BINS )
+				assert arr[ r, y, d ].tolist() == hist.tolist()
+
+def test_fire_size_counts_from_fire_table( synthetic_run, run_db, tmp_path ):
+	''' the fire table of a run gives the same counts as its records '''
+	fn = str( tmp_path / 'fires.npz' )
+	db = ap.run_postprocessing( synthetic_run[ 'maps_path' ], str( tmp_path / 'ALF.json' ), 1, ap.veg_name_dict,
+								synthetic_run[ 'subdomains_fn' ], fire_table_fn=fn, store_fire_sizes=False )
+	with pytest.raises( ValueError ):
+		ap.fire_size_count_arrays( db, bins=BINS )
+	db.close( )
+	df = ap.fire_size_counts( fn, thresholds=THRESHOLDS )
+	expected = ap.fire_size_counts( run_db, thresholds=THRESHOLDS )
+	assert list( df.columns ) == [ 'replicate', 'year', 'domain', 'threshold', 'count_below', 'count_above' ]
+	assert df.values.tolist() == expected.values.tolist()
+	bins = ap.fire_size_counts( fn, bins=BINS )
+	assert ( bins[ 'bin_upper' ] > bins[ 'bin_lower' ] ).all()
+
+def test_fire_size_counts_arguments( run_db ):
+	with pytest.raises( ValueError ):
+		ap.fire_size_count_arrays( run_db )
+	with pytest.raises( ValueError ):
+		ap.fire_size_count_arrays( run_db, thresholds=THRESHOLDS, bins=BINS )
+	with pytest.raises( ValueError ):
+		ap.fire_size_count_arrays( run_db, bins=[ 10, 5 ] )
+
+def test_cumulative_area_curves( ):
+	# two groups: [ 5, 1, 3 ] and an empty one, then [ 2 ]
+	sizes, cumulative_area, cdf, offsets = ap.cumulative_area_curves( np.array( [ 5, 1, 3, 2 ] ), np.array( [ 0, 3, 3, 4 ] ) )
+	assert offsets.tolist() == [ 0, 3, 3, 4 ]
+	assert sizes.tolist() == [ 1, 3, 5, 2 ]
+	assert cumulative_area.tolist() == [ 1, 4, 9, 2 ]
+	assert np.allclose( cdf, [ 1 / 3., 2 / 3., 1, 1 ] )
+	values = np.arange( 100, 0, -1 )
+	sizes, cumulative_area, cdf, offsets = ap.cumulative_area_curves( values, np.array( [ 0, 100 ] ), npoints=5 )
+	assert len( sizes ) == 5 and offsets.tolist() == [ 0, 5 ]
+	# the downsampled curve keeps the first and last points
+	assert sizes[ 0 ] == 1 and sizes[ -1 ] == 100
+	assert cumulative_area[ -1 ] == values.sum() and cdf[ -1 ] == 1
+
+def test_fire_size_curves( run_db ):
+	replicates, sizes, cumulative_area, cdf, offsets = ap.fire_size_curves( run_db, '1' )
+	assert replicates == [ '0', '1' ]
+	for i, rep in enumerate( replicates ):
+		pooled = np.sort( np.concatenate( [ rec[ 'all_fire_sizes' ][ '1' ] for rec in run_db if rec[ 'replicate' ] == rep ] ) )
+		assert sizes[ offsets[ i ]:offsets[ i + 1 ] ].tolist() == pooled.tolist()
+		assert cumulative_area[ offsets[ i ]:offsets[ i + 1 ] ].tolist() == np.cumsum( pooled ).tolist()
+	with pytest.raises( ValueError ):
+		ap.fire_size_curves( run_db, 'not a domain' )
+
+def test_cab_vs_fs_lineplot_factory( synthetic_run, run_db, tmp_path ):
+	from alfresco_postprocessing.plot import cab_vs_fs_lineplot_factory
+	obs = ap.run_postprocessing_historical( synthetic_run[ 'firehistory_path' ], str( tmp_path / 'OBS.json' ), 1,
+											ap.veg_name_dict, synthetic_run[ 'subdomains_fn' ] )
+	cab_vs_fs_lineplot_factory( run_db, obs.all( ), str( tmp_path ), 'synthetic', 'test', year_range=( 1901, 1903 ), npoints=10 )
+	obs.close( )
+	assert sorted( p.name for p in tmp_path.glob( '*.png' ) ) == [ 'alfresco_cab_vs_fs_synthetic_test_%d_1901_1903.png' % d for d in ( 1, 2 ) ]
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from types import SimpleNamespace
+import alfresco_postprocessing as ap
+from alfresco_postprocessing.firetable import fire_table_columns, fire_metrics
+from conftest import NREPS, YEARS
+
+METRICS = [ 'avg_fire_size', 'number_of_fires', 'total_area_burned' ]
+
+def _key( rec ):
+	return ( rec[ 'replicate' ], rec[ 'fire_year' ] )
+
+def _dataset( ):
+	''' two sub-domains ( left / right halves ) and three fires, one crossing the boundary '''
+	fire = np.zeros( ( 4, 6 ), dtype=np.int32 )
+	fire[ 0, 0:2 ] = 1 # domain A only
+	fire[ 1, 1:5 ] = 2 # crosses into domain B
+	fire[ 3, 4:6 ] = 3 # domain B only
+	left = np.zeros( fire.shape, dtype=np.int32 )
+	left[ :, :3 ] = 1
+	right = np.zeros( fire.shape, dtype=np.int32 )
+	right[ :, 3: ] = 2
+	sub_domains = SimpleNamespace( sub_domains=[ left, right ], names_dict={ 1:'A', 2:'B' } )
+	return SimpleNamespace( raster_arr=fire, sub_domains=sub_domains )
+
+def test_fire_table_columns( ):
+	alf_ds = _dataset( )
+	veg = np.full( alf_ds.raster_arr.shape, 2, dtype=np.uint8 )
+	veg[ 1, 1 ] = 255
+	veg[ 1, 2 ] = 255 # fire 2 in A only burned nodata
+	severity = np.where( alf_ds.raster_arr > 0, 3, 0 ).astype( np.uint8 )
+	severity[ 3, 5 ] = 1
+	fires = fire_table_columns( alf_ds, veg_arr=veg, severity_arr=severity )
+	assert fires[ 'domains' ] == [ 'A', 'B' ]
+	rows = sorted( zip( fires[ 'domain' ].tolist(), fires[ 'fire_id' ].tolist(), fires[ 'pixels' ].tolist(), fires[ 'veg' ].tolist() ) )
+	assert rows == [ ( 0, 1, 2, 2 ), ( 0, 2, 2, 255 ), ( 1, 2, 2, 2 ), ( 1, 3, 2, 2 ) ]
+	assert fires[ 'severity' ][ ( fires[ 'domain' ] == 1 ) & ( fires[ 'fire_id' ] == 3 ) ][0] == 2.0
+
+def test_fire_metrics( ):
+	out = fire_metrics( fire_table_columns( _dataset( ) ) )
+	assert out[ 'number_of_fires' ] == { 'A':2, 'B':2 }
+	assert out[ 'total_area_burned' ] == { 'A':4, 'B':4 }
+	assert out[ 'avg_fire_size' ] == { 'A':2.0, 'B':2.0 }
+	assert sorted( out[ 'all_fire_sizes' ][ 'B' ] ) == [ 2, 2 ]
+
+def test_fire_table_run( synthetic_run, run_db, tmp_path ):
+	fn = str( tmp_path / 'fires.npz' )
+	db = ap.run_postprocessing( synthetic_run[ 'maps_path' ], str( tmp_path / 'ALF.json' ), 1, ap.veg_name_dict,
+								synthetic_run[ 'subdomains_fn' ], fire_table_fn=fn, store_fire_sizes=False )
+	assert all( 'all_fire_sizes' not in rec for rec in db.all( ) )
+	db.close( )
+	table = ap.read_fire_table( fn )
+	assert table.replicates == [ str( i ) for i in range( NREPS ) ]
+	assert { 'veg', 'severity' } <= set( table.columns )
+	# the table reproduces the fire metrics of the database
+	records = sorted( table.to_records( ), key=_key )
+	expected = sorted( run_db, key=_key )
+	assert [ _key( r ) for r in records ] == [ _key( r ) for r in expected ]
+	for rec, exp in zip( records, expected ):
+		for metric in METRICS + [ 'all_fire_sizes' ]:
+			assert rec[ metric ] == exp[ metric ], metric
+	arr, coords = table.metric_array( 'number_of_fires' )
+	assert arr.shape == ( NREPS, YEARS[1] - YEARS[0] + 1, len( table.domains ) )
+	assert dict( coords )[ 'year' ] == list( range( YEARS[0], YEARS[1] + 1 ) )
+	assert int( arr.sum() ) == len( table )
+	with pytest.raises( ValueError ):
+		table.metric_array( 'veg_counts' )
+
+def test_fire_table_save_load( tmp_path ):
+	fires = fire_table_columns( _dataset( ) )
+	table = ap.FireTable.from_timesteps( [ dict( fires, replicate='0', year=1901 ),
+										dict( fire_table_columns( _dataset( ) ), replicate='1', year=1901 ) ] )
+	fn = table.save( str( tmp_path / 'fires.npz' ) )
+	loaded = ap.read_fire_table( fn )
+	assert loaded.replicates == [ '0', '1' ] and loaded.domains == [ 'A', 'B' ]
+	for name in table.columns:
+		assert np.array_equal( loaded[ name ], table[ name ] )
+	df = loaded.to_dataframe( )
+	assert len( df ) == 8
+	assert set( df[ 'domain' ] ) == { 'A', 'B' }
@@ -0,0 +1,63 @@
+import io
+import json
+import pytest
+import alfresco_postprocessing as ap
+from alfresco_postprocessing.jsonstream import _JSONStream
+
+def _write( tmp_path, doc, name='db.json' ):
+	fn = str( tmp_path / name )
+	with open( fn, 'w' ) as f:
+		json.dump( doc, f )
+	return fn
+
+def test_json_stream_small_chunks( ):
+	# values longer than the chunk size are read in growing pieces
+	text = ' { "a" : [ 1, 2, 3, 4, 5 ] , "b":"%s" }' % ( 'x' * 50 )
+	stream = _JSONStream( io.StringIO( text ), chunk_size=3 )
+	stream.expect( '{' )
+	assert stream.decode() == 'a'
+	stream.expect( ':' )
+	assert stream.decode() == [ 1, 2, 3, 4, 5 ]
+	stream.expect( ',' )
+	assert stream.decode() == 'b'
+	stream.expect( ':' )
+	assert stream.decode() == 'x' * 50
+	stream.expect( '}' )
+	assert stream.peek() == ''
+	with pytest.raises( ValueError ):
+		_JSONStream( io.StringIO( '[ 1 ]' ), chunk_size=3 ).expect( '{' )
+
+def test_iter_records_matches_tinydb( run_db, tmp_path ):
+	fn = str( tmp_path / 'ALF.json' )
+	db = ap._open_tinydb( fn )
+	db.insert_multiple( run_db )
+	expected = db.all()
+	db.close()
+	assert list( ap.iter_records( fn, chunk_size=64 ) ) == expected
+	records = ap.read_records( fn, metrics=[ 'number_of_fires' ] )
+	assert set( records[0] ) == { 'replicate', 'fire_year', 'av_year', 'number_of_fires' }
+	assert [ r[ 'number_of_fires' ] for r in records ] == [ r[ 'number_of_fires' ] for r in expected ]
+
+def test_iter_records_tables_and_empty( tmp_path ):
+	fn = _write( tmp_path, { 'other':{ '1':{ 'replicate':'x' } }, '_default':{ '1':{ 'replicate':'0', 'fire_year':'1901' } } } )
+	assert ap.read_records( fn ) == [ { 'replicate':'0', 'fire_year':'1901' } ]
+	assert ap.read_records( fn, table='other' ) == [ { 'replicate':'x' } ]
+	assert ap.read_records( fn, table='missing' ) == [ ]
+	empty = str( tmp_path / 'empty.json' )
+	open( empty, 'w' ).close()
+	assert ap.read_records( empty ) == [ ]
+
+def test_tinydb_to_store( run_db, tmp_path ):
+	pytest.importorskip( 'netCDF4' )
+	fn = str( tmp_path / 'ALF.json' )
+	db = ap._open_tinydb( fn )
+	db.insert_multiple( run_db )
+	db.close()
+	out = ap.tinydb_to_store( fn, store_fn=str( tmp_path / 'ALF.nc' ), fire_table_fn=str( tmp_path / 'ALF.npz' ) )
+	ds = ap.open_cube_store( out[ 'store' ] )
+	assert int( ds[ 'number_of_fires' ].sum() ) == sum( sum( r[ 'number_of_fires' ].values() ) for r in run_db )
+	ds.close()
+	table = ap.read_fire_table( out[ 'fire_table' ] )
+	assert len( table ) == sum( sum( r[ 'number_of_fires' ].values() ) for r in run_db )
+	with pytest.raises( ValueError ):
+		ap.tinydb_to_store( fn )
@@ -0,0 +1,51 @@
+import logging
+import os
+import pytest
+import alfresco_postprocessing as ap
+from conftest import NREPS, YEARS, NDOMAINS
+
+NTIMESTEPS = NREPS * ( YEARS[1] - YEARS[0] + 1 )
+
+def test_plan_limited_by_cpus( synthetic_run ):
+	plan = ap.plan_run( synthetic_run[ 'maps_path' ], ndomains=2, mem_mb=64000, ncpus=4 )
+	assert ( plan.ntimesteps, plan.shape, plan.ndomains ) == ( NTIMESTEPS, ( 64, 64 ), 2 )
+	assert ( plan.ncores, plan.limited_by ) == ( 4, 'cpus' )
+	# no cpus left over to prefetch on
+	assert ( plan.prefetch, plan.chunksize ) == ( 0, 1 )
+	assert plan.total_mb == plan.parent_mb + 4 * plan.worker_mb
+	assert plan.env() == { name:'1' for name in ap.THREAD_ENV_VARS }
+	assert plan.to_dict()[ 'total_mb' ] == plan.total_mb
+	assert 'limited by cpus' in plan.report()
+
+def test_plan_limited_by_timesteps( synthetic_run ):
+	fn = os.path.join( synthetic_run[ 'maps_path' ], str( YEARS[0] ), 'FireScar_0_%d.tif' % YEARS[0] )
+	plan = ap.plan_run( raster_fn=fn, ntimesteps=3, mem_mb=64000, ncpus=16 )
+	assert ( plan.ncores, plan.limited_by, plan.prefetch ) == ( 3, 'timesteps', 0 )
+
+def test_plan_limited_by_memory( synthetic_run ):
+	# ~100MB per worker and in the parent, so 350MB fits two workers
+	plan = ap.plan_run( synthetic_run[ 'maps_path' ], mem_mb=350, ncpus=8, memory_fraction=1, overhead_mb=100 )
+	assert ( plan.ncores, plan.limited_by ) == ( 2, 'memory' )
+	# the spare cpus read ahead, as far as the memory allows
+	assert ( plan.prefetch, plan.prefetch_threads ) == ( 2, 2 )
+	assert plan.total_mb <= 350
+	assert ap.plan_run( synthetic_run[ 'maps_path' ], mem_mb=350, ncpus=8, memory_fraction=1, overhead_mb=100, prefetch=0 ).prefetch == 0
+
+def test_plan_over_budget( synthetic_run ):
+	with pytest.warns( RuntimeWarning, match='may not fit' ):
+		plan = ap.plan_run( synthetic_run[ 'maps_path' ], mem_mb=100, ncpus=8, overhead_mb=100 )
+	assert plan.ncores == 1
+	with pytest.raises( ValueError ):
+		ap.plan_run( ntimesteps=10 )
+
+def test_auto_run_logs_its_plan( synthetic_run, run_db, tmp_path, capsys, caplog ):
+	''' the plan the run used, with its sub-domains, is logged rather than printed '''
+	with caplog.at_level( logging.INFO, logger='alfresco_postprocessing' ):
+		db = ap.run_postprocessing( synthetic_run[ 'maps_path' ], str( tmp_path / 'ALF.json' ), 'auto', ap.veg_name_dict,
+									synthetic_run[ 'subdomains_fn' ], fire_table_fn=str( tmp_path / 'fires.npz' ) )
+	assert len( db ) == len( run_db )
+	db.close()
+	assert capsys.readouterr().out == ''
+	reports = [ r.getMessage() for r in caplog.records if r.getMessage().startswith( 'ALFRESCO post processing plan' ) ]
+	assert len( reports ) == 1
+	assert '%d timesteps of 64 x 64 pixels, %d sub-domains' % ( NTIMESTEPS, NDOMAINS ) in reports[0]
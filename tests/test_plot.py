@@ -0,0 +1,67 @@
+import pytest
+import alfresco_postprocessing as ap
+from alfresco_postprocessing.plot import _frames_nbytes
+from conftest import NREPS, YEARS
+
+@pytest.fixture( scope='module' )
+def json_fn( synthetic_run, tmp_path_factory ):
+	fn = str( tmp_path_factory.mktemp( 'plot' ) / 'ALF.json' )
+	ap.run_postprocessing( synthetic_run[ 'maps_path' ], fn, 1, ap.veg_name_dict, synthetic_run[ 'subdomains_fn' ] ).close()
+	return fn
+
+def _record( run_db, replicate, year ):
+	return [ r for r in run_db if r[ 'replicate' ] == replicate and r[ 'fire_year' ] == str( year ) ][0]
+
+def test_metric_dataframes( json_fn, run_db ):
+	modplot = ap.Plot( json_fn, model='synthetic', scenario='test' )
+	assert list( modplot.fire_years ) == [ str( y ) for y in range( YEARS[0], YEARS[1] + 1 ) ]
+	assert len( modplot.replicates ) == NREPS
+	tab = modplot.get_metric_dataframes( 'total_area_burned' )
+	rec = _record( run_db, '1', YEARS[1] )
+	assert tab[ '2' ].loc[ str( YEARS[1] ), '1' ] == rec[ 'total_area_burned' ][ '2' ]
+	veg = modplot.get_metric_dataframes( 'veg_counts' )
+	assert veg[ '1' ][ 'Black Spruce' ].loc[ str( YEARS[1] ), '1' ] == rec[ 'veg_counts' ][ '1' ][ 'Black Spruce' ]
+	sizes = modplot.get_metric_dataframes( 'all_fire_sizes' )
+	assert sorted( sizes[ '1' ].loc[ str( YEARS[1] ), '1' ] ) == sorted( rec[ 'all_fire_sizes' ][ '1' ] )
+	with pytest.raises( ValueError ):
+		modplot.get_metric_dataframes( 'not_a_metric' )
+
+def test_metric_dataframes_cached( json_fn ):
+	modplot = ap.Plot( json_fn, model='synthetic', scenario='test' )
+	tab = modplot.get_metric_dataframes( 'total_area_burned' )
+	# every dense metric is built on the first request
+	assert { 'avg_fire_size', 'number_of_fires', 'total_area_burned', 'veg_counts', 'severity_counts' } <= set( modplot._cache )
+	assert modplot.get_metric_dataframes( 'total_area_burned' ) is tab
+	modplot.invalidate( 'total_area_burned' )
+	assert 'total_area_burned' not in modplot._cache and 'number_of_fires' in modplot._cache
+	assert modplot.get_metric_dataframes( 'total_area_burned' ) is not tab
+	modplot.invalidate( reload=True )
+	assert len( modplot._cache ) == 0
+
+def test_metric_dataframes_cache_bytes( json_fn ):
+	nbytes = _frames_nbytes( ap.Plot( json_fn, model='synthetic', scenario='test' ).get_metric_dataframes( 'number_of_fires' ) )
+	modplot = ap.Plot( json_fn, model='synthetic', scenario='test', cache_bytes=nbytes )
+	modplot.get_metric_dataframes( 'total_area_burned' )
+	modplot.get_metric_dataframes( 'number_of_fires' )
+	# only the most recently used metric fits
+	assert list( modplot._cache ) == [ 'number_of_fires' ]
+	assert sum( modplot._cache_sizes.values() ) <= nbytes
+
+def test_plot_keeps_dense_metrics( json_fn, run_db ):
+	modplot = ap.Plot( json_fn, model='synthetic', scenario='test' )
+	assert 'all_fire_sizes' not in modplot.records[0]
+	# fire sizes are streamed from the file instead
+	sizes = modplot.get_metric_dataframes( 'all_fire_sizes' )
+	rec = _record( run_db, '0', YEARS[0] )
+	assert sorted( sizes[ '1' ].loc[ str( YEARS[0] ), '0' ] ) == sorted( rec[ 'all_fire_sizes' ][ '1' ] )
+	replicates, curve_sizes, cumulative_area, cdf, offsets = ap.fire_size_curves( modplot, '1' )
+	assert offsets[ -1 ] == sum( len( r[ 'all_fire_sizes' ][ '1' ] ) for r in run_db )
+	kept = ap.Plot( json_fn, model='synthetic', scenario='test', metrics=[ 'total_area_burned' ] )
+	assert set( kept.records[0] ) == { 'replicate', 'fire_year', 'av_year', 'total_area_burned' }
+
+def test_plot_empty_database( tmp_path ):
+	fn = str( tmp_path / 'empty.json' )
+	with open( fn, 'w' ) as f:
+		f.write( '{"_default": {}}' )
+	with pytest.raises( ValueError, match='no records' ):
+		ap.Plot( fn, model='synthetic', scenario='test' )
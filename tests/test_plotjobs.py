@@ -0,0 +1,52 @@
+import os
+import pytest
+import alfresco_postprocessing as ap
+from alfresco_postprocessing.plotjobs import PLOT_TYPES
+
+pytest.importorskip( 'seaborn' )
+
+YEAR_RANGE = ( 1901, 1903 )
+LINE_PLOTS = [ 'aab_lineplot', 'cab_lineplot', 'cab_vs_fs_lineplot' ]
+
+@pytest.fixture( scope='module' )
+def mod_obs_plots( synthetic_run, tmp_path_factory ):
+	path = tmp_path_factory.mktemp( 'plotjobs' )
+	ap.run_postprocessing( synthetic_run[ 'maps_path' ], str( path / 'ALF.json' ), 1, ap.veg_name_dict,
+							synthetic_run[ 'subdomains_fn' ] ).close()
+	ap.run_postprocessing_historical( synthetic_run[ 'firehistory_path' ], str( path / 'OBS.json' ), 1, ap.veg_name_dict,
+							synthetic_run[ 'subdomains_fn' ] ).close()
+	modplot = ap.Plot( str( path / 'ALF.json' ), model='synthetic', scenario='test' )
+	obsplot = ap.Plot( str( path / 'OBS.json' ), model='historical', scenario='observed' )
+	return modplot, obsplot
+
+def _jobs( mod_obs_plots, output_path, **kwargs ):
+	modplot, obsplot = mod_obs_plots
+	return ap.plot_jobs( modplot, obsplot, output_path, year_range=YEAR_RANGE, bar_year_range=YEAR_RANGE, npoints=10, **kwargs )
+
+def test_plot_jobs( mod_obs_plots, tmp_path ):
+	jobs = _jobs( mod_obs_plots, str( tmp_path ) )
+	assert { job.plot_type for job in jobs } == set( PLOT_TYPES )
+	assert len( set( job.key for job in jobs ) ) == len( jobs )
+	# the same data hashes the same
+	assert [ job.hash for job in jobs ] == [ job.hash for job in _jobs( mod_obs_plots, str( tmp_path ) ) ]
+	only = _jobs( mod_obs_plots, str( tmp_path ), plots=[ 'aab_lineplot' ], domains=[ '1' ] )
+	assert [ job.key for job in only ] == [ 'aab_lineplot|synthetic|test|1|%s' % ( YEAR_RANGE, ) ]
+	with pytest.raises( ValueError ):
+		_jobs( mod_obs_plots, str( tmp_path ), plots=[ 'not_a_plot' ] )
+
+def test_render_plots_skips_unchanged( mod_obs_plots, tmp_path ):
+	output_path = str( tmp_path )
+	jobs = _jobs( mod_obs_plots, output_path, plots=LINE_PLOTS )
+	first = ap.render_plots( jobs, output_path, ncores=2 )
+	assert len( first[ 'rendered' ] ) == len( jobs ) and first[ 'skipped' ] == []
+	assert all( os.path.exists( fn ) for fn in first[ 'rendered' ] )
+	second = ap.render_plots( _jobs( mod_obs_plots, output_path, plots=LINE_PLOTS ), output_path, ncores=2 )
+	assert second[ 'rendered' ] == [] and sorted( second[ 'skipped' ] ) == sorted( first[ 'rendered' ] )
+	# a missing output or changed data is rendered again
+	os.remove( first[ 'rendered' ][0] )
+	changed = _jobs( mod_obs_plots, output_path, plots=LINE_PLOTS )
+	changed[ -1 ].hash = 'changed'
+	third = ap.render_plots( changed, output_path, ncores=1 )
+	assert sorted( third[ 'rendered' ] ) == sorted( [ first[ 'rendered' ][0], first[ 'rendered' ][ -1 ] ] )
+	forced = ap.render_plots( changed, output_path, ncores=1, force=True )
+	assert len( forced[ 'rendered' ] ) == len( jobs )
@@ -0,0 +1,69 @@
+import time
+import threading
+import pytest
+import alfresco_postprocessing as ap
+from alfresco_postprocessing.prefetch import merge_prefetch_stats
+
+def _key( rec ):
+	return ( rec[ 'replicate' ], rec[ 'fire_year' ] )
+
+@pytest.mark.parametrize( 'depth', [ 0, 1, 3 ] )
+def test_prefetcher_order_and_stats( depth ):
+	prefetcher = ap.Prefetcher( range( 10 ), lambda i: i * i, depth=depth, nthreads=2 )
+	assert list( prefetcher ) == [ ( i, i * i ) for i in range( 10 ) ]
+	stats = prefetcher.stats( )
+	assert stats[ 'nitems' ] == 10
+	assert stats[ 'depth' ] == depth
+	assert 0.0 <= stats[ 'overlap' ] <= 1.0
+
+def test_prefetcher_reads_ahead( ):
+	# with depth 2 the next two items are read while the current one is computed
+	read = []
+	lock = threading.Lock( )
+	def read_func( i ):
+		with lock:
+			read.append( i )
+		return i
+	prefetcher = ap.Prefetcher( range( 6 ), read_func, depth=2, nthreads=2 )
+	for i, _ in prefetcher:
+		time.sleep( 0.05 )
+		with lock:
+			assert sorted( read ) == list( range( min( i + 3, 6 ) ) )
+	assert sorted( read ) == list( range( 6 ) )
+
+def test_prefetcher_stops_early( ):
+	read = []
+	prefetcher = ap.Prefetcher( range( 100 ), read.append, depth=2, nthreads=1 )
+	for i, _ in prefetcher:
+		break
+	# the reads queued ahead are cancelled rather than run through the whole list
+	assert len( read ) <= 3
+
+def test_prefetcher_depth_zero_reads_on_demand( ):
+	read = []
+	for i, _ in ap.Prefetcher( range( 4 ), read.append, depth=0 ):
+		time.sleep( 0.02 )
+		assert read == list( range( i + 1 ) )
+
+def test_prefetcher_propagates_read_errors( ):
+	def read_func( i ):
+		if i == 2:
+			raise IOError( 'bad raster' )
+		return i
+	with pytest.raises( IOError ):
+		list( ap.Prefetcher( range( 5 ), read_func, depth=2 ) )
+
+def test_merge_prefetch_stats( ):
+	a = ap.Prefetcher( range( 3 ), lambda i: i, depth=1 )
+	b = ap.Prefetcher( range( 4 ), lambda i: i, depth=1 )
+	list( a ), list( b )
+	merged = merge_prefetch_stats( [ a.stats( ), None, b.stats( ) ] )
+	assert merged[ 'nitems' ] == 7
+	assert merged[ 'nchunks' ] == 2
+	assert merge_prefetch_stats( [ None ] ) is None
+
+def test_run_postprocessing_prefetch( synthetic_run, run_db, tmp_path ):
+	db = ap.run_postprocessing( synthetic_run[ 'maps_path' ], str( tmp_path / 'ALF.json' ), 2, ap.veg_name_dict,
+								synthetic_run[ 'subdomains_fn' ], prefetch=2 )
+	assert sorted( db.all( ), key=_key ) == sorted( run_db, key=_key )
+	db.close( )
@@ -0,0 +1,44 @@
+import json
+import alfresco_postprocessing as ap
+from alfresco_postprocessing.profiling import _current_rss
+
+def test_stage_records_rss_delta( ):
+	prof = ap.TimestepProfile( replicate='0', year='1901' )
+	with prof.stage( 'allocate' ):
+		hold = bytearray( 64 * 2**20 )
+		hold[ ::4096 ] = b'x' * len( hold[ ::4096 ] ) # touch the pages so they are resident
+	with prof.stage( 'free' ):
+		del hold
+	out = prof.to_dict()
+	allocate, free = out[ 'stages' ]
+	if _current_rss() > 0: # /proc is available
+		assert allocate[ 'rss_delta' ] > 32 * 2**20
+		assert free[ 'rss_delta' ] < 0
+		assert out[ 'worker_max_rss' ] >= out[ 'rss_end' ] > 0
+
+def test_summarize_profiles( ):
+	profiles = [ { 'replicate':'0', 'year':str( year ), 'pid':1, 'rss_start':0, 'rss_end':0, 'worker_max_rss':100 + year,
+				'result_bytes':10, 'stages':[ { 'name':'read', 'start':0.0, 'end':1.0, 'bytes_read':5, 'rss_delta':year, 'tid':1 } ] }
+				for year in range( 3 ) ]
+	summary = ap.summarize_profiles( profiles + [ None ] )
+	assert summary[ 'ntimesteps' ] == 3
+	assert summary[ 'stages' ][ 'read' ][ 'bytes_read' ] == 15
+	assert summary[ 'stages' ][ 'read' ][ 'rss_delta_max' ] == 2
+	assert summary[ 'workers' ][ '1' ] == { 'ntimesteps':3, 'max_rss':102 }
+	assert summary[ 'worker_max_rss' ] == 102
+	assert len( ap.to_chrome_trace( profiles )[ 'traceEvents' ] ) == 3
+
+def test_run_postprocessing_profile( synthetic_run, tmp_path ):
+	out_json_fn = str( tmp_path / 'ALF.json' )
+	db = ap.run_postprocessing( synthetic_run[ 'maps_path' ], out_json_fn, 1, ap.veg_name_dict, synthetic_run[ 'subdomains_fn' ],
+							profile=True, trace=True )
+	assert all( '_profile' not in rec for rec in db.all() )
+	db.close()
+	profile_fn, trace_fn = ap.profile_filenames( out_json_fn )
+	with open( profile_fn ) as f:
+		summary = json.load( f )
+	assert summary[ 'ntimesteps' ] == 6
+	assert { 'read_firescar', 'fire', 'veg', 'burnseverity' } <= set( summary[ 'stages' ] )
+	assert all( 'rss_delta_mean' in stage for stage in summary[ 'stages' ].values() )
+	with open( trace_fn ) as f:
+		assert len( json.load( f )[ 'traceEvents' ] ) > 0
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import alfresco_postprocessing as ap
+from scipy import stats
+
+YEARS = list( range( 1950, 1962 ) )
+DOMAINS = [ 'A', 'B' ]
+
+def _records( values, replicate ):
+	''' values[ year, domain ] -> TinyDB style records '''
+	return [ { 'replicate':replicate, 'fire_year':str( year ),
+			'total_area_burned':{ d:float( values[ i, j ] ) for j, d in enumerate( DOMAINS ) } }
+			for i, year in enumerate( YEARS ) ]
+
+@pytest.fixture
+def mod_obs( ):
+	rng = np.random.RandomState( 0 )
+	obs = rng.rand( len( YEARS ), len( DOMAINS ) ) * 100
+	reps = { '0':obs + rng.rand( *obs.shape ) * 5, # close to observed
+			'1':rng.rand( *obs.shape ) * 100,
+			'2':obs[ ::-1 ] }
+	mod = [ rec for rep, values in reps.items() for rec in _records( values, rep ) ]
+	return mod, _records( obs, 'observed' ), reps, obs
+
+def test_rank_replicates_matches_scipy( mod_obs ):
+	mod, obs, reps, obs_values = mod_obs
+	table = ap.rank_replicates( mod, obs )
+	assert len( table ) == len( reps ) * len( DOMAINS )
+	for rep, values in reps.items():
+		for j, domain in enumerate( DOMAINS ):
+			row = table[ ( table[ 'replicate' ] == rep ) & ( table[ 'domain' ] == domain ) ].iloc[0]
+			x, y = values[ :, j ], obs_values[ :, j ]
+			assert row[ 'n' ] == len( YEARS )
+			assert np.isclose( row[ 'pearson' ], stats.pearsonr( x, y )[0] )
+			assert np.isclose( row[ 'spearman' ], stats.spearmanr( x, y )[0] )
+			assert np.isclose( row[ 'kendall' ], stats.kendalltau( x, y )[0] )
+			assert np.isclose( row[ 'rmse' ], np.sqrt( np.mean( ( x - y ) ** 2 ) ) )
+
+def test_rank_replicates_ranks_and_best_rep( mod_obs ):
+	mod, obs, reps, obs_values = mod_obs
+	table = ap.rank_replicates( mod, obs, rank_by='rmse' )
+	for domain in DOMAINS:
+		assert table[ ( table[ 'domain' ] == domain ) & ( table[ 'rank' ] == 1 ) ][ 'replicate' ].tolist() == [ '0' ]
+	assert list( ap.best_rep( mod, obs, 'A', method='pearson' ) ) == [ '0' ]
+
+def test_rank_replicates_missing_years( mod_obs ):
+	mod, obs, reps, obs_values = mod_obs
+	# drop a modeled year of replicate 1 in domain A: it is left out pairwise
+	for rec in mod:
+		if rec[ 'replicate' ] == '1' and rec[ 'fire_year' ] == str( YEARS[0] ):
+			del rec[ 'total_area_burned' ][ 'A' ]
+	table = ap.rank_replicates( mod, obs, year_range=( YEARS[0], YEARS[-1] ) )
+	row = table[ ( table[ 'replicate' ] == '1' ) & ( table[ 'domain' ] == 'A' ) ].iloc[0]
+	assert row[ 'n' ] == len( YEARS ) - 1
+	assert np.isclose( row[ 'pearson' ], stats.pearsonr( reps[ '1' ][ 1:, 0 ], obs_values[ 1:, 0 ] )[0] )
@@ -0,0 +1,47 @@
+import os
+import numpy as np
+import pytest
+import rasterio
+import alfresco_postprocessing as ap
+from alfresco_postprocessing.reclass import TREELINE_NONFOREST, TREELINE_FOREST, TREELINE_EXPANSION, TREELINE_NODATA
+from conftest import NREPS, YEARS
+
+def _read( fn ):
+	with rasterio.open( fn ) as rst:
+		return rst.read( 1 )
+
+def test_reclassify( ):
+	lut = ap.reclass_lut( { 1:[ 1, 2, 3 ], 2:[ 4, 5, 6 ] }, default=9 )
+	arr = np.array( [ [ 0, 1, 2, 3 ], [ 4, 5, 6, 255 ] ], dtype=np.uint8 )
+	assert ap.reclassify( arr, lut ).tolist() == [ [ 9, 1, 1, 1 ], [ 2, 2, 2, 9 ] ]
+	# wider inputs are checked against the table
+	assert ap.reclassify( arr.astype( np.int32 ), lut ).tolist() == [ [ 9, 1, 1, 1 ], [ 2, 2, 2, 9 ] ]
+	with pytest.raises( ValueError ):
+		ap.reclassify( np.array( [ -1, 300 ] ), lut )
+
+def test_treeline_change_codes( ):
+	# every ( t1, t2 ) pair of nonforest ( 5 ), forest ( 1 ) and nodata ( 255 )
+	t1 = np.array( [ 5, 5, 5, 1, 1, 1, 255, 255, 255 ], dtype=np.uint8 )
+	t2 = np.array( [ 5, 1, 255, 5, 1, 255, 5, 1, 255 ], dtype=np.uint8 )
+	assert ap.treeline_change_codes( t1, t2 ).tolist() == [ TREELINE_NONFOREST, TREELINE_EXPANSION, TREELINE_NONFOREST,
+														TREELINE_FOREST, TREELINE_FOREST, TREELINE_FOREST,
+														TREELINE_NODATA, TREELINE_NODATA, TREELINE_NODATA ]
+
+def test_treeline_expansion( synthetic_run, tmp_path ):
+	year_pairs = [ ( YEARS[0], YEARS[1] ) ]
+	out = ap.treeline_expansion( synthetic_run[ 'maps_path' ], str( tmp_path ), year_pairs, ncores=2, window_rows=5 )
+	result = out[ year_pairs[0] ]
+	assert sorted( result[ 'replicates' ] ) == [ str( rep ) for rep in range( NREPS ) ]
+	veg_fn = os.path.join( synthetic_run[ 'maps_path' ], '{1}', 'Veg_{0}_{1}.tif' )
+	expanded = []
+	for rep in range( NREPS ):
+		t1, t2 = _read( veg_fn.format( rep, YEARS[0] ) ), _read( veg_fn.format( rep, YEARS[1] ) )
+		codes = _read( result[ 'replicates' ][ str( rep ) ] )
+		assert np.array_equal( codes, ap.treeline_change_codes( t1, t2 ) )
+		expanded.append( codes == TREELINE_EXPANSION )
+	valid = t1 != 255
+	frequency = _read( result[ 'frequency' ] )
+	assert np.allclose( frequency[ valid ], np.mean( expanded, axis=0 )[ valid ] )
+	assert ( frequency[ ~valid ] == -9999 ).all()
+	with pytest.raises( ValueError ):
+		ap.treeline_expansion( synthetic_run[ 'maps_path' ], str( tmp_path ), [ ( 1800, 1801 ) ] )
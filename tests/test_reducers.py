@@ -0,0 +1,93 @@
+import os
+import numpy as np
+import pytest
+import rasterio
+import alfresco_postprocessing as ap
+from alfresco_postprocessing.reducers import FRI_NODATA, COUNT_NODATA
+from conftest import NREPS, YEARS
+
+def _read( fn, band=1 ):
+	with rasterio.open( fn ) as rst:
+		return rst.read( band )
+
+def _firescar_stack( synthetic_run, rep, band ):
+	''' ( years, stack[ year, y, x ] ) of a replicate's FireScar band '''
+	years = list( range( YEARS[0], YEARS[1] + 1 ) )
+	fn = os.path.join( synthetic_run[ 'maps_path' ], '{1}', 'FireScar_{0}_{1}.tif' )
+	return years, np.array( [ _read( fn.format( rep, year ), band ) for year in years ] )
+
+def test_fire_return_accumulator( ):
+	acc = ap.FireReturnAccumulator( ( 1, 3 ) )
+	acc.update( 1900, np.array( [ [ True, True, False ] ] ) )
+	acc.update( 1904, np.array( [ [ True, False, False ] ] ) )
+	acc.update( 1910, np.array( [ [ True, False, False ] ] ), valid=np.array( [ [ True, True, False ] ] ) )
+	assert acc.counts().tolist() == [ [ 3, 1, COUNT_NODATA ] ]
+	assert acc.mean_fri().tolist() == [ [ 5.0, FRI_NODATA, FRI_NODATA ] ]
+	assert acc.time_since_fire().tolist() == [ [ 0, 10, COUNT_NODATA ] ]
+	with pytest.raises( ValueError ):
+		acc.update( 1905, np.zeros( ( 1, 3 ), dtype=bool ) )
+
+def test_fire_return_interval( synthetic_run, tmp_path ):
+	fns = ap.fire_return_interval( synthetic_run[ 'maps_path' ], str( tmp_path ), ncores=2 )
+	label = 'allreps_%d_%d' % YEARS
+	assert fns[ 'mean_fri' ].endswith( 'MeanFRI_%s.tif' % label )
+	burn_count, interval_sum, nintervals = 0, 0, 0
+	for rep in range( NREPS ):
+		years, stack = _firescar_stack( synthetic_run, rep, band=2 )
+		burned = stack > 0
+		count = burned.sum( axis=0 )
+		aoi = ( stack != -2147483647 ).all( axis=0 )
+		expected = np.where( aoi, count, COUNT_NODATA )
+		assert np.array_equal( _read( str( tmp_path / ( 'BurnCount_%d_%d_%d.tif' % ( rep, YEARS[0], YEARS[1] ) ) ) ), expected )
+		# intervals between successive burns: last burn minus first burn over ( count - 1 )
+		idx = np.arange( len( years ) )[ :, None, None ]
+		first = np.where( burned, idx, len( years ) ).min( axis=0 )
+		last = np.where( burned, idx, -1 ).max( axis=0 )
+		burn_count = burn_count + count
+		interval_sum = interval_sum + np.where( count > 1, last - first, 0 )
+		nintervals = nintervals + np.maximum( count - 1, 0 )
+	assert np.allclose( _read( fns[ 'burn_count' ] )[ aoi ], burn_count[ aoi ] / float( NREPS ) )
+	mean_fri = _read( fns[ 'mean_fri' ] )
+	ok = aoi & ( nintervals > 0 )
+	assert np.allclose( mean_fri[ ok ], interval_sum[ ok ] / nintervals[ ok ] )
+	assert ( mean_fri[ ~ok ] == FRI_NODATA ).all()
+
+def test_burn_year_composites( synthetic_run, tmp_path ):
+	out = ap.burn_year_composites( synthetic_run[ 'maps_path' ], str( tmp_path ), ncores=2 )
+	assert sorted( out ) == [ str( rep ) for rep in range( NREPS ) ]
+	years, stack = _firescar_stack( synthetic_run, 1, band=1 )
+	# band 1 carries the year of last burn forward, so the composite is the last year's band 1
+	expected = np.where( stack[ -1 ] > 0, stack[ -1 ], 0 )
+	burn_year = _read( out[ '1' ][ 'burn_year' ] )
+	assert np.array_equal( burn_year, expected )
+	assert np.array_equal( _read( out[ '1' ][ 'burn_decade' ] ), ( burn_year // 10 ) * 10 )
+	# burns before begin_year are left out
+	later = ap.burn_year_composites( synthetic_run[ 'maps_path' ], str( tmp_path / 'later' ), begin_year=YEARS[1], replicates=[ 1 ] )
+	assert list( later ) == [ '1' ]
+	assert _read( later[ '1' ][ 'burn_year' ] ).max() == ( YEARS[1] if ( stack[ -1 ] == YEARS[1] ).any() else 0 )
+	assert set( np.unique( _read( later[ '1' ][ 'burn_year' ] ) ) ) <= { 0, YEARS[1] }
+
+def test_tundra_basal_area_change( synthetic_run, tmp_path ):
+	# the input veg map: replicate 0's first year with a strip outside of the map
+	veg_fn = os.path.join( synthetic_run[ 'maps_path' ], '{1}', 'Veg_{0}_{1}.tif' )
+	with rasterio.open( veg_fn.format( 0, YEARS[0] ) ) as rst:
+		vegmap = rst.read( 1 )
+		profile = rst.profile
+	vegmap[ :, :4 ] = 255
+	vegmap_fn = str( tmp_path / 'vegmap.tif' )
+	with rasterio.open( vegmap_fn, 'w', **dict( profile, nodata=None ) ) as out:
+		out.write( vegmap, 1 )
+	out = ap.tundra_basal_area_change( synthetic_run[ 'maps_path' ], str( tmp_path / 'basal' ), vegmap_fn, ncores=2, tile_size=24 )
+	assert sorted( out ) == list( range( YEARS[0], YEARS[1] + 1 ) )
+	year = YEARS[1]
+	assert os.path.basename( out[ year ] ) == 'alfresco_basalchange_acrossreps_%d.tif' % year
+	basal_fn = os.path.join( synthetic_run[ 'maps_path' ], '{1}', 'BasalArea_{0}_{1}.tif' )
+	tundra_map = np.isin( vegmap, ap.TUNDRA_VALUES )
+	total = np.zeros( vegmap.shape )
+	for rep in range( NREPS ):
+		basal, veg = _read( basal_fn.format( rep, year ) ), _read( veg_fn.format( rep, year ) )
+		keep = tundra_map & np.isin( veg, ap.TUNDRA_VALUES ) & ( basal > 0 )
+		total[ keep ] += basal[ keep ]
+	expected = ( total / NREPS ).astype( np.float32 )
+	expected[ vegmap == 255 ] = FRI_NODATA
+	assert np.allclose( _read( out[ year ] ), expected )
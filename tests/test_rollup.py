@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import rasterio
+import alfresco_postprocessing as ap
+from alfresco_postprocessing.rollup import _merge_fires
+
+HIERARCHY = { '1':'All', '2':'All' }
+
+def _key( rec ):
+	return ( rec[ 'replicate' ], rec[ 'fire_year' ] )
+
+def test_domain_ancestors( ):
+	ancestors = ap.domain_ancestors( { 'FMZ 1':'Interior', 'FMZ 2':'Interior', 'Interior':'Statewide' } )
+	assert ancestors[ 'FMZ 1' ] == [ 'Interior', 'Statewide' ]
+	assert ancestors[ 'Statewide' ] == [ ]
+	with pytest.raises( ValueError ):
+		ap.domain_ancestors( { 'a':'b', 'b':'a' } )
+
+def test_merge_fires( ):
+	# fire 7 burned 3 pixels in one child and 5 in another; fire 8 is in one piece
+	merged = _merge_fires( replicate=np.array( [ 0, 0, 0 ] ), year=np.array( [ 1901, 1901, 1901 ] ),
+						domain=np.array( [ 2, 2, 2 ] ), fire_id=np.array( [ 7, 8, 7 ] ),
+						pixels=np.array( [ 3, 4, 5 ] ), veg=np.array( [ 1, 2, 3 ], dtype=np.uint8 ),
+						severity=np.array( [ 1.0, 2.0, np.nan ] ) )
+	assert merged[ 'fire_id' ].tolist() == [ 7, 8 ]
+	assert merged[ 'pixels' ].tolist() == [ 8, 4 ]
+	# dominant veg of the largest piece, severity weighted by the pixels that had one
+	assert merged[ 'veg' ].tolist() == [ 3, 2 ]
+	assert merged[ 'severity' ].tolist() == [ 1.0, 2.0 ]
+	empty = _merge_fires( *[ np.array( [], dtype=np.int32 ) ] * 5 )
+	assert len( empty[ 'pixels' ] ) == 0
+
+def test_rollup_matches_single_domain_run( synthetic_run, tmp_path ):
+	''' rolling both sub-domains up to one parent matches a run over their union '''
+	with rasterio.open( synthetic_run[ 'subdomains_fn' ] ) as rst:
+		domains = rst.read( 1 )
+		profile = rst.profile
+	union_fn = str( tmp_path / 'union.tif' )
+	with rasterio.open( union_fn, 'w', **profile ) as out:
+		out.write( ( domains > 0 ).astype( domains.dtype ), 1 )
+	fn = str( tmp_path / 'fires.npz' )
+	db = ap.run_postprocessing( synthetic_run[ 'maps_path' ], str( tmp_path / 'ALF.json' ), 1, ap.veg_name_dict,
+								synthetic_run[ 'subdomains_fn' ], fire_table_fn=fn )
+	union = ap.run_postprocessing( synthetic_run[ 'maps_path' ], str( tmp_path / 'UNION.json' ), 1, ap.veg_name_dict, union_fn )
+	rolled = ap.rollup_db( db, HIERARCHY, str( tmp_path / 'ROLLED.json' ), fire_table=ap.read_fire_table( fn ) )
+	records = sorted( rolled.all( ), key=_key )
+	expected = sorted( union.all( ), key=_key )
+	assert len( records ) == len( expected )
+	for rec, exp in zip( records, expected ):
+		assert set( rec[ 'total_area_burned' ] ) == { '1', '2', 'All' }
+		for metric in [ 'number_of_fires', 'total_area_burned', 'avg_fire_size', 'veg_counts', 'severity_counts' ]:
+			assert rec[ metric ][ 'All' ] == exp[ metric ][ '1' ], metric
+		assert sorted( rec[ 'all_fire_sizes' ][ 'All' ] ) == sorted( exp[ 'all_fire_sizes' ][ '1' ] )
+	for d in [ db, union, rolled ]:
+		d.close( )
+
+def test_rollup_records_without_fire_table( run_db ):
+	records = ap.rollup_records( run_db, HIERARCHY, include_children=False )
+	rec, src = records[0], run_db[0]
+	assert set( rec[ 'total_area_burned' ] ) == { 'All' }
+	assert rec[ 'total_area_burned' ][ 'All' ] == sum( src[ 'total_area_burned' ].values() )
+	# fire counts can't be summed over children, so they are left out
+	assert 'number_of_fires' not in rec
@@ -0,0 +1,36 @@
+import json
+import numpy as np
+import rasterio
+import alfresco_postprocessing as ap
+from conftest import NREPS, YEARS, NDOMAINS
+
+def test_run_postprocessing_records( run_db ):
+	assert len( run_db ) == NREPS * ( YEARS[1] - YEARS[0] + 1 )
+	rec = run_db[0]
+	for metric in [ 'avg_fire_size', 'number_of_fires', 'total_area_burned', 'veg_counts', 'severity_counts' ]:
+		assert len( rec[ metric ] ) == NDOMAINS
+	# records round trip through json ( TinyDB's storage ) unchanged
+	assert json.loads( json.dumps( run_db ) ) == run_db
+
+def test_veg_counts_match_raster( synthetic_run, run_db ):
+	fl = ap.FileLister( synthetic_run[ 'maps_path' ] )
+	timestep = [ t for t in fl.timesteps if t.replicate == '0' and t.Veg.year == str( YEARS[0] ) ][0]
+	with rasterio.open( timestep.Veg.fn ) as rst:
+		veg = rst.read( 1 )
+	with rasterio.open( synthetic_run[ 'subdomains_fn' ] ) as rst:
+		domains = rst.read( 1 )
+	rec = [ r for r in run_db if r[ 'replicate' ] == '0' and r[ 'fire_year' ] == str( YEARS[0] ) ][0]
+	for code, name in ap.veg_name_dict.items():
+		assert rec[ 'veg_counts' ][ '1' ].get( name, 0 ) == int( ( veg[ domains == 1 ] == code ).sum() )
+
+def test_severity_counts_are_plain_ints( run_db ):
+	for rec in run_db:
+		for counts in rec[ 'severity_counts' ].values():
+			assert all( isinstance( k, str ) and isinstance( v, int ) for k, v in counts.items() )
+			assert set( counts ) <= { '1', '2', '3', '4' }
+
+def test_run_postprocessing_historical( synthetic_run, tmp_path ):
+	db = ap.run_postprocessing_historical( synthetic_run[ 'firehistory_path' ], str( tmp_path / 'OBS.json' ), 1,
+										ap.veg_name_dict, synthetic_run[ 'subdomains_fn' ] )
+	assert len( db ) == 3
+	db.close()
@@ -0,0 +1,99 @@
+import os
+import subprocess
+import pytest
+import alfresco_postprocessing as ap
+
+# logs its arguments and prints a job id, like sbatch --parsable on a cluster named test
+FAKE_SBATCH = '''#!/bin/sh
+echo "$@" >> "$(dirname "$0")/sbatch.log"
+N=$( wc -l < "$(dirname "$0")/sbatch.log" )
+echo "$(( 100 + N ));test"
+'''
+
+@pytest.fixture
+def fake_sbatch( tmp_path ):
+	fn = tmp_path / 'bin' / 'sbatch'
+	fn.parent.mkdir()
+	fn.write_text( FAKE_SBATCH )
+	fn.chmod( 0o755 )
+	return str( fn )
+
+def _sbatch_log( fake_sbatch ):
+	with open( os.path.join( os.path.dirname( fake_sbatch ), 'sbatch.log' ) ) as f:
+		return f.read().splitlines()
+
+def _campaign( path, ntasks=3, reduce_command=True, **kwargs ):
+	''' tasks that each write their index, and a reduce that lists the outputs '''
+	out_path = os.path.join( str( path ), 'out' )
+	os.makedirs( out_path, exist_ok=True )
+	tasks = [ 'echo %d > %s' % ( i, os.path.join( out_path, 'task_%d.txt' % i ) ) for i in range( ntasks ) ]
+	reduce_command = 'ls %s > %s' % ( out_path, os.path.join( str( path ), 'reduced.txt' ) ) if reduce_command else None
+	return ap.write_campaign( str( path / 'campaign' ), tasks, reduce_command=reduce_command, **kwargs ), out_path
+
+def test_slurm_header( ):
+	header = ap.slurm_header( 'alfpp', cpus_per_task=4, mem_mb=2000, time='01:00:00', array='0-9%2', extra=[ '--exclusive' ] )
+	lines = header.splitlines()
+	assert lines[0] == '#!/bin/sh'
+	assert lines[ 1: ] == [ '#SBATCH %s' % option for option in [ '--job-name=alfpp', '--nodes=1', '--ntasks=1', '--cpus-per-task=4',
+							'--mem=2000M', '--time=01:00:00', '--array=0-9%2', '--exclusive' ] ]
+	assert '--mem' not in ap.slurm_header( 'alfpp' )
+
+def test_task_resources( synthetic_run ):
+	fn = os.path.join( synthetic_run[ 'maps_path' ], '1901', 'Veg_0_1901.tif' )
+	res = ap.task_resources( fn, arrays_per_worker=4, mem_per_node_mb=2000, cpus_per_node=8, overhead_mb=500 )
+	worker_mb = 500 + 4 * 64 * 64 * 8 / 2.0**20
+	assert res[ 'worker_mb' ] == worker_mb
+	# 2000MB holds the parent and two workers
+	assert res[ 'cpus_per_task' ] == 2 and res[ 'mem_mb' ] == int( 3 * worker_mb )
+	assert ap.task_resources( fn, mem_per_node_mb=100000, cpus_per_node=8 )[ 'cpus_per_task' ] == 8
+	assert ap.task_resources( fn, mem_per_node_mb=100, cpus_per_node=8 )[ 'cpus_per_task' ] == 1
+
+def test_write_campaign( tmp_path ):
+	fns, out_path = _campaign( tmp_path, cpus_per_task=2, mem_mb=1000, max_concurrent=2, env={ 'OMP_NUM_THREADS':1 } )
+	assert sorted( fns ) == sorted( ap.CAMPAIGN_FILES )
+	with open( fns[ 'tasks' ] ) as f:
+		assert len( f.read().splitlines() ) == 3
+	with open( fns[ 'array' ] ) as f:
+		array = f.read()
+	assert '#SBATCH --array=0-2%2' in array and '#SBATCH --cpus-per-task=2' in array and '#SBATCH --mem=1000M' in array
+	assert 'export OMP_NUM_THREADS=1' in array
+	with open( fns[ 'reduce' ] ) as f:
+		assert '#SBATCH --job-name=alfpp_reduce' in f.read()
+	# rewriting without a reduce job removes the old one
+	fns, _ = _campaign( tmp_path, reduce_command=False )
+	assert 'reduce' not in fns and not os.path.exists( os.path.join( str( tmp_path / 'campaign' ), 'reduce.slurm' ) )
+	with pytest.raises( ValueError ):
+		ap.write_campaign( str( tmp_path / 'empty' ), [] )
+	with pytest.raises( ValueError ):
+		ap.write_campaign( str( tmp_path / 'multiline' ), [ 'echo one\necho two' ] )
+
+def test_run_campaign_locally( tmp_path ):
+	fns, out_path = _campaign( tmp_path )
+	assert ap.run_campaign_locally( str( tmp_path / 'campaign' ) ) == 3
+	for i in range( 3 ):
+		with open( os.path.join( out_path, 'task_%d.txt' % i ) ) as f:
+			assert f.read().strip() == str( i )
+	with open( str( tmp_path / 'reduced.txt' ) ) as f:
+		assert f.read().split() == [ 'task_%d.txt' % i for i in range( 3 ) ]
+
+def test_run_campaign_locally_failing_task( tmp_path ):
+	ap.write_campaign( str( tmp_path / 'campaign' ), [ 'true', 'exit 3' ], reduce_command='touch %s' % ( tmp_path / 'reduced' ) )
+	with pytest.raises( subprocess.CalledProcessError ):
+		ap.run_campaign_locally( str( tmp_path / 'campaign' ) )
+	assert not os.path.exists( str( tmp_path / 'reduced' ) )
+
+def test_submit_campaign( tmp_path, fake_sbatch, capsys ):
+	fns, _ = _campaign( tmp_path )
+	ids = ap.submit_campaign( str( tmp_path / 'campaign' ), sbatch=fake_sbatch )
+	assert ids == { 'array':'101', 'reduce':'102' }
+	assert _sbatch_log( fake_sbatch ) == [ '--parsable %s' % fns[ 'array' ], '--parsable --dependency=afterok:101 %s' % fns[ 'reduce' ] ]
+	assert ap.submit_campaign( str( tmp_path / 'campaign' ), sbatch=fake_sbatch, dry_run=True ) == { 'array':None, 'reduce':None }
+	assert len( capsys.readouterr().out.splitlines() ) == 2
+	assert len( _sbatch_log( fake_sbatch ) ) == 2
+
+def test_submit_script( tmp_path, fake_sbatch ):
+	fns, _ = _campaign( tmp_path )
+	out = subprocess.run( [ fns[ 'submit' ] ], check=True, stdout=subprocess.PIPE, universal_newlines=True,
+						env=dict( os.environ, SBATCH=fake_sbatch ) )
+	assert out.stdout.split() == [ '101', '102' ]
+	assert _sbatch_log( fake_sbatch )[ 1 ] == '--parsable --dependency=afterok:101 %s' % fns[ 'reduce' ]
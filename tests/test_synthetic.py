@@ -0,0 +1,54 @@
+import os
+import numpy as np
+import rasterio
+import alfresco_postprocessing as ap
+from alfresco_postprocessing import synthetic
+from conftest import SHAPE, NREPS, YEARS
+
+def test_make_maps_layout( synthetic_run ):
+	fl = ap.FileLister( synthetic_run[ 'maps_path' ] )
+	assert len( fl.timesteps ) == NREPS * ( YEARS[1] - YEARS[0] + 1 )
+	for variable in [ 'FireScar', 'Veg', 'Age', 'BurnSeverity', 'BasalArea' ]:
+		fn = os.path.join( synthetic_run[ 'maps_path' ], str( YEARS[0] ), '%s_0_%d.tif' % ( variable, YEARS[0] ) )
+		with rasterio.open( fn ) as rst:
+			assert ( rst.height, rst.width ) == SHAPE
+			assert rst.count == ( 3 if variable == 'FireScar' else 1 )
+
+def test_veg_tags_and_colormap( synthetic_run ):
+	fn = os.path.join( synthetic_run[ 'maps_path' ], str( YEARS[0] ), 'Veg_0_%d.tif' % YEARS[0] )
+	with rasterio.open( fn ) as rst:
+		assert rst.tags()[ 'TIFFTAG_IMAGEDESCRIPTION' ].startswith( 'Value Index:' )
+		assert rst.colormap( 1 )[ 1 ] == synthetic.VEG_CMAP[ 1 ]
+		veg = rst.read( 1 )
+	assert set( np.unique( veg ).tolist() ) <= { 0, 1, 2, 3, 4, 5, 6, 7, 255 }
+
+def test_fire_ids_are_unique_patches( synthetic_run ):
+	fn = os.path.join( synthetic_run[ 'maps_path' ], str( YEARS[0] ), 'FireScar_0_%d.tif' % YEARS[0] )
+	with rasterio.open( fn ) as rst:
+		last_burn, fire_ids, ignitions = rst.read( 1 ), rst.read( 2 ), rst.read( 3 )
+	burned = ( fire_ids > 0 )
+	ids = np.unique( fire_ids[ burned ] )
+	assert np.array_equal( ids, np.arange( 1, len( ids ) + 1 ) )
+	assert ( last_burn[ burned ] == YEARS[0] ).all()
+	assert ( ignitions == 1 ).sum() == len( ids )
+
+def test_make_maps_is_reproducible( tmp_path ):
+	a = synthetic.make_maps( str( tmp_path / 'a' ), nreps=1, years=( 1901, 1901 ), shape=( 32, 32 ), year_folders=False )
+	b = synthetic.make_maps( str( tmp_path / 'b' ), nreps=1, years=( 1901, 1901 ), shape=( 32, 32 ), year_folders=False )
+	for fn in sorted( os.listdir( a ) ):
+		with rasterio.open( os.path.join( a, fn ) ) as ra, rasterio.open( os.path.join( b, fn ) ) as rb:
+			assert np.array_equal( ra.read(), rb.read() )
+
+def test_subdomains_shapefile_round_trip( synthetic_run, tmp_path ):
+	import pytest
+	pytest.importorskip( 'geopandas' )
+	fn = synthetic.make_subdomains_shapefile( str( tmp_path / 'Domains' / 'subdomains.shp' ), shape=SHAPE, ndomains=3 )
+	template = os.path.join( synthetic_run[ 'maps_path' ], str( YEARS[0] ), 'Veg_0_%d.tif' % YEARS[0] )
+	labels, edges = synthetic._domain_labels( SHAPE, 3 )
+	with rasterio.open( template ) as rst:
+		subs = ap.read_subdomains( subdomains_fn=fn, rasterio_raster=rst, id_field='OBJECTID', name_field='Name' )
+	assert subs.names_dict == { 1:'Domain1', 2:'Domain2', 3:'Domain3' }
+	assert len( subs.sub_domains ) == 3
+	# the polygons rasterize back to the strips of make_subdomains_raster
+	for i, arr in enumerate( subs.sub_domains ):
+		assert np.array_equal( np.asarray( arr ) == i + 1, labels == i + 1 )
@@ -0,0 +1,51 @@
+import os
+import numpy as np
+import pytest
+import rasterio
+import alfresco_postprocessing as ap
+from conftest import NREPS, YEARS
+
+def _read( path ):
+	with rasterio.open( path ) as rst:
+		return rst.read( 1 )
+
+@pytest.fixture( scope='module' )
+def transitions_db( synthetic_run, tmp_path_factory ):
+	out_json_fn = str( tmp_path_factory.mktemp( 'transitions' ) / 'ALF.json' )
+	db = ap.run_postprocessing( synthetic_run[ 'maps_path' ], out_json_fn, 1, ap.veg_name_dict,
+								synthetic_run[ 'subdomains_fn' ], veg_transitions=True )
+	records = db.all()
+	db.close()
+	return records
+
+def test_veg_transitions_match_rasters( synthetic_run, transitions_db ):
+	domains = _read( synthetic_run[ 'subdomains_fn' ] )
+	veg_fn = os.path.join( synthetic_run[ 'maps_path' ], '{0}', 'Veg_0_{0}.tif' )
+	prev, cur = _read( veg_fn.format( YEARS[0] ) ), _read( veg_fn.format( YEARS[0] + 1 ) )
+	rec = [ r for r in transitions_db if r[ 'replicate' ] == '0' and r[ 'fire_year' ] == str( YEARS[0] + 1 ) ][0]
+	cols = rec[ 'veg_transitions' ][ '1' ]
+	valid = ( domains == 1 ) & ( prev != 255 ) & ( cur != 255 )
+	for src, dst, count in zip( cols[ 'from' ], cols[ 'to' ], cols[ 'count' ] ):
+		assert count == int( ( valid & ( prev == src ) & ( cur == dst ) ).sum() )
+	assert sum( cols[ 'count' ] ) == int( valid.sum() )
+
+def test_veg_transitions_first_year_empty( transitions_db ):
+	for rec in transitions_db:
+		if rec[ 'fire_year' ] == str( YEARS[0] ):
+			assert all( cols[ 'count' ] == [] for cols in rec[ 'veg_transitions' ].values() )
+
+def test_veg_transition_matrix( transitions_db ):
+	arr, coords = ap.get_transition_array( transitions_db )
+	assert [ dim for dim, labels in coords ] == [ 'replicate', 'year', 'domain', 'from', 'to' ]
+	assert arr.shape[ :3 ] == ( NREPS, YEARS[1] - YEARS[0] + 1, 2 )
+	df = ap.veg_transition_matrix( transitions_db, '1' )
+	assert int( df.values.sum() ) == int( arr[ :, :, 0 ].sum() )
+	one = ap.veg_transition_matrix( transitions_db, '1', years=( YEARS[1], YEARS[1] ), replicates=[ 0 ] )
+	assert int( one.values.sum() ) == int( arr[ 0, -1, 0 ].sum() )
+	named = ap.veg_transition_matrix( transitions_db, '1', veg_name_dict=ap.veg_name_dict, normalize=True )
+	assert set( named.index ) <= set( ap.veg_name_dict.values() )
+	assert np.allclose( named.sum( axis=1 ).dropna(), 1 )
+
+def test_veg_transition_matrix_without_transitions( run_db ):
+	with pytest.raises( ValueError ):
+		ap.get_transition_array( run_db )
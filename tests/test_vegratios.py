@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+import alfresco_postprocessing as ap
+from conftest import YEARS
+
+def _record( run_db, replicate, year ):
+	return [ r for r in run_db if r[ 'replicate' ] == replicate and r[ 'fire_year' ] == str( year ) ][0]
+
+def _group( counts, names ):
+	return sum( counts.get( name, 0 ) for name in names )
+
+def test_veg_group_counts_and_ratio( run_db ):
+	counts, coords = ap.veg_group_counts( run_db )
+	assert [ dim for dim, labels in coords ] == [ 'replicate', 'year', 'domain', 'group' ]
+	assert coords[ 3 ][1] == list( ap.VEG_GROUPS )
+	veg = _record( run_db, '1', YEARS[1] )[ 'veg_counts' ][ '2' ]
+	for g, names in enumerate( ap.VEG_GROUPS.values() ):
+		assert counts[ 1, -1, 1, g ] == _group( veg, names )
+	ratio, _ = ap.veg_group_ratio( run_db )
+	conifer, deciduous = _group( veg, ap.VEG_GROUPS[ 'conifer' ] ), _group( veg, ap.VEG_GROUPS[ 'deciduous' ] )
+	assert np.isclose( ratio[ 1, -1, 1 ], conifer / float( deciduous ) )
+	shares, _ = ap.veg_group_shares( run_db )
+	assert np.isclose( shares[ 1, -1, 1, 0 ], conifer / float( sum( veg.values() ) ) )
+
+def test_veg_group_custom_groups( run_db ):
+	# groups can be given by veg_name_dict code too
+	groups = { 'spruce':[ 1, 'White Spruce' ], 'none':[ 'Not A Class' ] }
+	counts, coords = ap.veg_group_counts( run_db, groups=groups )
+	veg = _record( run_db, '0', YEARS[0] )[ 'veg_counts' ][ '1' ]
+	assert counts[ 0, 0, 0, 0 ] == _group( veg, [ 'Black Spruce', 'White Spruce' ] )
+	assert counts[ 0, 0, 0, 1 ] == 0
+
+def test_veg_group_table( run_db, tmp_path ):
+	df = ap.veg_group_table( run_db )
+	assert len( df ) == len( run_db ) * 2
+	assert { 'conifer', 'conifer_share', 'conifer:deciduous' } <= set( df.columns )
+	row = df[ ( df[ 'replicate' ] == '0' ) & ( df[ 'year' ] == YEARS[0] ) & ( df[ 'domain' ] == '1' ) ].iloc[0]
+	veg = _record( run_db, '0', YEARS[0] )[ 'veg_counts' ][ '1' ]
+	assert row[ 'tundra' ] == _group( veg, ap.VEG_GROUPS[ 'tundra' ] )
+	# the same from a TinyDB file
+	fn = str( tmp_path / 'ALF.json' )
+	db = ap._open_tinydb( fn )
+	db.insert_multiple( run_db )
+	db.close()
+	assert ap.veg_group_table( fn ).equals( df )
+
+def test_veg_group_counts_from_store( run_db, tmp_path ):
+	pytest.importorskip( 'netCDF4' )
+	fn = ap.to_cube_store( run_db, str( tmp_path / 'ALF.nc' ) )
+	counts, coords = ap.veg_group_counts( fn )
+	expected, _ = ap.veg_group_counts( run_db )
+	assert np.array_equal( counts, expected )
@@ -0,0 +1,74 @@
+import os
+import pytest
+import alfresco_postprocessing as ap
+from conftest import NREPS, YEARS
+
+NTIMESTEPS = NREPS * ( YEARS[1] - YEARS[0] + 1 )
+
+def _key( rec ):
+	return ( rec[ 'replicate' ], rec[ 'fire_year' ] )
+
+def _queue( synthetic_run, path, chunk_size=2 ):
+	return ap.create_queue( str( path / 'queue' ), synthetic_run[ 'maps_path' ], ap.veg_name_dict,
+							subdomains_fn=synthetic_run[ 'subdomains_fn' ], chunk_size=chunk_size )
+
+def _requeue_first_call( monkeypatch, name, queue_path, raise_error=False ):
+	''' patch ap.<name> so its first call requeues every claimed task, as if the worker had gone stale '''
+	func = getattr( ap, name )
+	calls = []
+	def patched( *args, **kwargs ):
+		calls.append( 1 )
+		if len( calls ) == 1:
+			assert len( ap.requeue_stale( queue_path, max_age=-1 ) ) == 1
+			if raise_error:
+				raise RuntimeError( 'worker died' )
+		return func( *args, **kwargs )
+	monkeypatch.setattr( ap, name, patched )
+
+def test_work_and_reduce_queue( synthetic_run, run_db, tmp_path ):
+	queue_path = _queue( synthetic_run, tmp_path )
+	total = ( NTIMESTEPS + 1 ) // 2
+	assert ap.queue_status( queue_path ) == { 'pending':total, 'claimed':0, 'done':0, 'failed':0, 'total':total }
+	with pytest.raises( ValueError ):
+		ap.reduce_queue( queue_path, str( tmp_path / 'early.json' ) )
+	assert ap.work_queue( queue_path, max_tasks=1 ) == 1
+	assert ap.work_queue( queue_path ) == total - 1
+	assert ap.queue_status( queue_path )[ 'done' ] == total
+	db = ap.reduce_queue( queue_path, str( tmp_path / 'ALF.json' ) )
+	records = sorted( db.all(), key=_key )
+	db.close()
+	assert records == sorted( run_db, key=_key )
+	with pytest.raises( ValueError ):
+		_queue( synthetic_run, tmp_path )
+
+@pytest.mark.parametrize( 'prefetch', [ 0, 2 ] )
+def test_requeue_while_running( synthetic_run, tmp_path, monkeypatch, prefetch ):
+	''' a task requeued as stale while its worker is still running is finished once, not failed '''
+	queue_path = _queue( synthetic_run, tmp_path, chunk_size=NTIMESTEPS )
+	_requeue_first_call( monkeypatch, '_compute_timestep' if prefetch else '_run_timestep', queue_path )
+	assert ap.work_queue( queue_path, prefetch=prefetch, max_tasks=1 ) == 1
+	assert ap.queue_status( queue_path ) == { 'pending':0, 'claimed':0, 'done':1, 'failed':0, 'total':1 }
+	assert os.listdir( os.path.join( queue_path, 'failed' ) ) == []
+	assert len( ap.reduce_queue( queue_path, str( tmp_path / 'ALF.json' ) ) ) == NTIMESTEPS
+
+def test_failed_after_requeue( synthetic_run, tmp_path, monkeypatch ):
+	''' a requeued task whose worker then raises stays pending instead of killing the worker '''
+	queue_path = _queue( synthetic_run, tmp_path, chunk_size=NTIMESTEPS )
+	_requeue_first_call( monkeypatch, '_run_timestep', queue_path, raise_error=True )
+	assert ap.work_queue( queue_path, max_tasks=1 ) == 1
+	assert ap.queue_status( queue_path ) == { 'pending':1, 'claimed':0, 'done':0, 'failed':0, 'total':1 }
+	assert os.listdir( os.path.join( queue_path, 'failed' ) ) == []
+
+def test_failed_and_requeue_stale( synthetic_run, tmp_path, monkeypatch ):
+	queue_path = _queue( synthetic_run, tmp_path, chunk_size=NTIMESTEPS )
+	def broken( *args, **kwargs ):
+		raise RuntimeError( 'bad timestep' )
+	monkeypatch.setattr( ap, '_run_timestep', broken )
+	ap.work_queue( queue_path )
+	assert ap.queue_status( queue_path )[ 'failed' ] == 1
+	with open( os.path.join( queue_path, 'failed', 'task_000000.txt' ) ) as f:
+		assert 'bad timestep' in f.read()
+	monkeypatch.undo()
+	assert ap.requeue_stale( queue_path, failed=True ) == [ 'task_000000' ]
+	ap.work_queue( queue_path )
+	assert ap.queue_status( queue_path )[ 'done' ] == 1